@@ -0,0 +1 @@
+"""Offline benchmarks for LuceneRAG ingestion, retrieval and the query API."""
@@ -0,0 +1,46 @@
+"""Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+from typing import Dict
+
+
+def flatten(value, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into {"runs.0.search.1.latency.p95_ms": 3.2, ...}."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return {prefix: value}
+        return {}
+    flat = {}
+    for key, child in items:
+        flat.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.0, help="Only show changes above this percentage")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)["runs"], "runs")
+    with open(args.candidate) as f:
+        candidate = flatten(json.load(f)["runs"], "runs")
+
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        change = (new - old) / old * 100 if old else 0.0
+        if abs(change) >= args.threshold:
+            print(f"{key:60} {old:>12g} {new:>12g} {change:>+8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
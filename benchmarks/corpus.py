@@ -0,0 +1,98 @@
+import itertools
+import random
+from typing import List, Tuple
+
+from models import DocumentInput
+
+SYLLABLES = (
+    "ka", "lo", "mi", "ren", "ta", "vo", "sil", "den", "ar", "po", "qua", "bri",
+    "no", "tes", "lu", "gor", "fen", "ix", "ma", "rul", "zo", "hal", "pe", "tri"
+)
+
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    """Build `size` distinct pseudo-words from random syllables."""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Sort before shuffling so the order only depends on the seed, not on set ordering
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+class Corpus:
+    """Seeded synthetic markdown corpus.
+
+    Word frequencies follow a Zipf-like distribution over the vocabulary, so
+    a few terms are very common and most are rare, as in real documents. The
+    same seed and parameters always produce the same documents and questions.
+    """
+
+    def __init__(self, num_docs: int = 1000, folder_depth: int = 3, num_folders: int = 20,
+                 vocabulary_size: int = 5000, sections: Tuple[int, int] = (2, 6), seed: int = 42):
+        self.num_docs = num_docs
+        self.folder_depth = folder_depth
+        self.num_folders = num_folders
+        self.sections = sections
+        self.seed = seed
+        rng = random.Random(seed)
+        self.vocabulary = make_vocabulary(vocabulary_size, rng)
+        self._cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, vocabulary_size + 1)))
+        self.folders = self._make_folders(rng)
+
+    def _make_folders(self, rng: random.Random) -> List[str]:
+        folders = [""]
+        for _ in range(self.num_folders):
+            parent = rng.choice(folders)
+            if parent.count("/") + 1 >= self.folder_depth:
+                parent = ""
+            name = rng.choice(self.vocabulary[:200])
+            folders.append(f"{parent}/{name}" if parent else name)
+        return sorted(set(folders))
+
+    def _words(self, rng: random.Random, count: int) -> List[str]:
+        return rng.choices(self.vocabulary, cum_weights=self._cum_weights, k=count)
+
+    def _sentence(self, rng: random.Random) -> str:
+        words = self._words(rng, rng.randint(6, 18))
+        return " ".join(words).capitalize() + "."
+
+    def _document(self, rng: random.Random, title: str) -> str:
+        lines = [f"# {title}", ""]
+        for _ in range(rng.randint(*self.sections)):
+            lines += [f"## {' '.join(self._words(rng, 3)).title()}", ""]
+            for _ in range(rng.randint(1, 4)):
+                lines += [" ".join(self._sentence(rng) for _ in range(rng.randint(2, 6))), ""]
+            if rng.random() < 0.3:
+                lines += [f"- {self._sentence(rng)}" for _ in range(rng.randint(2, 5))] + [""]
+            if rng.random() < 0.1:
+                lines += ["```", " ".join(self._words(rng, 8)), "```", ""]
+        return "\n".join(lines)
+
+    def documents(self) -> List[DocumentInput]:
+        """Generate the documents, spread over the corpus folders."""
+        rng = random.Random(self.seed + 1)
+        documents = []
+        for i in range(self.num_docs):
+            title = " ".join(self._words(rng, 4)).title()
+            documents.append(DocumentInput(
+                id=f"doc-{i:06d}.md",
+                content=self._document(rng, title),
+                folder_path=rng.choice(self.folders)
+            ))
+        return documents
+
+    def questions(self, count: int, seed_offset: int = 0) -> List[str]:
+        """Generate questions mixing common and rare terms, with the occasional typo."""
+        rng = random.Random(self.seed + 2 + seed_offset)
+        questions = []
+        for _ in range(count):
+            terms = self._words(rng, rng.randint(2, 5))
+            if rng.random() < 0.2:
+                # Drop a letter from one term to exercise fuzzy expansion
+                i = rng.randrange(len(terms))
+                cut = rng.randrange(len(terms[i]))
+                terms[i] = terms[i][:cut] + terms[i][cut + 1:]
+            questions.append(f"What is {' '.join(terms)}?")
+        return questions
@@ -0,0 +1,133 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence
+
+import requests
+
+from concurrency import attach_jvm
+from models import DocumentInput
+
+
+def summarize(samples: Sequence[float]) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def timed(fn: Callable, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def run_concurrently(fn: Callable, items: Sequence, concurrency: int, attach_to_jvm: bool = False) -> dict:
+    """Call fn(item) for every item from `concurrency` threads; report latencies and throughput."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def call(item):
+        started = time.perf_counter()
+        try:
+            fn(item)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=attach_jvm if attach_to_jvm else None) as pool:
+        list(pool.map(call, items))
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+        "latency": summarize(latencies)
+    }
+
+
+def bench_index_document(rag, documents: List[DocumentInput]) -> dict:
+    """Single-document ingestion: one commit and refresh per document."""
+    latencies = [timed(rag.index_document, d.content, d.id, d.folder_path) for d in documents]
+    total = sum(latencies)
+    return {
+        "documents": len(documents),
+        "seconds": round(total, 3),
+        "docs_per_sec": round(len(documents) / total, 2) if total else 0.0,
+        "latency": summarize(latencies)
+    }
+
+
+def bench_bulk_ingest(rag, documents: List[DocumentInput]) -> dict:
+    """Bulk ingestion through index_documents with group commits."""
+    result = rag.index_documents(documents)
+    return {
+        "documents": len(documents),
+        "indexed": result.indexed,
+        "failed": result.failed,
+        "commits": result.commits,
+        "seconds": result.elapsed_seconds,
+        "docs_per_sec": result.docs_per_sec,
+        "content_bytes": sum(len(d.content.encode("utf-8")) for d in documents)
+    }
+
+
+def bench_search(rag, questions: List[str], concurrency: int) -> dict:
+    """Retrieval latency with a cold retrieval cache, from `concurrency` threads."""
+    rag.retrieval_cache.clear()
+    return run_concurrently(rag.search, questions, concurrency, attach_to_jvm=True)
+
+
+def bench_get_all_documents(rag, repeats: int = 3) -> dict:
+    latencies = []
+    count = 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        count = len(rag.get_all_documents())
+        latencies.append(time.perf_counter() - started)
+    return {"documents": count, "latency": summarize(latencies)}
+
+
+def bench_reindex(rag) -> dict:
+    seconds = timed(rag.reindex)
+    return {"seconds": round(seconds, 3), "num_docs": rag.get_stats().num_docs}
+
+
+def bench_query_api(base_url: str, questions: List[str], concurrency: int, timeout: float = 300) -> dict:
+    """End-to-end POST /query load against a running API."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    statuses = {}
+    lock = threading.Lock()
+
+    def query(question: str):
+        response = session.post(f"{base_url}/query", json={"question": question}, timeout=timeout)
+        with lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        response.raise_for_status()
+
+    result = run_concurrently(query, questions, concurrency)
+    result["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
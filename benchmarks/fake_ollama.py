@@ -0,0 +1,140 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = (
+    "The", "documents", "describe", "how", "the", "index", "is", "organized", "and", "which",
+    "settings", "apply", "to", "each", "folder", "so", "results", "stay", "consistent", "over", "time"
+)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Answers Ollama's /api/generate and /api/tags with synthetic output."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            rng = random.Random(server.seed + server.requests)
+        if server.status != 200:
+            self._send_json({"error": f"fake error {server.status}"}, status=server.status)
+            return
+        tokens = [rng.choice(FILLER) + " " for _ in range(server.num_tokens)]
+        model = request.get("model", server.model)
+        prompt_tokens = len(request.get("prompt", "")) // 4
+        # Time to first token, then a steady generation rate
+        time.sleep(server.latency)
+        interval = 1.0 / server.tokens_per_sec if server.tokens_per_sec > 0 else 0.0
+        final = {
+            "model": model, "done": True, "prompt_eval_count": prompt_tokens,
+            "eval_count": len(tokens), "total_duration": 0
+        }
+
+        if request.get("stream", True) is False:
+            time.sleep(interval * len(tokens))
+            self._send_json({**final, "response": "".join(tokens)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._write_chunk({"model": model, "response": token, "done": False})
+                time.sleep(interval)
+            self._write_chunk({**final, "response": ""})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation
+            self.close_connection = True
+
+    def _write_chunk(self, payload: dict):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """A local stand-in for the Ollama HTTP API with configurable speed.
+
+    `latency` is the delay in seconds before the first token, and
+    `tokens_per_sec` the rate at which the `num_tokens` answer tokens are
+    streamed afterwards. Answers are seeded filler text, so runs stay
+    comparable and no model or network access is needed. Setting `status`
+    to an error code makes /api/generate fail with an Ollama-style error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                 tokens_per_sec: float = 50.0, num_tokens: int = 64, model: str = "fake", seed: int = 42):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.num_tokens = num_tokens
+        self.model = model
+        self.seed = seed
+        self.status = 200
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        """Serve from a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--num-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    server = FakeOllama(args.host, args.port, args.latency, args.tokens_per_sec, args.num_tokens)
+    print(f"Fake Ollama listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,167 @@
+"""Run the benchmark suite and write the results as JSON.
+
+    python -m benchmarks.run --sizes 1000,10000 --concurrency 1,4,16 --output results.json
+
+Everything runs offline: the corpus is generated from a seed and the LLM is
+replaced by a local fake Ollama server.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import lucene
+
+from benchmarks import drivers
+from benchmarks.corpus import Corpus
+from benchmarks.fake_ollama import FakeOllama
+
+STAGES = ("ingest", "search", "list", "reindex", "api")
+
+
+def parse_ints(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def serve_api(rag, port: int):
+    """Serve the API routes for `rag` on localhost from a background thread."""
+    import uvicorn
+    from fastapi import FastAPI
+
+    import routes
+
+    routes.rag = rag
+    app = FastAPI(title="Document RAG API (benchmark)")
+    app.include_router(routes.router)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def run_size(args, size: int, ollama: FakeOllama) -> dict:
+    from embeddings import create_embedder
+    from lucene_rag import LuceneRAG
+
+    corpus = Corpus(num_docs=size, folder_depth=args.folder_depth, num_folders=args.folders,
+                    vocabulary_size=args.vocabulary, seed=args.seed)
+    documents = corpus.documents()
+    index_dir = tempfile.mkdtemp(prefix=f"rag-bench-{size}-")
+    result = {"documents": size, "folders": len(corpus.folders)}
+    rag = LuceneRAG(index_dir=index_dir, max_generations=args.max_generations,
+                    embedder=create_embedder(args.embedder), num_shards=args.shards,
+                    directory=args.directory)
+    rag.llm.base_url = ollama.base_url
+    try:
+        if "ingest" in args.stages:
+            single = documents[:min(args.single_docs, size)]
+            print(f"[{size}] index_document x{len(single)}")
+            result["index_document"] = drivers.bench_index_document(rag, single)
+            print(f"[{size}] bulk ingest x{size - len(single)}")
+            result["bulk_ingest"] = drivers.bench_bulk_ingest(rag, documents[len(single):])
+        else:
+            rag.index_documents(documents)
+
+        if "search" in args.stages:
+            result["search"] = []
+            for concurrency in args.concurrency:
+                print(f"[{size}] search, concurrency {concurrency}")
+                questions = corpus.questions(args.queries, seed_offset=concurrency)
+                result["search"].append(drivers.bench_search(rag, questions, concurrency))
+
+        if "list" in args.stages:
+            print(f"[{size}] get_all_documents")
+            result["get_all_documents"] = drivers.bench_get_all_documents(rag)
+
+        if "api" in args.stages:
+            server = serve_api(rag, args.api_port)
+            try:
+                result["query_api"] = []
+                for concurrency in args.concurrency:
+                    print(f"[{size}] POST /query, concurrency {concurrency}")
+                    rag.answer_cache.clear()
+                    rag.retrieval_cache.clear()
+                    questions = corpus.questions(args.api_requests, seed_offset=1000 + concurrency)
+                    base_url = f"http://127.0.0.1:{args.api_port}"
+                    result["query_api"].append(drivers.bench_query_api(base_url, questions, concurrency))
+            finally:
+                server.should_exit = True
+
+        # Last, since it rebuilds the index
+        if "reindex" in args.stages:
+            print(f"[{size}] reindex")
+            result["reindex"] = drivers.bench_reindex(rag)
+    finally:
+        rag.close()
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LuceneRAG benchmarks")
+    parser.add_argument("--sizes", type=parse_ints, default=[1000], help="Comma-separated index sizes")
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 4, 16], help="Comma-separated thread counts")
+    parser.add_argument("--queries", type=int, default=200, help="Searches per concurrency level")
+    parser.add_argument("--api-requests", type=int, default=50, help="POST /query requests per concurrency level")
+    parser.add_argument("--single-docs", type=int, default=100, help="Documents ingested one at a time")
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--folder-depth", type=int, default=3)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedder", default="none", help="Embedder spec, e.g. hashing:256")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake Ollama seconds to first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=64, help="Tokens per fake answer")
+    parser.add_argument("--max-generations", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=1, help="Index shards")
+    parser.add_argument("--directory", choices=("mmap", "nio", "auto"), default="mmap",
+                        help="Lucene Directory implementation")
+    parser.add_argument("--api-port", type=int, default=3334)
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    args.stages = set(args.stages.split(","))
+
+    lucene.initVM()
+    ollama = FakeOllama(latency=args.llm_latency, tokens_per_sec=args.llm_tokens_per_sec,
+                        num_tokens=args.llm_tokens, seed=args.seed).start()
+    started = time.perf_counter()
+    try:
+        runs = [run_size(args, size, ollama) for size in args.sizes]
+    finally:
+        ollama.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "lucene": lucene.VERSION,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seconds": round(time.perf_counter() - started, 3),
+            "args": {k: sorted(v) if isinstance(v, set) else v for k, v in vars(args).items()}
+        },
+        "runs": runs
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import re
+from typing import List, NamedTuple
+
+HEADING_RE = re.compile(r'^#{1,6}\s+(.*)$')
+
+
+class Passage(NamedTuple):
+    ordinal: int
+    start: int
+    end: int
+    heading: str
+    text: str
+
+
+def iter_blocks(content: str):
+    """Yield (start, end, heading) spans of paragraph blocks in a markdown document.
+
+    Blocks are separated by blank lines and never span a heading, so list
+    items that belong together stay in the same block.
+    """
+    heading = ""
+    block_start = None
+    block_end = 0
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        line_start, offset = offset, offset + len(line)
+        stripped = line.strip()
+        match = HEADING_RE.match(stripped)
+        if not stripped or match:
+            if block_start is not None:
+                yield block_start, block_end, heading
+                block_start = None
+            if match:
+                heading = match.group(1).strip()
+                block_start, block_end = line_start, offset
+            continue
+        if block_start is None:
+            block_start = line_start
+        block_end = offset
+    if block_start is not None:
+        yield block_start, block_end, heading
+
+
+def _split_long(start: int, end: int, content: str, max_chars: int):
+    """Split a block longer than max_chars at line, then word boundaries."""
+    while end - start > max_chars:
+        cut = content.rfind('\n', start, start + max_chars)
+        if cut <= start:
+            cut = content.rfind(' ', start, start + max_chars)
+        if cut <= start:
+            cut = start + max_chars
+        else:
+            cut += 1
+        yield start, cut
+        start = cut
+    if end > start:
+        yield start, end
+
+
+def chunk_markdown(content: str, max_chars: int = 1500, overlap_chars: int = 200) -> List[Passage]:
+    """Split a markdown document into overlapping, heading-aware passages.
+
+    Paragraphs and lists are packed into passages of at most max_chars. A new
+    heading always starts a new passage, and consecutive passages within a
+    section overlap by up to overlap_chars, aligned to a line boundary.
+    Passage offsets refer to the original content.
+    """
+    # Leave room for the overlap when splitting oversized blocks
+    split_chars = max(1, max_chars - overlap_chars)
+    spans = []
+    for block_start, block_end, heading in iter_blocks(content):
+        for start, end in _split_long(block_start, block_end, content, split_chars):
+            spans.append((start, end, heading))
+
+    passages = []
+    current_start = current_end = None
+    current_heading = ""
+    for start, end, heading in spans:
+        if current_start is not None and (heading != current_heading or end - current_start > max_chars):
+            passages.append((current_start, current_end, current_heading))
+            if heading == current_heading and overlap_chars > 0:
+                overlap_start = content.find('\n', max(current_start, current_end - overlap_chars), current_end)
+                if overlap_start != -1 and overlap_start + 1 < current_end and end - (overlap_start + 1) <= max_chars:
+                    start = overlap_start + 1
+            current_start = None
+        if current_start is None:
+            current_start, current_heading = start, heading
+        current_end = end
+    if current_start is not None:
+        passages.append((current_start, current_end, current_heading))
+
+    return [
+        Passage(ordinal=i, start=start, end=end, heading=heading, text=content[start:end])
+        for i, (start, end, heading) in enumerate(passages)
+    ]
+
+
+def merge_passages(passages: List[dict]) -> List[str]:
+    """Merge passages of one document into contiguous text segments.
+
+    Each passage is a dict with 'ordinal', 'start', 'end' and 'text'. Passages
+    that overlap or are adjacent are joined using their offsets, so the
+    overlapping text is included only once.
+    """
+    segments = []
+    current_text = None
+    current_end = current_ordinal = None
+    for p in sorted(passages, key=lambda p: p['ordinal']):
+        if current_text is not None and (p['start'] <= current_end or p['ordinal'] == current_ordinal + 1):
+            skip = max(0, current_end - p['start'])
+            if p['start'] > current_end:
+                current_text += '\n'
+            current_text += p['text'][skip:]
+            current_end = max(current_end, p['end'])
+        else:
+            if current_text is not None:
+                segments.append(current_text)
+            current_text = p['text']
+            current_end = p['end']
+        current_ordinal = p['ordinal']
+    if current_text is not None:
+        segments.append(current_text)
+    return segments
@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable
+
+
+class OverloadedError(Exception):
+    """Raised when a pool already has its maximum of running and queued tasks."""
+
+
+def attach_jvm():
+    """Attach the current thread to the JVM so it can call into PyLucene."""
+    # Imported here, so modules that only use the pools load (and test) without PyLucene
+    import lucene
+    lucene.getVMEnv().attachCurrentThread()
+
+
+class BoundedExecutor:
+    """A thread pool with a cap on running plus queued tasks.
+
+    Submitting beyond the cap raises OverloadedError instead of queueing
+    without bound, so callers can apply backpressure (e.g. HTTP 429).
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queued: int, attach_to_jvm: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=name,
+            initializer=attach_jvm if attach_to_jvm else None
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of tasks running or waiting in the pool."""
+        return self._pending
+
+    def has_capacity(self) -> bool:
+        """Whether a task submitted now would be accepted."""
+        return self._pending < self.max_workers + self.max_queued
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Submit a task, raising OverloadedError when the pool is full.
+
+        The task runs in a copy of the caller's context, so request ids and
+        traces follow work onto the pool threads.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queued:
+                raise OverloadedError(f"{self.name} pool is busy, try again later")
+            self._pending += 1
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run a blocking function in the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def iterate(self, fn: Callable, *args, **kwargs) -> AsyncIterator:
+        """Drive a blocking generator in one pool task, yielding its items asynchronously.
+
+        The generator holds a single pool slot for its whole lifetime. When the
+        consumer stops iterating, the generator is closed from its own thread
+        before the next item is produced.
+        """
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        cancelled = threading.Event()
+        finished = object()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(results.put_nowait, (item, error))
+            except RuntimeError:
+                # The event loop has already shut down
+                pass
+
+        def produce():
+            generator = fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if cancelled.is_set():
+                        break
+                    put(item)
+            except Exception as e:
+                put(finished, e)
+                return
+            finally:
+                generator.close()
+            put(finished)
+
+        self.submit(produce)
+        try:
+            while True:
+                item, error = await results.get()
+                if item is finished:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            cancelled.set()
+
+    async def feed(self, items: AsyncIterable, fn: Callable, *args, max_buffered: int = 64, **kwargs):
+        """Run fn(iterable, *args, **kwargs) in the pool, feeding it items from an async iterable.
+
+        At most `max_buffered` items wait between the two sides, so a slow
+        consumer holds back the producer instead of letting items pile up in
+        memory. If fn returns or fails early, the remaining items are not read.
+        """
+        loop = asyncio.get_running_loop()
+        buffer = queue.SimpleQueue()
+        slots = asyncio.Semaphore(max_buffered)
+        finished = object()
+
+        def consume():
+            while True:
+                item = buffer.get()
+                if item is finished:
+                    return
+                loop.call_soon_threadsafe(slots.release)
+                yield item
+
+        future = asyncio.wrap_future(self.submit(fn, consume(), *args, **kwargs))
+        try:
+            async for item in items:
+                if slots.locked():
+                    acquire = asyncio.ensure_future(slots.acquire())
+                    await asyncio.wait({acquire, future}, return_when=asyncio.FIRST_COMPLETED)
+                    if not acquire.done():
+                        acquire.cancel()
+                        break
+                else:
+                    await slots.acquire()
+                buffer.put(item)
+        finally:
+            buffer.put(finished)
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
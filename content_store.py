@@ -0,0 +1,145 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import List, Tuple
+
+CONTENT_FILE = "content.dat"
+BLOCK_CHARS = 8192
+
+# Record header: record bytes, key bytes, content characters, characters per block, blocks
+_HEADER = struct.Struct("<IIIII")
+_BLOCK_END = struct.Struct("<I")
+
+
+class ContentStore:
+    """Append-only, block-compressed log of document bodies, read through mmap.
+
+    Each record holds a document key and its content split into blocks of
+    `block_chars` characters, each compressed on its own, behind a table of
+    block end offsets. `put` returns the record's file offset, which the
+    Lucene document keeps as its reference; a Lucene commit is preceded by
+    `sync`, so committed references always point at durable records.
+
+    Reads decompress only the blocks covering the requested character
+    ranges, straight from memoryview slices of the mapped file, so a passage
+    never materializes its whole document. Replaced or deleted documents
+    leave dead records behind until the next reindex writes a fresh store.
+    """
+
+    def __init__(self, directory: str, read_only: bool = False, block_chars: int = BLOCK_CHARS,
+                 level: int = 6):
+        self.path = os.path.join(directory, CONTENT_FILE)
+        self.read_only = read_only
+        self.block_chars = block_chars
+        self.level = level
+        self._file = None
+        if not read_only:
+            # Unbuffered, so appended records are visible to the mapping before any commit
+            self._file = open(self.path, "ab", buffering=0)
+            self._size = os.fstat(self._file.fileno()).st_size
+        self._append_lock = threading.Lock()
+        # Opened on the first read and kept open, so the mapping can still grow
+        # (and reads keep working) after a reindex has deleted the file
+        self._reader = None
+        self._map = None
+        self._map_lock = threading.Lock()
+
+    def put(self, key: str, content: str) -> int:
+        """Append a document body and return the reference (offset) of its record."""
+        key_bytes = key.encode("utf-8")
+        blocks = [
+            zlib.compress(content[i:i + self.block_chars].encode("utf-8"), self.level)
+            for i in range(0, len(content), self.block_chars)
+        ]
+        ends = []
+        end = 0
+        for block in blocks:
+            end += len(block)
+            ends.append(end)
+        size = _HEADER.size + len(key_bytes) + _BLOCK_END.size * len(blocks) + end
+        record = b"".join([
+            _HEADER.pack(size, len(key_bytes), len(content), self.block_chars, len(blocks)),
+            key_bytes,
+            struct.pack(f"<{len(ends)}I", *ends),
+            *blocks
+        ])
+        with self._append_lock:
+            ref = self._size
+            view = memoryview(record)
+            while view:
+                view = view[self._file.write(view):]
+            self._size += size
+        return ref
+
+    def get(self, ref: int) -> str:
+        """The whole document body of a record."""
+        return self.slices(ref, [(0, None)])[0]
+
+    def slice(self, ref: int, start: int, end: int) -> str:
+        """Characters [start, end) of a document body."""
+        return self.slices(ref, [(start, end)])[0]
+
+    def slices(self, ref: int, spans: List[Tuple[int, int]]) -> List[str]:
+        """Several character ranges of one document body; each block is decompressed once."""
+        view = self._view(ref + _HEADER.size)
+        size, key_size, length, block_chars, num_blocks = _HEADER.unpack_from(view, ref)
+        view = self._view(ref + size)
+        table = ref + _HEADER.size + key_size
+        data = table + _BLOCK_END.size * num_blocks
+        ends = struct.unpack_from(f"<{num_blocks}I", view, table)
+        blocks = {}
+
+        def block(i: int) -> str:
+            if i not in blocks:
+                start = data + (ends[i - 1] if i else 0)
+                blocks[i] = zlib.decompress(view[start:data + ends[i]]).decode("utf-8")
+            return blocks[i]
+
+        texts = []
+        for start, end in spans:
+            start = max(0, start)
+            end = length if end is None else min(end, length)
+            if start >= end:
+                texts.append("")
+                continue
+            first, last = start // block_chars, (end - 1) // block_chars
+            text = "".join(block(i) for i in range(first, last + 1))
+            offset = first * block_chars
+            texts.append(text[start - offset:end - offset])
+        return texts
+
+    def _view(self, end: int) -> memoryview:
+        """The mapped file, remapped when it has grown past the mapping."""
+        mapped = self._map
+        if mapped is None or len(mapped) < end:
+            with self._map_lock:
+                mapped = self._map
+                if mapped is None or len(mapped) < end:
+                    if self._reader is None:
+                        self._reader = open(self.path, "rb")
+                    mapped = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+                    if len(mapped) < end:
+                        raise ValueError(f"Content reference beyond the end of {self.path}")
+                    # Earlier mappings are not closed: reads still using them stay valid
+                    self._map = mapped
+        return memoryview(mapped)
+
+    def size_bytes(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def sync(self):
+        """Make appended records durable; called before every Lucene commit."""
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Stop appending. Reads keep working, even after the file is deleted."""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,137 @@
+import re
+from typing import List, Tuple
+
+from org.apache.lucene.search.highlight import Highlighter, QueryScorer, NullFragmenter, SimpleHTMLFormatter
+
+from chunker import iter_blocks, merge_passages
+
+WORD_RE = re.compile(r'\w+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of LLM tokens in a text (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    """Return the set of word shingles of a text, used for near-duplicate detection."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _truncate_lines(text: str, max_tokens: int) -> str:
+    """Keep as many whole lines of a text as fit in max_tokens."""
+    kept = []
+    used = 0
+    for line in text.split('\n'):
+        cost = estimate_tokens(line + '\n')
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return '\n'.join(kept).strip()
+
+
+class ContextPacker:
+    """Select the best-scoring fragments of retrieved documents within a token budget.
+
+    Fragments are paragraph or list blocks of the retrieved passages, so list
+    structure is preserved. Each fragment is scored with Lucene's highlighter
+    against the search query, weighted by its document's retrieval score, and
+    fragments are added greedily until the budget is spent.
+    """
+
+    def __init__(self, analyzer, field: str = "passage", duplicate_threshold: float = 0.8):
+        self.analyzer = analyzer
+        self.field = field
+        self.duplicate_threshold = duplicate_threshold
+
+    def _score_fragment(self, highlighter, text: str) -> float:
+        """Score a fragment with the highlighter's query scorer."""
+        token_stream = self.analyzer.tokenStream(self.field, text)
+        fragments = highlighter.getBestTextFragments(token_stream, text, False, 1)
+        if fragments and fragments[0] is not None:
+            return float(fragments[0].getScore())
+        return 0.0
+
+    def _fragments(self, results: List[dict], query) -> List[dict]:
+        """Split retrieved documents into scored fragments."""
+        highlighter = Highlighter(SimpleHTMLFormatter("", ""), QueryScorer(query, self.field))
+        highlighter.setTextFragmenter(NullFragmenter())
+        max_score = max((r['score'] for r in results), default=0.0) or 1.0
+
+        fragments = []
+        for rank, result in enumerate(results):
+            segments = merge_passages(result['passages']) if result.get('passages') else [result['content']]
+            position = 0
+            for segment in segments:
+                for start, end, _ in iter_blocks(segment):
+                    text = segment[start:end].strip()
+                    if not text:
+                        continue
+                    weight = result['score'] / max_score
+                    fragments.append({
+                        'rank': rank,
+                        'position': position,
+                        'text': text,
+                        'tokens': estimate_tokens(text) + 1,
+                        'score': self._score_fragment(highlighter, text) * weight
+                    })
+                    position += 1
+        return fragments
+
+    def pack(self, results: List[dict], query, budget: int, first_document: int = 1) -> Tuple[str, int, List[int]]:
+        """Assemble a context of at most `budget` tokens from search results.
+
+        Returns the context, its estimated token count, and the ranks of the
+        results that contributed at least one fragment. Documents are numbered
+        from `first_document`, so a context can be appended to another one.
+        """
+        fragments = self._fragments(results, query)
+        candidates = sorted(
+            (f for f in fragments if f['score'] > 0),
+            key=lambda f: (-f['score'], f['rank'], f['position'])
+        )
+        if not candidates and fragments:
+            # Nothing matched the query terms directly; fall back to the top document
+            candidates = [f for f in fragments if f['rank'] == 0]
+
+        selected = []
+        selected_shingles = []
+        used = 0
+        for fragment in candidates:
+            remaining = budget - used
+            if remaining <= 0:
+                break
+            shingles = _shingles(fragment['text'])
+            if any(shingles and len(shingles & other) / len(shingles | other) >= self.duplicate_threshold
+                   for other in selected_shingles):
+                continue
+            if fragment['tokens'] > remaining:
+                if selected:
+                    continue
+                # Always include something from the best fragment, cut at a line boundary
+                fragment = dict(fragment, text=_truncate_lines(fragment['text'], remaining))
+                if not fragment['text']:
+                    continue
+                fragment['tokens'] = estimate_tokens(fragment['text']) + 1
+            selected.append(fragment)
+            selected_shingles.append(shingles)
+            used += fragment['tokens']
+
+        # Restore document order and the original order within each document
+        selected.sort(key=lambda f: (f['rank'], f['position']))
+        context_parts = []
+        ranks = []
+        for fragment in selected:
+            if not ranks or ranks[-1] != fragment['rank']:
+                ranks.append(fragment['rank'])
+                context_parts.append([])
+            context_parts[-1].append(fragment['text'])
+
+        context = "\n\n---\n\n".join(
+            f"Document {i}:\n" + "\n\n".join(parts) for i, parts in enumerate(context_parts, first_document)
+        )
+        return context, estimate_tokens(context), ranks
@@ -0,0 +1,111 @@
+import math
+import re
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+WORD_RE = re.compile(r'\w+')
+
+
+class Embedder(ABC):
+    """Turns text into fixed-size vectors for KNN retrieval.
+
+    Implementations must return vectors of length `dimension`. Documents are
+    embedded in batches during ingestion, queries one at a time.
+    """
+
+    name = "embedder"
+    dimension = 0
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, one vector per text."""
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic, dependency-free embedder based on feature hashing.
+
+    Words and word bigrams are hashed into a signed, L2-normalized vector.
+    It captures lexical overlap only, so it is meant as an offline stand-in
+    for tests and benchmarks rather than for semantic retrieval.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        words = WORD_RE.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dimension] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm == 0:
+            # Zero vectors are invalid for cosine similarity
+            vector[0] = 1.0
+            return vector
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+class TransformersEmbedder(Embedder):
+    """Local sentence embeddings with a Hugging Face transformers model.
+
+    Uses mean pooling over the last hidden state. Requires `transformers`
+    and `torch`, and a model that is either cached locally or downloadable.
+    """
+
+    name = "transformers"
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", batch_size: int = 32):
+        try:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError as e:
+            raise ImportError("TransformersEmbedder requires the transformers and torch packages; torch is "
+                              "optional, e.g. pip install torch --index-url https://download.pytorch.org/whl/cpu") from e
+
+        self._torch = torch
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+        self.dimension = self.model.config.hidden_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        torch = self._torch
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            encoded = self.tokenizer(batch, padding=True, truncation=True, max_length=512, return_tensors="pt")
+            with torch.no_grad():
+                output = self.model(**encoded)
+            mask = encoded["attention_mask"].unsqueeze(-1).float()
+            pooled = (output.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            vectors.extend(pooled.numpy().tolist())
+        return vectors
+
+
+def create_embedder(spec: Optional[str]) -> Optional[Embedder]:
+    """Create an embedder from a spec such as "hashing", "hashing:384" or "transformers:<model>".
+
+    Returns None for an empty spec or "none", which disables vector retrieval.
+    """
+    if not spec or spec == "none":
+        return None
+    kind, _, arg = spec.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(arg) if arg else 256)
+    if kind == "transformers":
+        return TransformersEmbedder(arg) if arg else TransformersEmbedder()
+    raise ValueError(f"Unknown embedder: {spec}")
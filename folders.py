@@ -0,0 +1,39 @@
+from typing import Dict, Iterable, List
+
+from models import FolderNode
+
+
+def ancestors(folder_path: str) -> List[str]:
+    """Return a folder path and all of its ancestors, e.g. "a/b" -> ["a", "a/b"]."""
+    parts = [p for p in folder_path.split("/") if p]
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def is_within(path: str, folder_path: str) -> bool:
+    """Whether a path is the folder itself or lies somewhere below it."""
+    return path == folder_path or path.startswith(folder_path.rstrip("/") + "/")
+
+
+def build_folder_tree(folders: Iterable[str], document_counts: Dict[str, int]) -> FolderNode:
+    """Build the folder tree with direct and subtree document counts.
+
+    `folders` are the known folder markers and `document_counts` maps a
+    folder path to the number of documents directly inside it. Intermediate
+    folders without a marker are included so every path has a parent.
+    """
+    root = FolderNode(path="", name="", document_count=document_counts.get("", 0))
+    nodes = {"": root}
+    for folder in sorted(set(folders) | set(document_counts)):
+        for path in ancestors(folder):
+            if path not in nodes:
+                parent_path, _, name = path.rpartition("/")
+                node = FolderNode(path=path, name=name, document_count=document_counts.get(path, 0))
+                nodes[parent_path].children.append(node)
+                nodes[path] = node
+
+    def total(node: FolderNode) -> int:
+        node.total_count = node.document_count + sum(total(child) for child in node.children)
+        return node.total_count
+
+    total(root)
+    return root
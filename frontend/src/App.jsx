@@ -12,6 +12,8 @@ function App() {
   const [selectedDoc, setSelectedDoc] = useState(null);
   const [chatMessage, setChatMessage] = useState('');
   const [chatHistory, setChatHistory] = useState([]);
+  // Server-side chat session, so follow-up questions are answered in context
+  const [sessionId, setSessionId] = useState(() => crypto.randomUUID());
   const [loading, setLoading] = useState(false);
   const [selectedPath, setSelectedPath] = useState('');
   const fileInputRef = useRef(null);
@@ -79,8 +81,14 @@ function App() {
 
   const fetchDocuments = async () => {
     try {
-      const response = await axios.get(`${API_URL}/documents`);
-      const allDocs = response.data;
+      // Page through the metadata-only listing
+      let allDocs = [];
+      let cursor = null;
+      do {
+        const response = await axios.get(`${API_URL}/documents`, { params: { cursor, limit: 1000 } });
+        allDocs = allDocs.concat(response.data.documents);
+        cursor = response.data.next_cursor;
+      } while (cursor);
       
       // Sort documents to ensure folder markers come first
       const sortedDocs = [...allDocs].sort((a, b) => {
@@ -95,44 +103,65 @@ function App() {
     }
   };
 
+  const readFileText = (file) => new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = (e) => resolve(e.target.result);
+    reader.onerror = reject;
+    reader.readAsText(file);
+  });
+
+  // Uploads are indexed in the background; poll their tickets until they are searchable
+  const waitForTickets = async (tickets) => {
+    let pending = tickets;
+    while (pending.length > 0) {
+      await new Promise((resolve) => setTimeout(resolve, 500));
+      const states = await Promise.all(pending.map((ticket) =>
+        axios.get(`${API_URL}/ingest/tickets/${ticket}`)
+          .then((response) => response.data.state)
+          .catch(() => 'unknown')
+      ));
+      pending = pending.filter((_, i) => states[i] === 'queued' || states[i] === 'indexing');
+    }
+  };
+
   const handleFileUpload = async (event, isDirectory = false) => {
     const files = Array.from(event.target.files);
     if (files.length === 0) return;
 
-    for (const file of files) {
-      const reader = new FileReader();
-      reader.onload = async (e) => {
-        try {
-          let folderPath = selectedPath;
-          let fileName = file.name;
-
-          if (isDirectory && file.webkitRelativePath) {
-            const pathParts = file.webkitRelativePath.split('/');
-            pathParts.pop(); // Remove filename
-            const relativePath = pathParts.join('/');
-            folderPath = selectedPath
-              ? `${selectedPath}/${relativePath}`
-              : relativePath;
-          }
+    const uploads = files.map(async (file) => {
+      try {
+        let folderPath = selectedPath;
+        let fileName = file.name;
 
-          await axios.post(`${API_URL}/documents`, {
-            id: fileName,
-            content: e.target.result,
-            folder_path: folderPath
-          });
-        } catch (error) {
-          console.error('Error uploading document:', error);
+        if (isDirectory && file.webkitRelativePath) {
+          const pathParts = file.webkitRelativePath.split('/');
+          pathParts.pop(); // Remove filename
+          const relativePath = pathParts.join('/');
+          folderPath = selectedPath
+            ? `${selectedPath}/${relativePath}`
+            : relativePath;
         }
-      };
-      reader.readAsText(file);
-    }
+
+        const response = await axios.post(`${API_URL}/documents`, {
+          id: fileName,
+          content: await readFileText(file),
+          folder_path: folderPath
+        });
+        return response.data.ticket;
+      } catch (error) {
+        console.error('Error uploading document:', error);
+        return null;
+      }
+    });
 
     // Reset file inputs
     if (fileInputRef.current) fileInputRef.current.value = '';
     if (folderInputRef.current) folderInputRef.current.value = '';
 
-    // Refresh document list after all uploads
-    setTimeout(fetchDocuments, 500);
+    // Refresh document list once all uploads are searchable
+    const tickets = (await Promise.all(uploads)).filter(Boolean);
+    await waitForTickets(tickets);
+    fetchDocuments();
   };
 
   const handleCreateFolder = async (folderPath) => {
@@ -180,27 +209,79 @@ function App() {
   const handleChat = async () => {
     if (!chatMessage.trim()) return;
 
+    const question = chatMessage;
     setLoading(true);
+    setChatMessage('');
+    setChatHistory(prev => [...prev,
+      { type: 'user', content: question },
+      { type: 'assistant', content: '', sources: [] }
+    ]);
+
+    // Update the assistant message that is being streamed (always the last one)
+    const updateAnswer = (update) => {
+      setChatHistory(prev => {
+        const history = [...prev];
+        history[history.length - 1] = { ...history[history.length - 1], ...update(history[history.length - 1]) };
+        return history;
+      });
+    };
+
     try {
-      const response = await axios.post(`${API_URL}/query`, {
-        question: chatMessage
+      const response = await fetch(`${API_URL}/query/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ question, session_id: sessionId })
       });
-      
-      setChatHistory(prev => [...prev, 
-        { type: 'user', content: chatMessage },
-        { 
-          type: 'assistant', 
-          content: response.data.answer,
-          sources: response.data.sources 
+      if (!response.ok) throw new Error(`Query failed with status ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+        for (const message of messages) {
+          const event = message.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(message.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (event === 'sources') {
+            updateAnswer(() => ({ sources: data.sources }));
+          } else if (event === 'token') {
+            updateAnswer(msg => ({ content: msg.content + data.text }));
+          } else if (event === 'done') {
+            updateAnswer(() => ({ content: data.answer }));
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
         }
-      ]);
-      setChatMessage('');
+      }
     } catch (error) {
       console.error('Error querying documents:', error);
     }
     setLoading(false);
   };
 
+  const handleNewChat = () => {
+    axios.delete(`${API_URL}/sessions/${sessionId}`).catch(() => {});
+    setSessionId(crypto.randomUUID());
+    setChatHistory([]);
+  };
+
+  const selectDocument = async (doc) => {
+    try {
+      const response = await axios.get(`${API_URL}/documents/${encodeURIComponent(doc.id)}`, {
+        params: { folder_path: doc.folder_path }
+      });
+      setSelectedDoc(response.data);
+    } catch (error) {
+      console.error('Error fetching document:', error);
+    }
+  };
+
   const handleSourceClick = (sourcePath) => {
     // Extract folder path and file name from the full path
     const parts = sourcePath.split('/');
@@ -209,7 +290,7 @@ function App() {
     
     const doc = documents.find(d => d.id === fileName && d.folder_path === folderPath);
     if (doc) {
-      setSelectedDoc(doc);
+      selectDocument(doc);
     }
   };
 
@@ -262,7 +343,7 @@ function App() {
         <div className="flex-1 min-h-0">
           <FolderTree
             documents={documents}
-            onSelectDocument={doc => doc.id !== '.folder' && setSelectedDoc(doc)}
+            onSelectDocument={doc => doc.id !== '.folder' && selectDocument(doc)}
             onDeleteDocument={handleDeleteDocument}
             onCreateFolder={handleCreateFolder}
             onDeleteFolder={handleDeleteFolder}
@@ -316,7 +397,16 @@ function App() {
           }} 
           className="bg-white shadow-md p-2 sm:p-4 flex flex-col"
         >
-          <h2 className="text-lg sm:text-xl font-bold mb-3 sm:mb-4">Chat</h2>
+          <div className="flex items-center justify-between mb-3 sm:mb-4">
+            <h2 className="text-lg sm:text-xl font-bold">Chat</h2>
+            <button
+              onClick={handleNewChat}
+              disabled={loading || chatHistory.length === 0}
+              className="btn btn-sm btn-outline"
+            >
+              New chat
+            </button>
+          </div>
           <div className="flex-1 overflow-auto mb-3 sm:mb-4 space-y-3 sm:space-y-4">
             {chatHistory.map((msg, index) => (
               <div key={index}>
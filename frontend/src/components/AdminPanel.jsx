@@ -10,27 +10,47 @@ function AdminPanel({ onReindex }) {
   const [model, setModel] = useState(null);
   const [numResults, setNumResults] = useState(3);
   const [updating, setUpdating] = useState(false);
+  const [reindexStatus, setReindexStatus] = useState(null);
   const [llmConfig, setLLMConfig] = useState({
     temperature: 0.1,
     num_ctx: 128000,
     repeat_penalty: 1.1
   });
 
+  const pollReindexStatus = async () => {
+    try {
+      const response = await axios.get(`${API_URL}/reindex/status`);
+      setReindexStatus(response.data);
+      if (response.data.state === 'running') {
+        setTimeout(pollReindexStatus, 1000);
+        return;
+      }
+      if (response.data.state === 'completed') {
+        fetchStats();
+        if (onReindex) {
+          await onReindex();
+        }
+      }
+    } catch (error) {
+      console.error('Error fetching reindex status:', error);
+    }
+    setLoading(false);
+  };
+
   const handleReindex = async () => {
-    if (!window.confirm('Are you sure you want to delete the index and reindex all documents?')) {
+    if (!window.confirm('Rebuild the index from all documents? Searches keep working while it runs.')) {
       return;
     }
     
     setLoading(true);
     try {
-      await axios.post(`${API_URL}/reindex`);
-      if (onReindex) {
-        await onReindex();
-      }
+      const response = await axios.post(`${API_URL}/reindex`);
+      setReindexStatus(response.data);
+      pollReindexStatus();
     } catch (error) {
       console.error('Error reindexing:', error);
+      setLoading(false);
     }
-    setLoading(false);
   };
 
   const fetchStats = async () => {
@@ -114,6 +134,13 @@ function AdminPanel({ onReindex }) {
     fetchModel();
     fetchSearchConfig();
     fetchLLMConfig();
+    // Resume progress reporting for a reindex that is already running
+    axios.get(`${API_URL}/reindex/status`).then((response) => {
+      if (response.data.state === 'running') {
+        setLoading(true);
+        pollReindexStatus();
+      }
+    }).catch((error) => console.error('Error fetching reindex status:', error));
   }, []);
 
   return (
@@ -136,6 +163,14 @@ function AdminPanel({ onReindex }) {
           <span>Model: {model || 'Loading...'}</span>
         </div>
         
+        {reindexStatus && reindexStatus.state !== 'idle' && (
+          <div className={reindexStatus.state === 'failed' ? 'text-red-600' : 'text-gray-600'}>
+            Reindex {reindexStatus.state === 'running' ? (reindexStatus.phase || 'running') : reindexStatus.state}
+            {reindexStatus.total > 0 && `: ${reindexStatus.processed}/${reindexStatus.total}`}
+            {reindexStatus.error && ` (${reindexStatus.error})`}
+          </div>
+        )}
+
         {stats && (
           <>
             <div className="text-gray-600">
@@ -144,6 +179,24 @@ function AdminPanel({ onReindex }) {
             <div className="text-gray-600">
               Index Size: {stats.index_size}
             </div>
+            <div className="text-gray-600">
+              Segments: {stats.segments}, {(stats.deleted_ratio * 100).toFixed(1)}% deleted
+            </div>
+            {stats.pending_docs > 0 && (
+              <div className="text-gray-600">
+                Pending: {stats.pending_docs} uncommitted
+              </div>
+            )}
+            {stats.last_commit_at && (
+              <div className="text-gray-600">
+                Last commit: {new Date(stats.last_commit_at * 1000).toLocaleTimeString()}
+              </div>
+            )}
+            {stats.shards && stats.shards.map((shard) => (
+              <div key={shard.shard} className="text-xs text-gray-500 pl-2">
+                {shard.shard}: {shard.num_docs} docs, {shard.segments} segments, {shard.index_size}
+              </div>
+            ))}
           </>
         )}
 
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from concurrency import OverloadedError, attach_jvm
+from models import DocumentInput, IngestTicket, IngestStatus
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "CHECKPOINT"
+SEGMENT_PREFIX = "wal-"
+
+
+class IngestQueue:
+    """Durable ingestion queue: uploads go to a write-ahead log and are indexed in the background.
+
+    `submit` appends the document to the current log segment, fsyncs it and
+    returns a ticket right away. A worker thread drains the queue into the
+    index in batches of up to `batch_size` documents, waiting at most
+    `commit_interval` seconds to fill a batch, so concurrent uploads share
+    one Lucene commit. After each commit the sequence number of the last
+    indexed entry is checkpointed; on startup, entries after the checkpoint
+    are replayed. Fully checkpointed log segments are deleted. A batch that
+    keeps failing is retried up to `max_attempts` times, after which its
+    tickets are marked failed so it cannot block the queue.
+    """
+
+    def __init__(self, rag, wal_dir: str, batch_size: int = 256, commit_interval: float = 1.0,
+                 max_pending: int = 10000, max_tickets: int = 100000,
+                 segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True, max_attempts: int = 5):
+        self.rag = rag
+        self.wal_dir = wal_dir
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.max_tickets = max_tickets
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        os.makedirs(wal_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._pending = deque()  # (seq, ticket id, DocumentInput)
+        self._tickets = OrderedDict()  # ticket id -> IngestTicket
+        self._in_flight = 0
+        self._attempts = {}  # seq -> failed attempts to index the entry
+        self._stop = threading.Event()
+        self._worker = None
+
+        self.checkpoint = self._read_checkpoint()
+        self.last_seq = self.checkpoint
+        self._segment = None
+        self._segment_path = None
+        self._replay()
+        self._open_segment()
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.wal_dir, CHECKPOINT_FILE)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, seq: int):
+        tmp_path = os.path.join(self.wal_dir, CHECKPOINT_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.wal_dir, CHECKPOINT_FILE))
+
+    def _segments(self) -> List[str]:
+        """Log segment paths in sequence order; names embed their first sequence number."""
+        names = [n for n in os.listdir(self.wal_dir) if n.startswith(SEGMENT_PREFIX) and n.endswith(".log")]
+        names.sort(key=lambda n: int(n[len(SEGMENT_PREFIX):-len(".log")]))
+        return [os.path.join(self.wal_dir, n) for n in names]
+
+    def _replay(self):
+        """Queue every logged entry that was not checkpointed before the last shutdown."""
+        replayed = 0
+        for path in self._segments():
+            with open(path, "r+b") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn write at the end of the log; nothing after it was acknowledged.
+                        # Cut it off, so the next entry appended to this segment starts on a line of its own.
+                        logger.warning("Truncating incomplete write-ahead log entry in %s", path)
+                        f.truncate(offset)
+                        os.fsync(f.fileno())
+                        break
+                    offset += len(line)
+                    self.last_seq = max(self.last_seq, entry["seq"])
+                    if entry["seq"] <= self.checkpoint:
+                        continue
+                    document = DocumentInput(**entry["document"])
+                    self._pending.append((entry["seq"], entry["ticket"], document))
+                    self._tickets[entry["ticket"]] = IngestTicket(
+                        ticket=entry["ticket"], id=document.id, folder_path=document.folder_path,
+                        state="queued", queued_at=entry["queued_at"]
+                    )
+                    replayed += 1
+        if replayed:
+            logger.info("Replaying %d uncommitted documents from the write-ahead log", replayed)
+
+    def _open_segment(self):
+        self._segment_path = os.path.join(self.wal_dir, f"{SEGMENT_PREFIX}{self.last_seq + 1}.log")
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+
+    def _remove_checkpointed_segments(self):
+        """Delete segments whose entries are all at or before the checkpoint."""
+        segments = self._segments()
+        for path, next_path in zip(segments, segments[1:]):
+            next_first_seq = int(os.path.basename(next_path)[len(SEGMENT_PREFIX):-len(".log")])
+            if next_first_seq - 1 <= self.checkpoint and path != self._segment_path:
+                os.remove(path)
+
+    def start(self) -> "IngestQueue":
+        self._worker = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self._worker.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the worker after its current batch; queued entries stay in the log."""
+        self._stop.set()
+        with self._lock:
+            self._not_empty.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self._segment.close()
+
+    def submit(self, document: DocumentInput) -> IngestTicket:
+        """Durably log a document for indexing and return its ticket."""
+        ticket = IngestTicket(
+            ticket=uuid.uuid4().hex, id=document.id, folder_path=document.folder_path,
+            state="queued", queued_at=time.time()
+        )
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise OverloadedError("Ingest queue is full, try again later")
+            self.last_seq += 1
+            seq = self.last_seq
+            entry = {"seq": seq, "ticket": ticket.ticket, "queued_at": ticket.queued_at, "document": document.dict()}
+            self._segment.write(json.dumps(entry) + "\n")
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            if self._segment.tell() >= self.segment_bytes:
+                self._segment.close()
+                self._open_segment()
+            self._pending.append((seq, ticket.ticket, document))
+            self._remember(ticket)
+            self._not_empty.notify()
+        return ticket
+
+    def _remember(self, ticket: IngestTicket):
+        self._tickets[ticket.ticket] = ticket
+        while len(self._tickets) > self.max_tickets:
+            self._tickets.popitem(last=False)
+
+    def ticket(self, ticket_id: str) -> Optional[IngestTicket]:
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            return ticket.copy() if ticket is not None else None
+
+    def status(self) -> IngestStatus:
+        with self._lock:
+            return IngestStatus(
+                pending=len(self._pending),
+                in_flight=self._in_flight,
+                last_seq=self.last_seq,
+                checkpoint=self.checkpoint,
+                segments=len(self._segments())
+            )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is indexed; returns False on timeout.
+
+        Called before deletes and moves so they apply after queued uploads.
+        """
+        with self._lock:
+            target = self.last_seq
+            return self._drained.wait_for(lambda: self.checkpoint >= target or self._stop.is_set(), timeout)
+
+    def _next_batch(self) -> list:
+        with self._lock:
+            while not self._pending and not self._stop.is_set():
+                self._not_empty.wait()
+            # Give concurrent uploads a moment to join the batch
+            deadline = time.monotonic() + self.commit_interval
+            while len(self._pending) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._not_empty.wait(remaining):
+                    break
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._in_flight = len(batch)
+            for _, ticket_id, _ in batch:
+                if ticket_id in self._tickets:
+                    self._tickets[ticket_id].state = "indexing"
+            return batch
+
+    def _run(self):
+        attach_jvm()
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                # One commit and searcher refresh for the whole batch
+                result = self.rag.index_documents([document for _, _, document in batch])
+            except Exception as e:
+                logger.error("Error indexing ingest batch, retrying: %s", e)
+                self._retry(batch, str(e))
+                self._stop.wait(self.commit_interval)
+                continue
+
+            completed_at = time.time()
+            with self._lock:
+                for (seq, ticket_id, _), item in zip(batch, result.items):
+                    self._attempts.pop(seq, None)
+                    ticket = self._tickets.get(ticket_id)
+                    if ticket is None:
+                        continue
+                    # Unchanged documents were already searchable with this content
+                    ticket.state = "failed" if item.status == "failed" else "searchable"
+                    ticket.error = item.error
+                    ticket.completed_at = completed_at
+                self._complete(batch[-1][0])
+
+    def _retry(self, batch: list, error: str):
+        """Queue a failed batch again, failing the entries that are out of attempts.
+
+        Entries at the head of the queue have been attempted at least as often
+        as the ones behind them, so the failed entries are a prefix of the
+        batch and the checkpoint can move past them.
+        """
+        completed_at = time.time()
+        with self._lock:
+            given_up = 0
+            retrying = False
+            for seq, ticket_id, _ in batch:
+                attempts = self._attempts.get(seq, 0) + 1
+                if retrying or attempts < self.max_attempts:
+                    retrying = True
+                    self._attempts[seq] = attempts
+                    continue
+                given_up += 1
+                self._attempts.pop(seq, None)
+                ticket = self._tickets.get(ticket_id)
+                if ticket is not None:
+                    ticket.state = "failed"
+                    ticket.error = error
+                    ticket.completed_at = completed_at
+            if given_up:
+                logger.error("Giving up on %d queued documents after %d attempts", given_up, self.max_attempts)
+            self._pending.extendleft(reversed(batch[given_up:]))
+            if given_up:
+                self._complete(batch[given_up - 1][0])
+            else:
+                self._in_flight = 0
+
+    def _complete(self, seq: int):
+        """Checkpoint everything up to seq as done; called with the lock held."""
+        self.checkpoint = seq
+        self._write_checkpoint(self.checkpoint)
+        self._remove_checkpointed_segments()
+        self._in_flight = 0
+        self._drained.notify_all()
@@ -0,0 +1,256 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when Ollama cannot be reached, or the circuit breaker is open after repeated failures."""
+
+
+class LLMRequestError(Exception):
+    """Raised when Ollama rejects a request (HTTP 4xx, e.g. an unknown model); retrying would not help."""
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures.
+
+    Once open, calls are rejected for `reset_timeout` seconds. After that a
+    single trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Opening the Ollama circuit after %d failures", self.failures)
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the next trial call is allowed."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class OllamaGateway:
+    """Client for Ollama's generate API.
+
+    Connections are pooled and kept alive in one requests session, and every
+    call has connect/read timeouts plus an overall deadline. At most
+    `max_concurrent` generations run at once. Connection errors are retried
+    with jittered exponential backoff as long as no output was produced, and
+    a circuit breaker fails fast while Ollama is down. `keep_alive` is sent
+    with every request so the model stays loaded between questions.
+
+    `model`, `temperature`, `num_ctx` and `repeat_penalty` can be changed at
+    runtime; they are read on every request.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3.2-vision",
+                 temperature: float = 0.1, num_ctx: int = 128000, repeat_penalty: float = 1.1,
+                 keep_alive: str = "30m", max_concurrent: int = 2, connect_timeout: float = 5.0,
+                 read_timeout: float = 120.0, total_timeout: float = 600.0, max_retries: int = 2,
+                 backoff: float = 0.5, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.temperature = temperature
+        self.num_ctx = num_ctx
+        self.repeat_penalty = repeat_penalty
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self.ready = False
+        self._probe_stop = threading.Event()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent + 2, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": self.temperature,
+                "num_ctx": self.num_ctx,
+                "repeat_penalty": self.repeat_penalty
+            }
+        }
+
+    def _post(self, payload: dict) -> requests.Response:
+        """POST to /api/generate, retrying connection failures with jittered backoff."""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailableError(
+                    f"Ollama is unavailable, retry in {self.breaker.retry_after():.0f}s"
+                )
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/generate", json=payload, stream=True,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                self.ready = False
+                if attempt == self.max_retries:
+                    raise LLMUnavailableError(f"Ollama request failed: {e}") from e
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning("Ollama request failed (%s), retrying in %.2fs", e, delay)
+                time.sleep(delay)
+                continue
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                response.close()
+                raise LLMUnavailableError(f"Ollama returned HTTP {response.status_code}")
+            # Ollama answered, so a 4xx (e.g. an unknown model) says nothing about its health
+            self.breaker.record_success()
+            if response.status_code >= 400:
+                try:
+                    detail = response.json().get("error") or response.reason
+                except ValueError:
+                    detail = response.reason
+                response.close()
+                raise LLMRequestError(f"Ollama rejected the request (HTTP {response.status_code}): {detail}")
+            return response
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield answer chunks as Ollama generates them.
+
+        Closing the generator closes the HTTP response, which makes Ollama
+        stop generating.
+        """
+        deadline = time.monotonic() + self.total_timeout
+        if not self._slots.acquire(timeout=self.total_timeout):
+            raise LLMUnavailableError("Timed out waiting for a free generation slot")
+        response = None
+        try:
+            response = self._post(self._payload(prompt, stream=True))
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise LLMUnavailableError(f"Ollama error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+                if time.monotonic() > deadline:
+                    raise LLMUnavailableError(f"Generation exceeded {self.total_timeout:.0f}s")
+            self.breaker.record_success()
+            self.ready = True
+        except requests.RequestException as e:
+            # The stream broke off after it started; retrying would repeat output
+            self.breaker.record_failure()
+            raise LLMUnavailableError(f"Ollama stream failed: {e}") from e
+        finally:
+            if response is not None:
+                response.close()
+            self._slots.release()
+
+    def invoke(self, prompt: str) -> str:
+        """Generate the complete answer for a prompt."""
+        return "".join(self.stream(prompt))
+
+    def available(self) -> bool:
+        """Whether a request would currently be attempted (the circuit is not open)."""
+        return self.breaker.state != "open"
+
+    def check_ready(self) -> bool:
+        """Probe Ollama once with a short timeout and record the result."""
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=(self.connect_timeout, 5.0))
+            self.ready = response.status_code == 200
+        except requests.RequestException:
+            self.ready = False
+        if self.ready:
+            self.breaker.record_success()
+        return self.ready
+
+    def warm_up(self):
+        """Load the model ahead of the first question (an empty prompt only loads it)."""
+        try:
+            self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=(self.connect_timeout, self.read_timeout)
+            ).close()
+        except requests.RequestException as e:
+            logger.warning("Could not preload model %s: %s", self.model, e)
+
+    def start_readiness_probe(self, interval: float = 2.0):
+        """Poll Ollama from a background thread until it answers, then preload the model."""
+        def probe():
+            while not self._probe_stop.is_set():
+                if self.check_ready():
+                    logger.info("Ollama service is ready at %s", self.base_url)
+                    self.warm_up()
+                    return
+                logger.info("Waiting for Ollama service at %s", self.base_url)
+                self._probe_stop.wait(interval)
+
+        threading.Thread(target=probe, name="ollama-probe", daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "ready": self.ready,
+            "circuit": self.breaker.state,
+            "max_concurrent": self.max_concurrent
+        }
+
+    def close(self):
+        self._probe_stop.set()
+        self.session.close()
@@ -1,57 +1,186 @@
+import base64
+import contextvars
+import hashlib
+import itertools
+import json
+import logging
 import os
+import queue
 import re
 import shutil
-from typing import List, Optional, Tuple
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, Tuple
 import lucene
-from java.nio.file import Paths
+from lucene import JArray
+from java.util import HashSet
+from java.util.concurrent import Executors
 from org.apache.lucene.analysis.standard import StandardAnalyzer
-from org.apache.lucene.document import Document, Field, TextField, StringField
-from org.apache.lucene.index import IndexWriter, IndexWriterConfig, DirectoryReader, Term
-from org.apache.lucene.store import FSDirectory
-from org.apache.lucene.search import IndexSearcher, BooleanQuery, BooleanClause, TermQuery
-from org.apache.lucene.queryparser.classic import QueryParser
+from org.apache.lucene.document import (
+    Document, Field, TextField, StringField, StoredField, SortedDocValuesField, BinaryDocValuesField,
+    KnnFloatVectorField
+)
+from org.apache.lucene.index import (
+    IndexWriterConfig, Term, MultiBits, DocValues, ReaderUtil, TieredMergePolicy, VectorSimilarityFunction
+)
+from org.apache.lucene.search import (
+    BooleanQuery, BooleanClause, TermQuery, TermRangeQuery, DocIdSetIterator, ConstantScoreQuery,
+    Sort, SortField, KnnFloatVectorQuery
+)
+from org.apache.lucene.util import BytesRef
 from org.apache.lucene.search.similarities import BM25Similarity
 from langchain.prompts import PromptTemplate
-from langchain_community.llms import Ollama
 
-from models import DocumentOutput, SourceWithScore, LuceneStats, LLMConfig
+from cache import LRUCache
+from chunker import chunk_markdown, merge_passages
+from concurrency import BoundedExecutor, OverloadedError, attach_jvm
+from context_packer import ContextPacker, estimate_tokens
+from embeddings import Embedder
+from folders import ancestors, build_folder_tree, is_within
+from llm_gateway import OllamaGateway
+import metrics
+import minhash
+from models import (
+    DocumentInput, DocumentOutput, SourceWithScore, LuceneStats, LLMConfig,
+    BulkItemStatus, BulkIndexOutput, CacheStats, DocumentSummary, DocumentPage, FolderNode,
+    SearchExplanation, TermPlan, ReindexStatus, SyncEntry, SyncPlan, ShardStats, SegmentStats, SearchConfig
+)
+from query_planner import QueryPlanner
+from sessions import ChatSession, ChatTurn, Retrieval, SessionStore
+from shards import SHARD_DIR_PREFIX, ShardedIndex, detect_num_shards, shard_of
+
+METADATA_FIELDS = ("id", "folder_path")
+# Pointer file naming the live index directory, and the prefix of reindexed directories
+ACTIVE_FILE = "ACTIVE"
+# Rewritten after every commit so read-only processes notice new index generations
+COMMIT_FILE = "COMMIT"
+# Search and LLM settings changed at runtime, written by the writer process and polled by readers
+SETTINGS_FILE = "SETTINGS"
+INDEX_DIR_PREFIX = "index-"
+
+logger = logging.getLogger(__name__)
 
 class LuceneRAG:
-    def __init__(self, index_dir="index"):
+    def __init__(self, index_dir="index", refresh_interval: Optional[float] = None,
+                 search_workers: int = 8, max_generations: int = 2, max_queued: int = 32,
+                 embedder: Optional[Embedder] = None, slow_query_ms: Optional[float] = 2000,
+                 llm: Optional[OllamaGateway] = None, read_only: bool = False, num_shards: int = 1,
+                 directory: str = "mmap", expunge_deletes_ratio: Optional[float] = None):
         self.index_dir = index_dir
+        # Read-only processes search the index that a separate writer process maintains
+        self.read_only = read_only
+        # Shards of new and reindexed indexes; an existing index keeps its layout until reindexed
+        self.num_shards = num_shards
+        # Lucene Directory implementation: "mmap", "nio" or "auto" (see shards.open_directory)
+        self.directory = directory
+        # After a commit, shards whose deleted documents exceed this share of all
+        # documents are merged to drop them (None leaves it to the merge policy)
+        self.expunge_deletes_ratio = expunge_deletes_ratio
         self.num_results = 3  # Default number of results
+        # Group commit thresholds for bulk ingestion
+        self.bulk_commit_docs = 1000
+        self.bulk_commit_bytes = 32 * 1024 * 1024
+        # Passage chunking; retrieval runs over passages rather than whole files
+        self.passage_max_chars = 1500
+        self.passage_overlap_chars = 200
+        self.passage_pool_factor = 5  # Passages retrieved per requested document
+        # Diversity reranking: candidates are ranked by maximal marginal relevance, trading
+        # relevance (lambda 1.0) against similarity to documents already picked (lambda 0.0)
+        self.mmr_lambda = 0.7
+        self.candidate_pool = 50  # Minimum passages retrieved as candidates
+        # Optional vector retrieval; lexical and KNN results are fused with reciprocal-rank fusion
+        self.embedder = embedder
+        self.embed_batch_docs = 32  # Documents whose passages are embedded in one call
+        self.rrf_k = 60
+        # Tokens of the context window kept free for the generated answer
+        self.answer_reserve_tokens = 1024
+        # Queries slower than this are logged with their per-stage timings (None disables)
+        self.slow_query_seconds = slow_query_ms / 1000 if slow_query_ms is not None else None
+        # Bumped on every write refresh; cache keys include it so stale entries are never hit
+        self.generation = 0
+        self.retrieval_cache = LRUCache(max_entries=1000, max_bytes=64 * 1024 * 1024, ttl=3600)
+        self.answer_cache = LRUCache(max_entries=500, max_bytes=16 * 1024 * 1024, ttl=3600)
+        self._folder_tree = None  # (generation, FolderNode)
+        self._folder_counts = None  # (generation, {folder: documents})
+        self._index_stats = None  # (generation, LuceneStats without live counters)
+        self.last_commit_at = None
+        self.filter_cache = LRUCache(max_entries=256, ttl=None)
+        # Chat sessions, and the tokens of earlier turns repeated in each prompt
+        self.sessions = SessionStore()
+        self.session_history_tokens = 2048
+        # Sessions live in process memory, and reader workers share one socket, so
+        # consecutive turns could land on different processes: readers answer statelessly
+        self.sessions_enabled = not read_only
         if not os.path.exists(index_dir):
             os.makedirs(index_dir)
         
-        # Initialize Lucene components
-        self.store = FSDirectory.open(Paths.get(index_dir))
+        self._reindex_lock = threading.Lock()
+        # Shard threads of a bulk write publish their commits concurrently
+        self._publish_lock = threading.Lock()
+        self._reindex_status = ReindexStatus()
+        
+        # Initialize Lucene components; reindexing switches between subdirectories of index_dir
+        self.active_index_path = self._active_index_path()
+        if not read_only:
+            self._remove_stale_indexes()
         self.analyzer = StandardAnalyzer()
+        self.context_packer = ContextPacker(self.analyzer)
+        # Exact BM25 terms, with fuzzy/prefix expansion only for rare terms
+        self.query_planner = QueryPlanner()
         
-        # Initialize writer with auto-commit and BM25 similarity
-        config = IndexWriterConfig(self.analyzer)
-        config.setSimilarity(BM25Similarity())
-        config.setCommitOnClose(True)
-        self.writer = IndexWriter(self.store, config)
+        # Initialize writers and the near-real-time searcher managers; with several
+        # shards, searches run across all of them on a shared Java thread pool
+        self.similarity = BM25Similarity()
+        self.search_executor = Executors.newFixedThreadPool(search_workers) if num_shards > 1 else None
+        self._commit_token = None
+        if read_only:
+            self._open_reader()
+        else:
+            self._open_writer()
         
-        # Initialize Ollama with optimized parameters
-        self.llm = Ollama(
-            base_url="http://localhost:11434",
+        # Optionally refresh searchers on a background interval as well as after writes;
+        # read-only processes instead poll for commits made by the writer process
+        self.refresh_interval = refresh_interval
+        self._refresh_stop = threading.Event()
+        if read_only:
+            threading.Thread(target=self._watch_commits, daemon=True).start()
+        elif refresh_interval:
+            threading.Thread(target=self._refresh_loop, daemon=True).start()
+        
+        # Known folder markers, so ingestion does not need a reader per document
+        self.known_folders = self._load_folders()
+        # Content fingerprint per document key, so unchanged re-uploads are skipped
+        self.content_hashes = self._load_content_hashes()
+        
+        # Blocking work runs on bounded pools so the event loop stays responsive.
+        # All IndexWriter mutations go through a single writer thread and lock.
+        self.write_lock = threading.RLock()
+        self.search_pool = BoundedExecutor("lucene-search", search_workers, max_queued, attach_to_jvm=True)
+        self.write_pool = BoundedExecutor("lucene-write", 1, max_queued, attach_to_jvm=True)
+        self.llm_pool = BoundedExecutor("llm", max_generations, max_queued)
+        # KNN searches run here, alongside the BM25 search on the calling thread
+        self.vector_pool = BoundedExecutor("lucene-knn", search_workers, max_queued, attach_to_jvm=True)
+        
+        # Pooled, time-limited Ollama client; at most one in-flight generation per llm_pool worker
+        self.llm = llm or OllamaGateway(
             model="llama3.2-vision",
             temperature=0.1,
             num_ctx=128000,  # Increased context window to 128k
-            repeat_penalty=1.1
+            repeat_penalty=1.1,
+            max_concurrent=max_generations
         )
+        # Settings changed at runtime survive restarts and reach read-only processes
+        self._settings_mtime = None
+        self._load_settings()
         
-        # RAG prompt template
+        # RAG prompt template. The instructions and context come first and the
+        # conversation history and question last, so prompts share a prefix that
+        # Ollama can keep evaluated between requests.
         self.prompt_template = PromptTemplate(
-            input_variables=["context", "question"],
+            input_variables=["context", "history", "question"],
             template="""You are a helpful AI assistant. Your task is to provide a clear and complete answer to the question using only the information from the context below.
 
-Context:
-{context}
-
-Question: {question}
-
 Instructions:
 1. Use ONLY the information provided in the context
 2. Include ALL relevant information from the context, especially lists and bullet points
@@ -60,212 +189,1195 @@ Instructions:
 5. Do not add any information beyond what's in the context
 6. Start your response directly with the answer
 
+Context:
+{context}
+
+{history}Question: {question}
+
 Answer:"""
         )
 
+    def _active_index_path(self) -> str:
+        """Directory of the live index, named by the ACTIVE pointer file (index_dir itself if absent).
+
+        The pointer lets a reindex switch indexes atomically even though
+        index_dir itself may be a mount point that cannot be renamed.
+        """
+        try:
+            with open(os.path.join(self.index_dir, ACTIVE_FILE)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return self.index_dir
+        return os.path.join(self.index_dir, name) if name else self.index_dir
+
+    def _set_active_index(self, path: str):
+        """Atomically point ACTIVE at a subdirectory of index_dir."""
+        tmp_path = os.path.join(self.index_dir, ACTIVE_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(os.path.basename(path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.index_dir, ACTIVE_FILE))
+
+    def _remove_index(self, path: str):
+        """Delete an index that is no longer active."""
+        if path != self.index_dir:
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        # An index created before the ACTIVE pointer lives directly in index_dir
+        for name in os.listdir(path):
+            file_path = os.path.join(path, name)
+            if name.startswith(SHARD_DIR_PREFIX) and os.path.isdir(file_path):
+                shutil.rmtree(file_path, ignore_errors=True)
+            elif os.path.isfile(file_path) and name not in (ACTIVE_FILE, COMMIT_FILE, SETTINGS_FILE):
+                os.remove(file_path)
+
+    def _remove_stale_indexes(self):
+        """Delete leftovers of reindexes that were interrupted before their swap."""
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith(INDEX_DIR_PREFIX) and path != self.active_index_path and os.path.isdir(path):
+                logger.info("Removing unfinished index %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _writer_config(self) -> IndexWriterConfig:
+        config = IndexWriterConfig(self.analyzer)
+        config.setSimilarity(self.similarity)
+        config.setCommitOnClose(True)
+        if self.expunge_deletes_ratio:
+            # forceMergeDeletes only rewrites segments above the same threshold
+            policy = TieredMergePolicy()
+            policy.setForceMergeDeletesPctAllowed(min(100.0, self.expunge_deletes_ratio * 100))
+            config.setMergePolicy(policy)
+        return config
+
+    def _open_writer(self):
+        """Open the shard writers and searcher managers backed by them."""
+        num_shards = detect_num_shards(self.active_index_path) or self.num_shards
+        if num_shards != self.num_shards:
+            logger.warning("Index %s has %d shards, not the configured %d; reindex to reshard",
+                           self.active_index_path, num_shards, self.num_shards)
+        # Searchers are opened from the writers, so uncommitted changes become
+        # visible on refresh.
+        self.index = ShardedIndex(self.active_index_path, num_shards, self._writer_config,
+                                  executor=self.search_executor, directory=self.directory)
+        self.index.open_searchers()
+        self._publish_commit()
+
+    def _open_reader(self):
+        """Open searchers over the last commit, waiting for the writer process to publish one."""
+        while True:
+            token = self._read_commit_token()
+            if token is not None:
+                self.active_index_path = self._active_index_path()
+                index = ShardedIndex(self.active_index_path, self._token_shards(token), read_only=True,
+                                     executor=self.search_executor, directory=self.directory)
+                if index.exists():
+                    break
+                index.close()
+            logger.info("Waiting for the writer process to create the index in %s", self.index_dir)
+            time.sleep(1)
+        self.index = index
+        self.index.open_searchers()
+        self._commit_token = token
+        self.last_commit_at = self._commit_time()
+
+    def _close_index(self):
+        """Close the searcher managers and the index writers."""
+        self.index.close()
+
+    @contextmanager
+    def acquire_searcher(self):
+        """Borrow a searcher over the current state of every shard, releasing it when done."""
+        with self.acquire_index() as (_, searcher):
+            yield searcher
+
+    @contextmanager
+    def acquire_index(self):
+        """Borrow the current index together with a searcher over it.
+
+        Content references in the searcher's documents point into this
+        index's content store, which may no longer be `self.index` after a
+        reindex swap.
+        """
+        lease = ExitStack()
+        with metrics.timer("acquire"):
+            while True:
+                index = self.index
+                try:
+                    searcher = lease.enter_context(index.acquire())
+                    break
+                except lucene.JavaError:
+                    # Closed by a reindex swap in the meantime; retry with the new index
+                    if index is self.index:
+                        raise
+        with lease:
+            yield index, searcher
+
+    def commit(self, index: Optional[ShardedIndex] = None, shard: Optional[int] = None):
+        """Commit pending writes to disk, on every shard unless one is given."""
+        with metrics.timer("commit"):
+            (index or self.index).commit(shard)
+        if index is None or index is self.index:
+            self._publish_commit()
+            # Shard threads of a bulk write commit concurrently; deletes are
+            # expunged once, by the thread that routed the write
+            if shard is None:
+                self._expunge_deletes()
+
+    def _expunge_deletes(self):
+        if self.expunge_deletes_ratio:
+            for path in self.index.expunge_deletes(self.expunge_deletes_ratio):
+                logger.info("Merging away deleted documents in %s", path)
+
+    def _publish_commit(self):
+        """Record the live index and the commit generation of each shard in COMMIT for read-only processes."""
+        with self._publish_lock:
+            generations = ",".join(str(generation) for generation in self.index.commit_generations())
+            token = f"{os.path.relpath(self.active_index_path, self.index_dir)} {generations}"
+            tmp_path = os.path.join(self.index_dir, f"{COMMIT_FILE}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(token)
+            os.replace(tmp_path, os.path.join(self.index_dir, COMMIT_FILE))
+            self.last_commit_at = time.time()
+
+    def _commit_time(self) -> Optional[float]:
+        """When the writer process last published a commit."""
+        try:
+            return os.path.getmtime(os.path.join(self.index_dir, COMMIT_FILE))
+        except FileNotFoundError:
+            return None
+
+    def _read_commit_token(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.index_dir, COMMIT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _token_shards(token: str) -> int:
+        """Number of shards in a COMMIT token (one commit generation per shard)."""
+        return len(token.rpartition(" ")[2].split(","))
+
+    def refresh(self):
+        """Make all changes made through the writer visible to new searchers."""
+        with metrics.timer("refresh"):
+            self.index.refresh()
+        self.generation += 1
+
+    def _refresh_loop(self):
+        """Periodically refresh searchers from a background thread."""
+        lucene.getVMEnv().attachCurrentThread()
+        while not self._refresh_stop.wait(self.refresh_interval):
+            try:
+                self.index.refresh(blocking=False)
+            except Exception as e:
+                logger.error("Error refreshing searcher: %s", e)
+
+    def _watch_commits(self):
+        """Reopen searchers whenever the writer process publishes a commit (read-only mode).
+
+        Polling COMMIT is a single small file read, so readers can check often.
+        A reopen only loads the segments that changed; after a reindex the
+        ACTIVE pointer names a new directory and the reader switches to it.
+        """
+        lucene.getVMEnv().attachCurrentThread()
+        while not self._refresh_stop.wait(self.refresh_interval or 0.5):
+            try:
+                self._load_settings()
+            except Exception as e:
+                logger.error("Error loading settings: %s", e)
+            token = self._read_commit_token()
+            if token == self._commit_token:
+                continue
+            try:
+                path = self._active_index_path()
+                if path != self.active_index_path or self._token_shards(token) != self.index.num_shards:
+                    self._switch_index(path, self._token_shards(token))
+                else:
+                    with metrics.timer("refresh"):
+                        self.index.refresh()
+                # Folder markers and content hashes are read from the index, so they follow it
+                self.known_folders = self._load_folders()
+                self.content_hashes = self._load_content_hashes()
+                self._commit_token = token
+                self.last_commit_at = self._commit_time()
+                self.generation += 1
+            except Exception as e:
+                # e.g. a commit replaced while it was being opened; retried on the next poll
+                logger.error("Error reopening index: %s", e)
+
+    def _switch_index(self, path: str, num_shards: int):
+        """Point a read-only process at the index directory a reindex switched to."""
+        index = ShardedIndex(path, num_shards, read_only=True, executor=self.search_executor,
+                             directory=self.directory)
+        index.open_searchers()
+        old_index, self.index = self.index, index
+        self.active_index_path = path
+        logger.info("Switched to reindexed index %s", path)
+        # Searchers still borrowed from the old managers stay usable until released
+        old_index.close()
+
+    def _load_folders(self) -> set:
+        """Load the set of folder paths that have a marker in the index."""
+        folders = set()
+        with self.acquire_searcher() as searcher:
+            # Walk the postings of the marker id instead of collecting top hits,
+            # which would allocate a queue as large as the index
+            for context in searcher.getIndexReader().leaves():
+                leaf = context.reader()
+                markers = leaf.postings(Term("id", ".folder"))
+                if markers is None:
+                    continue
+                live_docs = leaf.getLiveDocs()
+                stored_fields = leaf.storedFields()
+                doc = markers.nextDoc()
+                while doc != DocIdSetIterator.NO_MORE_DOCS:
+                    if live_docs is None or live_docs.get(doc):
+                        folders.add(stored_fields.document(doc).get("folder_path") or "")
+                    doc = markers.nextDoc()
+        return folders
+
+    def _load_content_hashes(self) -> dict:
+        """Load the content hash of every document, keyed by doc_key, from doc values."""
+        hashes = {}
+        with self.acquire_searcher() as searcher:
+            for leaf in searcher.getIndexReader().leaves():
+                reader = leaf.reader()
+                live_docs = reader.getLiveDocs()
+                # Only parent documents carry a content hash
+                values = DocValues.getSorted(reader, "content_hash")
+                keys = DocValues.getSorted(reader, "doc_key")
+                doc = values.nextDoc()
+                while doc != DocIdSetIterator.NO_MORE_DOCS:
+                    if (live_docs is None or live_docs.get(doc)) and keys.advanceExact(doc):
+                        key = keys.lookupOrd(keys.ordValue()).utf8ToString()
+                        hashes[key] = values.lookupOrd(values.ordValue()).utf8ToString()
+                    doc = values.nextDoc()
+        return hashes
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        """Fingerprint of a document's content: the SHA-256 hex digest of its UTF-8 bytes."""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def is_unchanged(self, content: str, doc_id: str, folder_path: str = "") -> bool:
+        """Whether the document is already indexed with exactly this content."""
+        return self.content_hashes.get(self.doc_key(doc_id, folder_path)) == self.content_hash(content)
+
+    def _forget_content_hashes(self, folder_path: str):
+        """Drop the hashes of all documents in a folder subtree."""
+        self.content_hashes = {
+            key: value for key, value in self.content_hashes.items()
+            if not is_within(key.rpartition("/")[0], folder_path)
+        }
+
+    def _document_query(self, doc_id: str, folder_path: str = ""):
+        """Build the query matching a document by ID and folder path."""
+        query = BooleanQuery.Builder()
+        query.add(TermQuery(Term("id", doc_id)), BooleanClause.Occur.MUST)
+        query.add(TermQuery(Term("folder_path", folder_path or "")), BooleanClause.Occur.MUST)
+        return query.build()
+
+    @staticmethod
+    def doc_key(doc_id: str, folder_path: str = "") -> str:
+        """Unique key of a document or folder marker, used for sorting and pagination."""
+        return f"{folder_path}/{doc_id}" if folder_path else doc_id
+
+    def _add_key_fields(self, doc: Document, doc_id: str, folder_path: str = ""):
+        """Add the indexed and sortable doc_key to a listable (non-passage) document."""
+        key = self.doc_key(doc_id, folder_path)
+        doc.add(Field("doc_key", key, StringField.TYPE_NOT_STORED))
+        doc.add(SortedDocValuesField("doc_key", BytesRef(key)))
+
+    def _add_ancestor_fields(self, doc: Document, folder_path: str = ""):
+        """Index every ancestor of the folder so a whole subtree matches a single term."""
+        for path in ancestors(folder_path or ""):
+            doc.add(Field("folder_ancestor", path, StringField.TYPE_NOT_STORED))
+
+    def _write_folder(self, folder_path: str, index: Optional[ShardedIndex] = None):
+        """Add a folder marker to the writer of its shard without committing."""
+        index = index or self.index
+        key = self.doc_key(".folder", folder_path)
+        writer = index.writer_for(key)
+        doc = Document()
+        doc.add(Field("id", ".folder", StringField.TYPE_STORED))
+        doc.add(Field("folder_path", folder_path, StringField.TYPE_STORED))
+        doc.add(Field("kind", "folder", StringField.TYPE_STORED))
+        self._add_key_fields(doc, ".folder", folder_path)
+        self._add_ancestor_fields(doc, folder_path)
+
+        writer.deleteDocuments(self._document_query(".folder", folder_path))
+        writer.addDocument(doc)
+        index.mark_pending(key)
+        self.known_folders.add(folder_path)
+
+    def _prepare_passages(self, contents: List[str]) -> List[Tuple[list, Optional[list]]]:
+        """Chunk documents and embed all of their passages in a single batch.
+
+        Returns a (passages, vectors) pair per document; vectors is None when
+        no embedder is configured.
+        """
+        with metrics.timer("analyze"):
+            chunked = [chunk_markdown(c, self.passage_max_chars, self.passage_overlap_chars) for c in contents]
+        if self.embedder is None:
+            return [(passages, None) for passages in chunked]
+        
+        texts = [p.text for passages in chunked for p in passages]
+        with metrics.timer("embed"):
+            vectors = self.embedder.embed_documents(texts) if texts else []
+        prepared = []
+        position = 0
+        for passages in chunked:
+            prepared.append((passages, vectors[position:position + len(passages)]))
+            position += len(passages)
+        return prepared
+
+    def _write_document(self, content: str, doc_id: str, folder_path: str = "",
+                        passages: Optional[list] = None, vectors: Optional[list] = None,
+                        index: Optional[ShardedIndex] = None):
+        """Add a document (and its missing parent folder) to its shard's writer without committing.
+
+        Passages and their vectors can be passed in when they were prepared in a
+        batch. Passages go to the same shard as their document.
+        """
+        index = index or self.index
+        key = self.doc_key(doc_id, folder_path)
+        writer = index.writer_for(key)
+        if doc_id != ".folder" and folder_path and not self.folder_exists(folder_path):
+            logger.debug("Creating parent folder: %s", folder_path)
+            self._write_folder(folder_path, index)
+
+        # The content itself goes to the content store; the parent document and
+        # its passages keep a reference to it. Passages carry the same id and
+        # folder_path so deletes by document remove them too.
+        with metrics.timer("store"):
+            content_ref = index.content.put(key, content)
+        doc = Document()
+        doc.add(StoredField("content_ref", str(content_ref)))
+        doc.add(Field("id", doc_id, StringField.TYPE_STORED))
+        doc.add(Field("folder_path", folder_path or "", StringField.TYPE_STORED))
+        doc.add(Field("kind", "document", StringField.TYPE_STORED))
+        # Per-folder document counts are computed from this doc values field
+        doc.add(SortedDocValuesField("document_folder", BytesRef(folder_path or "")))
+        content_hash = self.content_hash(content)
+        doc.add(StoredField("content_hash", content_hash))
+        doc.add(SortedDocValuesField("content_hash", BytesRef(content_hash)))
+        self._add_key_fields(doc, doc_id, folder_path)
+        self._add_ancestor_fields(doc, folder_path)
+
+        if passages is None:
+            passages, vectors = self._prepare_passages([content])[0]
+        with metrics.timer("analyze"):
+            sketch = minhash.encode(minhash.sketch(content))
+
+        with metrics.timer("add_document"):
+            writer.deleteDocuments(self._document_query(doc_id, folder_path))
+            writer.addDocument(doc)
+            for i, passage in enumerate(passages):
+                vector = vectors[i] if vectors else None
+                writer.addDocument(self._build_passage(passage, doc_id, folder_path, content_ref, vector, sketch))
+        index.mark_pending(key)
+        self.content_hashes[key] = content_hash
+        metrics.DOCUMENTS_INDEXED.inc()
+
+    def _build_passage(self, passage, doc_id: str, folder_path: str, content_ref: int,
+                       vector: Optional[List[float]] = None, sketch: Optional[str] = None) -> Document:
+        """Build the child Lucene document for one passage of a file.
+
+        The passage text is only indexed; it is read back from the content
+        store by its offsets. The parent's key and MinHash sketch are kept in
+        doc values, so search candidates can be grouped and diversified
+        without loading stored fields.
+        """
+        doc = Document()
+        doc.add(Field("passage", passage.text, TextField.TYPE_NOT_STORED))
+        if vector is not None:
+            doc.add(KnnFloatVectorField("passage_vector", JArray('float')(vector), VectorSimilarityFunction.COSINE))
+        if passage.heading and passage.heading not in passage.text:
+            # Index the section heading so passages deep in a section still match it
+            doc.add(Field("passage", passage.heading, TextField.TYPE_NOT_STORED))
+        doc.add(Field("id", doc_id, StringField.TYPE_STORED))
+        doc.add(Field("folder_path", folder_path or "", StringField.TYPE_STORED))
+        doc.add(Field("kind", "passage", StringField.TYPE_STORED))
+        self._add_ancestor_fields(doc, folder_path)
+        doc.add(StoredField("passage_ord", passage.ordinal))
+        doc.add(StoredField("start_offset", passage.start))
+        doc.add(StoredField("end_offset", passage.end))
+        doc.add(StoredField("content_ref", str(content_ref)))
+        doc.add(SortedDocValuesField("parent_key", BytesRef(self.doc_key(doc_id, folder_path))))
+        if sketch is not None:
+            doc.add(BinaryDocValuesField("parent_sketch", BytesRef(sketch)))
+        return doc
+
     def create_folder(self, folder_path: str):
         """Create a folder marker in the index."""
         try:
-            print(f"Creating folder marker for: {folder_path}")
-            doc = Document()
-            doc.add(Field("content", "", TextField.TYPE_STORED))
-            doc.add(Field("id", ".folder", StringField.TYPE_STORED))
-            doc.add(Field("folder_path", folder_path, StringField.TYPE_STORED))
-            
-            query = BooleanQuery.Builder()
-            query.add(TermQuery(Term("id", ".folder")), BooleanClause.Occur.MUST)
-            query.add(TermQuery(Term("folder_path", folder_path)), BooleanClause.Occur.MUST)
-            
-            self.writer.deleteDocuments(query.build())
-            self.writer.addDocument(doc)
-            self.writer.commit()
-            return True
+            with self.write_lock:
+                logger.debug("Creating folder marker for: %s", folder_path)
+                self._write_folder(folder_path)
+                self.commit()
+                self.refresh()
+                return True
         except Exception as e:
-            print(f"Error creating folder: {str(e)}")
+            logger.error("Error creating folder: %s", e)
             raise
 
     def folder_exists(self, folder_path: str) -> bool:
         """Check if a folder exists in the index."""
+        return folder_path in self.known_folders
+
+    def index_document(self, content: str, doc_id: str, folder_path: str = "") -> bool:
+        """Index a single document; returns False when it was already indexed with the same content."""
         try:
-            if DirectoryReader.indexExists(self.store):
-                reader = DirectoryReader.open(self.store)
-                searcher = IndexSearcher(reader)
-                
-                query = BooleanQuery.Builder()
-                query.add(TermQuery(Term("id", ".folder")), BooleanClause.Occur.MUST)
-                query.add(TermQuery(Term("folder_path", folder_path)), BooleanClause.Occur.MUST)
-                
-                hits = searcher.search(query.build(), 1)
-                total_hits = hits.totalHits.value
-                reader.close()
-                return total_hits > 0
-            return False
+            with self.write_lock:
+                if self.is_unchanged(content, doc_id, folder_path):
+                    logger.debug("Skipping unchanged document: %s in folder: %s", doc_id, folder_path)
+                    return False
+                logger.debug("Indexing document: %s in folder: %s", doc_id, folder_path)
+                self._write_document(content, doc_id, folder_path)
+                self.commit()
+                self.refresh()
+                logger.debug("Successfully indexed document: %s", doc_id)
+                return True
         except Exception as e:
-            print(f"Error checking folder existence: {str(e)}")
-            return False
+            logger.error("Error indexing document: %s", e)
+            raise
+
+    def index_documents(self, documents: Iterable, commit_docs: Optional[int] = None,
+                        commit_bytes: Optional[int] = None) -> BulkIndexOutput:
+        """Index many documents, committing once per batch instead of once per document.
 
-    def index_document(self, content: str, doc_id: str, folder_path: str = ""):
-        """Index a single document."""
+        Items may be DocumentInput instances or exceptions raised while parsing
+        them; the latter are reported as failed without aborting the batch.
+        """
+        started = time.perf_counter()
         try:
-            print(f"Indexing document: {doc_id} in folder: {folder_path}")
-            if doc_id != ".folder" and folder_path and not self.folder_exists(folder_path):
-                print(f"Creating parent folder: {folder_path}")
-                self.create_folder(folder_path)
-
-            doc = Document()
-            doc.add(Field("content", content, TextField.TYPE_STORED))
-            doc.add(Field("id", doc_id, StringField.TYPE_STORED))
-            doc.add(Field("folder_path", folder_path or "", StringField.TYPE_STORED))
-            
-            query = BooleanQuery.Builder()
-            query.add(TermQuery(Term("id", doc_id)), BooleanClause.Occur.MUST)
-            query.add(TermQuery(Term("folder_path", folder_path or "")), BooleanClause.Occur.MUST)
-            
-            self.writer.deleteDocuments(query.build())
-            self.writer.addDocument(doc)
-            self.writer.commit()
-            print(f"Successfully indexed document: {doc_id}")
+            with self.write_lock:
+                items, indexed, unchanged, failed, commits = self._add_documents_sharded(
+                    self.index, documents, commit_docs, commit_bytes
+                )
+                self.refresh()
         except Exception as e:
-            print(f"Error indexing document: {str(e)}")
+            logger.error("Error in bulk indexing: %s", e)
             raise
 
+        elapsed = time.perf_counter() - started
+        return BulkIndexOutput(
+            items=items,
+            indexed=indexed,
+            unchanged=unchanged,
+            failed=failed,
+            commits=commits,
+            elapsed_seconds=round(elapsed, 3),
+            docs_per_sec=round(indexed / elapsed, 1) if elapsed > 0 else 0.0
+        )
+
+    def _add_documents(self, index: ShardedIndex, documents: Iterable, commit_docs: Optional[int] = None,
+                       commit_bytes: Optional[int] = None,
+                       progress: Optional[Callable[[int, int], None]] = None,
+                       skip_unchanged: bool = True, shard: Optional[int] = None) -> Tuple[list, int, int, int, int]:
+        """Write documents with group commits; returns (items, indexed, unchanged, failed, commits).
+
+        Documents already indexed with identical content are skipped unless
+        `skip_unchanged` is False. `progress` is called with the running
+        indexed and failed counts after every embedding group. When all
+        documents belong to one `shard`, only that shard is committed.
+        """
+        commit_docs = commit_docs or self.bulk_commit_docs
+        commit_bytes = commit_bytes or self.bulk_commit_bytes
+        items = []
+        indexed = unchanged = failed = commits = 0
+        pending_docs = pending_bytes = 0
+
+        numbered = enumerate(documents)
+        while True:
+            group = list(itertools.islice(numbered, self.embed_batch_docs))
+            if not group:
+                break
+            skipped = set()
+            if skip_unchanged:
+                skipped = {
+                    i for i, d in group
+                    if not isinstance(d, Exception) and d.id != ".folder"
+                    and self.is_unchanged(d.content, d.id, d.folder_path)
+                }
+            # Chunk and embed the whole group at once
+            to_prepare = [
+                (i, d) for i, d in group
+                if not isinstance(d, Exception) and d.id != ".folder" and i not in skipped
+            ]
+            prepared = dict(zip(
+                (i for i, _ in to_prepare),
+                self._prepare_passages([d.content for _, d in to_prepare])
+            ))
+
+            for i, document in group:
+                if isinstance(document, Exception):
+                    items.append(BulkItemStatus(index=i, status="failed", error=str(document)))
+                    failed += 1
+                    continue
+                if i in skipped:
+                    items.append(BulkItemStatus(index=i, id=document.id, folder_path=document.folder_path,
+                                                status="unchanged"))
+                    unchanged += 1
+                    continue
+
+                try:
+                    if document.id == ".folder":
+                        self._write_folder(document.folder_path, index)
+                    else:
+                        passages, vectors = prepared[i]
+                        self._write_document(document.content, document.id, document.folder_path,
+                                             passages, vectors, index)
+                except Exception as e:
+                    logger.error("Error indexing document %s: %s", document.id, e)
+                    items.append(BulkItemStatus(index=i, id=document.id, folder_path=document.folder_path,
+                                                status="failed", error=str(e)))
+                    failed += 1
+                    continue
+
+                items.append(BulkItemStatus(index=i, id=document.id, folder_path=document.folder_path,
+                                            status="indexed"))
+                indexed += 1
+                pending_docs += 1
+                pending_bytes += len(document.content)
+
+                if pending_docs >= commit_docs or pending_bytes >= commit_bytes:
+                    self.commit(index, shard)
+                    commits += 1
+                    pending_docs = pending_bytes = 0
+
+            if progress is not None:
+                progress(indexed, failed)
+
+        if pending_docs:
+            self.commit(index, shard)
+            commits += 1
+        return items, indexed, unchanged, failed, commits
+
+    def _add_documents_sharded(self, index: ShardedIndex, documents: Iterable, commit_docs: Optional[int] = None,
+                               commit_bytes: Optional[int] = None,
+                               progress: Optional[Callable[[int, int], None]] = None,
+                               skip_unchanged: bool = True) -> Tuple[list, int, int, int, int]:
+        """Like _add_documents, but every shard is written (and committed) from its own thread.
+
+        The calling thread routes documents to per-shard queues. It writes
+        folder markers itself, including missing parent folders, so shard
+        threads never race to create the same marker. Each marker's shard is
+        committed before any document of its folder is routed, so a commit by
+        a shard thread never makes documents durable under a folder marker
+        that is not.
+        """
+        if index.num_shards == 1:
+            return self._add_documents(index, documents, commit_docs, commit_bytes, progress, skip_unchanged)
+
+        queues = [queue.Queue(maxsize=self.embed_batch_docs * 2) for _ in index.shards]
+        positions = [[] for _ in index.shards]  # input position of each document, per shard
+        results = [None] * index.num_shards
+        shard_progress = [(0, 0)] * index.num_shards
+        errors = []
+        items = []
+        indexed = failed = marker_commits = 0
+
+        def report(shard: int, shard_indexed: int, shard_failed: int):
+            shard_progress[shard] = (shard_indexed, shard_failed)
+            if progress is not None:
+                progress(indexed + sum(i for i, _ in shard_progress), failed + sum(f for _, f in shard_progress))
+
+        def drain(shard: int):
+            while True:
+                entry = queues[shard].get()
+                if entry is None:
+                    return
+                positions[shard].append(entry[0])
+                yield entry[1]
+
+        def write_shard(shard: int):
+            attach_jvm()
+            try:
+                results[shard] = self._add_documents(
+                    index, drain(shard), commit_docs, commit_bytes,
+                    lambda i, f: report(shard, i, f), skip_unchanged, shard
+                )
+            except Exception as e:
+                errors.append(e)
+                # Keep consuming so the routing thread never blocks on a full queue
+                for _ in drain(shard):
+                    pass
+
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(write_shard, shard),
+                             name=f"lucene-shard-{shard}")
+            for shard in range(index.num_shards)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for position, document in enumerate(documents):
+                if errors:
+                    break
+                if isinstance(document, Exception):
+                    items.append(BulkItemStatus(index=position, status="failed", error=str(document)))
+                    failed += 1
+                    continue
+                if document.id == ".folder" or (document.folder_path and not self.folder_exists(document.folder_path)):
+                    try:
+                        self._write_folder(document.folder_path, index)
+                        marker_key = self.doc_key(".folder", document.folder_path)
+                        self.commit(index, shard_of(marker_key, index.num_shards))
+                        marker_commits += 1
+                    except Exception as e:
+                        logger.error("Error indexing folder %s: %s", document.folder_path, e)
+                        items.append(BulkItemStatus(index=position, id=document.id, folder_path=document.folder_path,
+                                                    status="failed", error=str(e)))
+                        failed += 1
+                        continue
+                    if document.id == ".folder":
+                        items.append(BulkItemStatus(index=position, id=document.id,
+                                                    folder_path=document.folder_path, status="indexed"))
+                        indexed += 1
+                        continue
+                shard = shard_of(self.doc_key(document.id, document.folder_path), index.num_shards)
+                queues[shard].put((position, document))
+        finally:
+            for shard_queue in queues:
+                shard_queue.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+        unchanged = 0
+        commits = marker_commits
+        for shard, (shard_items, shard_indexed, shard_unchanged, shard_failed, shard_commits) in enumerate(results):
+            for item in shard_items:
+                item.index = positions[shard][item.index]
+            items.extend(shard_items)
+            indexed += shard_indexed
+            unchanged += shard_unchanged
+            failed += shard_failed
+            commits += shard_commits
+        if index is self.index:
+            self._expunge_deletes()
+        items.sort(key=lambda item: item.index)
+        return items, indexed, unchanged, failed, commits
+
+    def plan_sync(self, entries: List[SyncEntry], folder_path: str = "") -> SyncPlan:
+        """Compare a manifest of (path, hash) entries with the index.
+
+        Returns the paths that are new or changed, and the indexed paths
+        within `folder_path` that are missing from the manifest.
+        """
+        folder_path = folder_path.strip("/")
+        hashes = dict(self.content_hashes)
+        upload = []
+        seen = set()
+        for entry in entries:
+            path = entry.path.strip("/")
+            seen.add(path)
+            if hashes.get(path) != entry.hash.lower():
+                upload.append(path)
+        delete = sorted(
+            key for key in hashes
+            if key not in seen and (not folder_path or is_within(key.rpartition("/")[0], folder_path))
+        )
+        return SyncPlan(upload=upload, delete=delete, unchanged=len(seen) - len(upload))
+
+    def _subtree_query(self, folder_path: str):
+        """Match everything in a folder and all of its subfolders."""
+        query = BooleanQuery.Builder()
+        query.add(TermQuery(Term("folder_ancestor", folder_path)), BooleanClause.Occur.SHOULD)
+        # Direct children indexed before folder ancestors were introduced
+        query.add(TermQuery(Term("folder_path", folder_path)), BooleanClause.Occur.SHOULD)
+        return query.build()
+
     def delete_document(self, doc_id: str, folder_path: str = "") -> bool:
-        """Delete a document by ID and folder path."""
+        """Delete a document by ID and folder path. Deleting ".folder" deletes the whole folder."""
+        if doc_id == ".folder":
+            return self.delete_folder(folder_path)
+        try:
+            with self.write_lock:
+                self.index.writer_for(self.doc_key(doc_id, folder_path)).deleteDocuments(
+                    self._document_query(doc_id, folder_path)
+                )
+                self.content_hashes.pop(self.doc_key(doc_id, folder_path), None)
+                self.commit()
+                self.refresh()
+                return True
+        except Exception as e:
+            logger.error("Error deleting document: %s", e)
+            raise
+
+    def delete_folder(self, folder_path: str) -> bool:
+        """Delete a folder, its subfolders and all of their documents with a single delete."""
+        try:
+            with self.write_lock:
+                self.index.delete(self._subtree_query(folder_path))
+                self.known_folders = {f for f in self.known_folders if not is_within(f, folder_path)}
+                self._forget_content_hashes(folder_path)
+                self.commit()
+                self.refresh()
+                return True
+        except Exception as e:
+            logger.error("Error deleting folder: %s", e)
+            raise
+
+    def move_folder(self, source: str, destination: str) -> int:
+        """Move a folder and everything below it to a new path.
+
+        Documents are re-added under the new path from a point-in-time
+        searcher, then the old subtree is removed with a single delete and
+        everything is committed once. Returns the number of documents moved.
+        """
+        source = source.strip("/")
+        destination = destination.strip("/")
+        if not source or not destination:
+            raise ValueError("Source and destination folders are required")
+        if is_within(destination, source):
+            raise ValueError("Cannot move a folder into itself")
+        try:
+            with self.write_lock:
+                moved = 0
+                for document in self.iter_documents(folder_path=source, include_content=True):
+                    new_folder = destination + document.folder_path[len(source):]
+                    if document.id == ".folder":
+                        self._write_folder(new_folder)
+                    else:
+                        self._write_document(document.content or "", document.id, new_folder)
+                        moved += 1
+                self._write_folder(destination)
+                self.index.delete(self._subtree_query(source))
+                self.known_folders = {f for f in self.known_folders if not is_within(f, source)}
+                self._forget_content_hashes(source)
+                self.commit()
+                self.refresh()
+                return moved
+        except Exception as e:
+            logger.error("Error moving folder: %s", e)
+            raise
+
+    def folder_document_counts(self) -> dict:
+        """Live documents directly inside each folder, cached per index generation.
+
+        Counts are kept per segment, so a new generation only reads the
+        segments that were added or had documents deleted.
+        """
+        cached = self._folder_counts
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        generation = self.generation
+        with self.acquire_index() as (index, _):
+            counts = index.folder_counts()
+        self._folder_counts = (generation, counts)
+        return counts
+
+    def get_folder_tree(self) -> FolderNode:
+        """Folder tree with per-folder document counts, cached per index generation."""
+        try:
+            cached = self._folder_tree
+            if cached is not None and cached[0] == self.generation:
+                return cached[1]
+            generation = self.generation
+            tree = build_folder_tree(self.known_folders, self.folder_document_counts())
+            self._folder_tree = (generation, tree)
+            return tree
+        except Exception as e:
+            logger.error("Error building folder tree: %s", e)
+            raise
+
+    @staticmethod
+    def _stored_content(index: ShardedIndex, doc) -> str:
+        """Content of a document or folder marker, from the content store of its index.
+
+        Documents indexed before the content store was introduced still hold
+        their content in a stored field until the next reindex.
+        """
+        content_ref = doc.get("content_ref")
+        if content_ref is None:
+            return doc.get("content") or ""
+        return index.content.get(int(content_ref))
+
+    def get_all_documents(self) -> List[DocumentOutput]:
+        """Retrieve all live documents and folder markers with their content."""
+        try:
+            docs = []
+            with self.acquire_index() as (index, searcher):
+                reader = searcher.getIndexReader()
+                live_docs = MultiBits.getLiveDocs(reader)
+                for i in range(reader.maxDoc()):
+                    if live_docs is not None and not live_docs.get(i):
+                        continue
+                    doc = searcher.storedFields().document(i)
+                    if doc.get("kind") == "passage":
+                        continue
+                    docs.append(DocumentOutput(
+                        id=doc.get("id"),
+                        content=self._stored_content(index, doc),
+                        folder_path=doc.get("folder_path") or ""
+                    ))
+            
+            return docs
+        except Exception as e:
+            logger.error("Error getting documents: %s", e)
+            raise
+
+    @staticmethod
+    def _encode_cursor(key: str) -> str:
+        return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> str:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+
+    def list_documents(self, cursor: Optional[str] = None, limit: int = 500,
+                       folder_path: Optional[str] = None, include_content: bool = False) -> DocumentPage:
+        """List documents and folder markers in doc_key order, one page at a time.
+
+        Only metadata is loaded unless include_content is set. The returned
+        next_cursor resumes after the last document of the page and stays
+        valid while documents are added or removed.
+        """
         try:
             query = BooleanQuery.Builder()
-            query.add(TermQuery(Term("id", doc_id)), BooleanClause.Occur.MUST)
-            query.add(TermQuery(Term("folder_path", folder_path or "")), BooleanClause.Occur.MUST)
+            lower = self._decode_cursor(cursor) if cursor else None
+            query.add(TermRangeQuery.newStringRange("doc_key", lower, None, False, True), BooleanClause.Occur.FILTER)
+            if folder_path:
+                query.add(self._subtree_query(folder_path), BooleanClause.Occur.FILTER)
             
-            self.writer.deleteDocuments(query.build())
+            fields = HashSet()
+            for field in METADATA_FIELDS + (("content_ref", "content") if include_content else ()):
+                fields.add(field)
             
-            if doc_id == ".folder" and DirectoryReader.indexExists(self.store):
-                reader = DirectoryReader.open(self.store)
-                searcher = IndexSearcher(reader)
-                folder_query = TermQuery(Term("folder_path", folder_path))
-                hits = searcher.search(folder_query, 1000)
-                
-                docs_to_delete = []
+            documents = []
+            with self.acquire_index() as (index, searcher):
+                hits = searcher.search(query.build(), limit, Sort(SortField("doc_key", SortField.Type.STRING)))
                 for hit in hits.scoreDocs:
-                    doc = searcher.storedFields().document(hit.doc)
-                    docs_to_delete.append((doc.get("id"), doc.get("folder_path")))
-                
-                reader.close()
-                
-                for doc_id, doc_folder in docs_to_delete:
-                    query = BooleanQuery.Builder()
-                    query.add(TermQuery(Term("id", doc_id)), BooleanClause.Occur.MUST)
-                    query.add(TermQuery(Term("folder_path", doc_folder or "")), BooleanClause.Occur.MUST)
-                    self.writer.deleteDocuments(query.build())
+                    doc = searcher.storedFields().document(hit.doc, fields)
+                    documents.append(DocumentSummary(
+                        id=doc.get("id"),
+                        folder_path=doc.get("folder_path") or "",
+                        content=self._stored_content(index, doc) if include_content else None
+                    ))
             
-            self.writer.commit()
-            return True
+            next_cursor = None
+            if len(documents) == limit:
+                last = documents[-1]
+                next_cursor = self._encode_cursor(self.doc_key(last.id, last.folder_path))
+            return DocumentPage(documents=documents, next_cursor=next_cursor)
         except Exception as e:
-            print(f"Error deleting document: {str(e)}")
+            logger.error("Error listing documents: %s", e)
             raise
 
-    def get_all_documents(self) -> List[DocumentOutput]:
-        """Retrieve all documents."""
+    def iter_documents(self, folder_path: Optional[str] = None, include_content: bool = True,
+                       page_size: int = 500) -> Iterator[DocumentSummary]:
+        """Iterate over all documents page by page, for streaming exports."""
+        cursor = None
+        while True:
+            page = self.list_documents(cursor, page_size, folder_path, include_content)
+            yield from page.documents
+            if not page.next_cursor:
+                return
+            cursor = page.next_cursor
+
+    def get_document(self, doc_id: str, folder_path: str = "") -> Optional[DocumentOutput]:
+        """Fetch a single document with its content, or None if it does not exist."""
         try:
-            print("Getting all documents")
-            if not DirectoryReader.indexExists(self.store):
-                return []
-                
-            reader = DirectoryReader.open(self.store)
-            searcher = IndexSearcher(reader)
-            
-            docs = []
-            for i in range(reader.maxDoc()):
-                doc = searcher.storedFields().document(i)
-                doc_output = DocumentOutput(
+            query = BooleanQuery.Builder()
+            query.add(self._document_query(doc_id, folder_path), BooleanClause.Occur.FILTER)
+            query.add(TermQuery(Term("kind", "passage")), BooleanClause.Occur.MUST_NOT)
+            with self.acquire_index() as (index, searcher):
+                hits = searcher.search(query.build(), 1)
+                if not hits.scoreDocs:
+                    return None
+                doc = searcher.storedFields().document(hits.scoreDocs[0].doc)
+                return DocumentOutput(
                     id=doc.get("id"),
-                    content=doc.get("content"),
+                    content=self._stored_content(index, doc),
                     folder_path=doc.get("folder_path") or ""
                 )
-                docs.append(doc_output)
-                print(f"Found document: {doc_output.id} in folder: {doc_output.folder_path}")
-            
-            reader.close()
-            return docs
         except Exception as e:
-            print(f"Error getting documents: {str(e)}")
+            logger.error("Error getting document: %s", e)
             raise
 
     def clean_query(self, query_str: str) -> str:
-        """Clean and prepare query string for Lucene."""
+        """Normalize a question to its analyzed terms, e.g. for cache keys."""
+        planner = self.query_planner
+        return ' '.join(planner.analyze(query_str) or planner.analyze(query_str, planner.fallback_analyzer))
+
+    def parse_query(self, query_str: str, searcher=None):
+        """Plan a user question into a Lucene query over passages."""
+        if searcher is not None:
+            return self.query_planner.plan(query_str, searcher.getIndexReader()).query
+        with self.acquire_searcher() as searcher:
+            return self.query_planner.plan(query_str, searcher.getIndexReader()).query
+
+    @staticmethod
+    def _folder_scope(include_folders: Optional[List[str]] = None,
+                      exclude_folders: Optional[List[str]] = None) -> Tuple[tuple, tuple]:
+        """Normalized (include, exclude) folder scopes: stripped, de-duplicated and sorted."""
+        include = tuple(sorted({f.strip("/") for f in include_folders or [] if f.strip("/")}))
+        exclude = tuple(sorted({f.strip("/") for f in exclude_folders or [] if f.strip("/")}))
+        return include, exclude
+
+    def scope_filter(self, include_folders: Optional[List[str]] = None,
+                     exclude_folders: Optional[List[str]] = None):
+        """Non-scoring filter restricting search to passages within the given folder scopes.
+
+        Filters are cached per index generation, and as identical query objects
+        they are also picked up by Lucene's per-segment query cache.
+        """
+        include, exclude = self._folder_scope(include_folders, exclude_folders)
+        cache_key = (self.generation, include, exclude)
+        cached = self.filter_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        scope = BooleanQuery.Builder()
+        # Only passages are searched; folder markers and parent documents never take result slots
+        scope.add(TermQuery(Term("kind", "passage")), BooleanClause.Occur.FILTER)
+        if include:
+            included = BooleanQuery.Builder()
+            for folder in include:
+                included.add(TermQuery(Term("folder_ancestor", folder)), BooleanClause.Occur.SHOULD)
+            scope.add(included.build(), BooleanClause.Occur.FILTER)
+        for folder in exclude:
+            scope.add(TermQuery(Term("folder_ancestor", folder)), BooleanClause.Occur.MUST_NOT)
+        
+        query = ConstantScoreQuery(scope.build())
+        self.filter_cache.put(cache_key, query, size=0)
+        return query
+
+    def _knn_search(self, searcher, query_str: str, k: int, scope) -> List[Tuple[int, float]]:
+        """Rank passages by vector similarity to the embedded question."""
+        with metrics.timer("knn"):
+            vector = self.embedder.embed_query(query_str)
+            query = KnnFloatVectorQuery("passage_vector", JArray('float')(vector), k, scope)
+            return [(hit.doc, hit.score) for hit in searcher.search(query, k).scoreDocs]
+
+    def _fuse_ranked(self, *rankings: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        """Combine rankings with reciprocal-rank fusion: score = sum of 1 / (k + rank)."""
+        fused = {}
+        for ranking in rankings:
+            for rank, (doc_num, _) in enumerate(ranking, 1):
+                fused[doc_num] = fused.get(doc_num, 0.0) + 1.0 / (self.rrf_k + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    def search(self, query_str: str, n: Optional[int] = None, include_folders: Optional[List[str]] = None,
+               exclude_folders: Optional[List[str]] = None):
+        """Search passages and return the top N documents with their matching text.
+
+        Passages are retrieved from a wider candidate pool, grouped by their
+        parent document and reranked for diversity (MMR), so near-duplicate
+        files do not crowd out other results. Only the chosen documents'
+        passages are loaded, and adjacent passages of a document are merged.
+        Results can be restricted to folder subtrees with include/exclude lists.
+        With an embedder configured, BM25 and KNN rankings are fused (RRF).
+        """
+        return self.search_with_query(query_str, n, include_folders, exclude_folders)[0]
+
+    def search_with_query(self, query_str: str, n: Optional[int] = None,
+                          include_folders: Optional[List[str]] = None,
+                          exclude_folders: Optional[List[str]] = None) -> Tuple[List[dict], object]:
+        """Like search, but also return the planned Lucene query, cached alongside the results.
+
+        Prompt building scores fragments with the same query, so it never has
+        to plan the question a second time.
+        """
         try:
-            query_str = query_str.lower()
-            stop_words = {'tell', 'me', 'what', 'how', 'is', 'are', 'the'}
-            words = query_str.split()
-            words = [w for w in words if w not in stop_words]
-            
-            query_str = ' '.join(words)
-            query_str = re.sub(r'[^\w\s+\-*"()]', '', query_str)
-            
-            words = query_str.split()
-            terms = []
-            for word in words:
-                if len(word) > 3:
-                    terms.append(f"{word}~1")
-                else:
-                    terms.append(word)
+            n = n if n is not None else self.num_results
+            # KNN embeds the raw question, so cleaning it must not merge entries
+            # that rank differently; scopes are keyed as scope_filter builds them
+            cache_key = (
+                self.generation, self.clean_query(query_str), query_str if self.embedder is not None else None,
+                n, self.mmr_lambda, self.candidate_pool, self._folder_scope(include_folders, exclude_folders)
+            )
+            cached = self.retrieval_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            query_str = ' OR '.join(terms)
-            print(f"Cleaned query: {query_str}")
-            return query_str
+            results, query = self._run_search(query_str, n, include_folders, exclude_folders)
+            self.retrieval_cache.put(cache_key, (results, query))
+            return results, query
         except Exception as e:
-            print(f"Error cleaning query: {str(e)}")
-            return query_str
+            logger.error("Error searching documents: %s", e)
+            raise
 
-    def search(self, query_str: str, n: Optional[int] = None):
-        """Search the index and return top N results."""
-        try:
-            if not DirectoryReader.indexExists(self.store):
-                return []
-                
-            reader = DirectoryReader.open(self.store)
-            searcher = IndexSearcher(reader)
-            searcher.setSimilarity(BM25Similarity())
+    def _candidates(self, searcher, ranked: List[Tuple[int, float]]) -> List[dict]:
+        """Group ranked passage hits by parent document, reading only doc values.
+
+        Returns one candidate per document in rank order, with its best score,
+        its passage hits and the parent's MinHash sketch (None for passages
+        indexed before sketches were added).
+        """
+        leaves = searcher.getIndexReader().leaves()
+        key_fields = HashSet()
+        key_fields.add("id")
+        key_fields.add("folder_path")
+        parents = {}
+        by_leaf = {}
+        for doc_num, _ in ranked:
+            by_leaf.setdefault(ReaderUtil.subIndex(doc_num, leaves), []).append(doc_num)
+        for leaf_index, doc_nums in by_leaf.items():
+            context = leaves.get(leaf_index)
+            keys = DocValues.getSorted(context.reader(), "parent_key")
+            sketches = DocValues.getBinary(context.reader(), "parent_sketch")
+            # Doc values iterators only move forward
+            for doc_num in sorted(doc_nums):
+                local = doc_num - context.docBase
+                if keys.advanceExact(local):
+                    key = keys.lookupOrd(keys.ordValue()).utf8ToString()
+                else:
+                    # Passages indexed before parent keys were added
+                    doc = searcher.storedFields().document(doc_num, key_fields)
+                    key = self.doc_key(doc.get("id"), doc.get("folder_path") or "")
+                sketch = minhash.decode(sketches.binaryValue().utf8ToString()) if sketches.advanceExact(local) else None
+                parents[doc_num] = (key, sketch)
+
+        candidates = {}
+        for doc_num, score in ranked:
+            key, sketch = parents[doc_num]
+            if key not in candidates:
+                candidates[key] = {"key": key, "score": score, "sketch": sketch, "hits": []}
+            candidates[key]["hits"].append((doc_num, score))
+        return list(candidates.values())
+
+    def _diversify(self, searcher, ranked: List[Tuple[int, float]], n: int) -> List[dict]:
+        """Pick n documents from the candidates by maximal marginal relevance.
+
+        Similarity is the Jaccard estimate of the parents' MinHash sketches
+        (see minhash.select_diverse).
+        """
+        return minhash.select_diverse(self._candidates(searcher, ranked), n, self.mmr_lambda)
+
+    @staticmethod
+    def _stage_ms(stage: str, started: float) -> float:
+        """Record a stage that began at `started` and return its duration in milliseconds."""
+        elapsed = time.perf_counter() - started
+        metrics.observe(stage, elapsed)
+        return round(elapsed * 1000, 3)
+
+    def _run_search(self, query_str: str, n: int, include_folders: Optional[List[str]] = None,
+                    exclude_folders: Optional[List[str]] = None, trace: Optional[dict] = None
+                    ) -> Tuple[List[dict], object]:
+        """Run a search without the retrieval cache, optionally recording the plan in `trace`.
+
+        Returns the results and the planned query (without the folder filter).
+        """
+        started = time.perf_counter()
+        scope = self.scope_filter(include_folders, exclude_folders)
+        pool_size = max(n * self.passage_pool_factor, self.candidate_pool)
+        grouped = {}
+        timings = {}
+        with self.acquire_index() as (index, searcher):
+            plan = self.query_planner.plan(query_str, searcher.getIndexReader())
+            timings.update(plan.timings)
+            metrics.observe("parse", (plan.timings["analyze_ms"] + plan.timings["plan_ms"]) / 1000)
+            query = BooleanQuery.Builder()
+            query.add(plan.query, BooleanClause.Occur.MUST)
+            query.add(scope, BooleanClause.Occur.FILTER)
+            query = query.build()
             
-            cleaned_query = self.clean_query(query_str)
-            parser = QueryParser("content", self.analyzer)
-            parser.setAllowLeadingWildcard(True)
-            query = parser.parse(cleaned_query)
+            # The KNN search runs concurrently with the BM25 search below
+            knn_future = None
+            try:
+                if self.embedder is not None:
+                    try:
+                        knn_future = self.vector_pool.submit(self._knn_search, searcher, query_str, pool_size, scope)
+                    except OverloadedError:
+                        pass
+                
+                searched = time.perf_counter()
+                ranked = [(hit.doc, hit.score) for hit in searcher.search(query, pool_size).scoreDocs]
+                timings["bm25_ms"] = self._stage_ms("search", searched)
+                if self.embedder is not None:
+                    waited = time.perf_counter()
+                    knn_ranked = knn_future.result() if knn_future else self._knn_search(
+                        searcher, query_str, pool_size, scope
+                    )
+                    ranked = self._fuse_ranked(ranked, knn_ranked)
+                    timings["knn_wait_ms"] = self._stage_ms("knn_wait", waited)
+            finally:
+                # The KNN search uses this lease's searcher, so it must not outlive the lease
+                # when the BM25 search fails; exception() waits for it without raising
+                if knn_future is not None and not knn_future.cancel():
+                    knn_future.exception()
             
-            n = n if n is not None else self.num_results
-            hits = searcher.search(query, n)
+            reranked = time.perf_counter()
+            chosen = self._diversify(searcher, ranked, n)
+            timings["rerank_ms"] = self._stage_ms("rerank", reranked)
             
-            results = []
-            for hit in hits.scoreDocs:
-                doc = searcher.storedFields().document(hit.doc)
-                folder_path = doc.get("folder_path") or ""
-                doc_id = doc.get("id")
-                content = doc.get("content")
-                
-                if doc_id == ".folder":
-                    continue
-                
-                print(f"\nMatched document: {doc_id}")
-                print(f"Score: {hit.score}")
-                print(f"Content preview: {content[:500] if content else 'No content'}\n")
-                    
-                full_path = os.path.join(folder_path, doc_id) if folder_path else doc_id
-                results.append({
-                    'id': doc_id,
-                    'content': content,
-                    'folder_path': folder_path,
-                    'full_path': full_path,
-                    'score': hit.score
-                })
-            reader.close()
-            # Sort results by score in descending order
-            results.sort(key=lambda x: x['score'], reverse=True)
-            return results
+            loaded = time.perf_counter()
+            for candidate in chosen:
+                unread = []
+                for doc_num, score in candidate["hits"]:
+                    doc = searcher.storedFields().document(doc_num)
+                    key = (doc.get("folder_path") or "", doc.get("id"))
+                    if key not in grouped:
+                        grouped[key] = {'score': candidate["score"], 'passages': []}
+                    passage = {
+                        'ordinal': doc.getField("passage_ord").numericValue().intValue(),
+                        'start': doc.getField("start_offset").numericValue().intValue(),
+                        'end': doc.getField("end_offset").numericValue().intValue(),
+                        # Only stored by versions before the content store
+                        'text': doc.get("passage"),
+                        'score': score
+                    }
+                    grouped[key]['passages'].append(passage)
+                    if passage['text'] is None:
+                        unread.append(passage)
+                        content_ref = int(doc.get("content_ref"))
+                if unread:
+                    # One read per document, decompressing only the blocks the passages cover
+                    texts = index.content.slices(content_ref, [(p['start'], p['end']) for p in unread])
+                    for passage, text in zip(unread, texts):
+                        passage['text'] = text
+            timings["load_ms"] = self._stage_ms("load", loaded)
+        
+        results = []
+        for (folder_path, doc_id), group in grouped.items():
+            logger.debug("Matched document: %s (score %s, %d passages)", doc_id, group['score'], len(group['passages']))
+            full_path = os.path.join(folder_path, doc_id) if folder_path else doc_id
+            results.append({
+                'id': doc_id,
+                'content': "\n\n[...]\n\n".join(merge_passages(group['passages'])),
+                'passages': group['passages'],
+                'folder_path': folder_path,
+                'full_path': full_path,
+                'score': group['score']
+            })
+        # Sort results by score in descending order
+        results.sort(key=lambda x: x['score'], reverse=True)
+        
+        if trace is not None:
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            trace.update(terms=plan.terms, lucene_query=query.toString(), timings=timings)
+        return results, plan.query
+
+    def explain_search(self, question: str, include_folders: Optional[List[str]] = None,
+                       exclude_folders: Optional[List[str]] = None) -> SearchExplanation:
+        """Run a search uncached and report the query plan and per-stage timings."""
+        try:
+            trace = {}
+            results, _ = self._run_search(question, self.num_results, include_folders, exclude_folders, trace)
+            return SearchExplanation(
+                question=question,
+                terms=[TermPlan(**term) for term in trace["terms"]],
+                lucene_query=trace["lucene_query"],
+                timings=trace["timings"],
+                results=[SourceWithScore(path=r['full_path'], score=r['score']) for r in results]
+            )
         except Exception as e:
-            print(f"Error searching documents: {str(e)}")
+            logger.error("Error explaining search: %s", e)
             raise
 
     def clean_response(self, response: str) -> str:
         """Clean and validate the response."""
+        with metrics.timer("clean_response"):
+            return self._clean_response(response)
+
+    def _clean_response(self, response: str) -> str:
         try:
             # Remove any meta-text patterns
             response = re.sub(r'Based on .*?:', '', response)
@@ -286,96 +1398,512 @@ Answer:"""
                 
             return response
         except Exception as e:
-            print(f"Error cleaning response: {str(e)}")
+            logger.error("Error cleaning response: %s", e)
             return response
 
-    def query(self, question: str) -> Tuple[str, List[SourceWithScore]]:
-        """Perform RAG query using Lucene and Ollama."""
-        try:
-            results = self.search(question)
+    def context_budget(self, question: str, history: str = "") -> int:
+        """Tokens available for context: the context window minus the template, history and answer reserve."""
+        template_tokens = estimate_tokens(
+            self.prompt_template.format(context="", history=history, question=question)
+        )
+        return max(0, self.llm.num_ctx - template_tokens - self.answer_reserve_tokens)
+
+    def build_prompt(self, question: str, results: List[dict], query=None) -> Tuple[str, List[SourceWithScore], int]:
+        """Pack the best fragments of the results into the prompt within the token budget.
+
+        `query` is the planned query the results were retrieved with; the
+        question is planned again only when it is not given.
+        """
+        query = query if query is not None else self.parse_query(question)
+        with metrics.timer("context"):
+            context, _, ranks = self.context_packer.pack(results, query, self.context_budget(question))
+            sources = [SourceWithScore(path=results[i]['full_path'], score=results[i]['score']) for i in ranks]
+            prompt = self.prompt_template.format(
+                context=context,
+                history="",
+                question=question
+            )
+        prompt_tokens = estimate_tokens(prompt)
+        metrics.PROMPT_TOKENS.observe(prompt_tokens)
+        return prompt, sources, prompt_tokens
+
+    def prepare(self, question: str, include_folders: Optional[List[str]] = None,
+                exclude_folders: Optional[List[str]] = None, session_id: Optional[str] = None
+                ) -> Tuple[Optional[str], List[SourceWithScore], int, Optional[ChatTurn]]:
+        """Retrieve context for a question and build its prompt, within a chat session if given.
+
+        Returns the prompt (None when there is no context to answer from), its
+        sources, its estimated tokens and the session turn it belongs to.
+        """
+        if session_id is None or not self.sessions_enabled:
+            results, query = self.search_with_query(question, None, include_folders, exclude_folders)
             if not results:
-                return "I don't have enough information to answer that question.", []
-            
-            # Format context with clear document separation
-            context_parts = []
-            for i, r in enumerate(results, 1):
-                content = r['content'].strip()
-                if content:  # Only include non-empty content
-                    context_parts.append(f"Document {i}:\n{content}")
-            
-            context = "\n\n---\n\n".join(context_parts)
-            sources = [SourceWithScore(path=r['full_path'], score=r['score']) for r in results]
+                return None, [], 0, None
+            return (*self.build_prompt(question, results, query), None)
+        
+        session = self.sessions.get(session_id)
+        with session.lock:
+            # Follow-up questions are searched together with terms of earlier turns
+            terms = self.query_planner.analyze(question)
+            carried = self.sessions.carried_terms(session, question, terms)
+            retrieval_query = f"{question} {' '.join(carried)}" if carried else question
+            retrieval_terms = set(terms) | set(carried)
+            scope = self._folder_scope(include_folders, exclude_folders)
+            results = session.reusable_results(retrieval_terms, self.generation, scope)
+            if results is None:
+                results, query = self.search_with_query(retrieval_query, None, include_folders, exclude_folders)
+                session.retrieval = Retrieval(retrieval_terms, self.generation, scope, results, query)
+            else:
+                logger.debug("Reusing the previous retrieval of session %s", session_id)
+                query = session.retrieval.query
+            if not results and not session.context_sections:
+                return None, [], 0, None
             
+            prompt, sources, prompt_tokens = self._build_session_prompt(session, question, query, results)
+            turn = session.begin_turn(question, terms + carried)
+        self.sessions.save(session)
+        return prompt, sources, prompt_tokens, turn
+
+    def _build_session_prompt(self, session: ChatSession, question: str, query,
+                              results: List[dict]) -> Tuple[str, List[SourceWithScore], int]:
+        """Build a chat turn's prompt, appending this turn's context to the session's pinned context.
+
+        Pinned context is only ever extended, so each prompt starts with the
+        previous one's instructions and context. It is replaced by this turn's
+        context when the index has changed or the pins leave no room for it.
+        """
+        history = session.format_history(self.session_history_tokens)
+        budget = self.context_budget(question, history)
+        if session.generation != self.generation or session.context_tokens > budget:
+            session.reset_context(self.generation)
+        with metrics.timer("context"):
+            new_results = [r for r in results if r['full_path'] not in session.pinned]
+            ranks = []
+            if new_results:
+                context, tokens, ranks = self.context_packer.pack(
+                    new_results, query, budget - session.context_tokens, len(session.pinned) + 1
+                )
+                if not ranks and session.context_sections:
+                    session.reset_context(self.generation)
+                    new_results = results
+                    context, tokens, ranks = self.context_packer.pack(new_results, query, budget)
+            if ranks:
+                session.pin(context, tokens, [new_results[i]['full_path'] for i in ranks])
+            sources = [
+                SourceWithScore(path=r['full_path'], score=r['score'])
+                for r in results if r['full_path'] in session.pinned
+            ]
             prompt = self.prompt_template.format(
-                context=context,
+                context=session.context,
+                history=history,
                 question=question
             )
+        prompt_tokens = estimate_tokens(prompt)
+        metrics.PROMPT_TOKENS.observe(prompt_tokens)
+        return prompt, sources, prompt_tokens
+
+    def _finish_turn(self, session_id: Optional[str], turn: Optional[ChatTurn], answer: str):
+        """Add a generated answer to the session history."""
+        if turn is not None:
+            self.sessions.finish_turn(session_id, turn, answer)
+
+    def _answer_cache_key(self, prompt: str) -> tuple:
+        """Key for the answer cache: index generation, prompt hash and LLM settings."""
+        return (
+            self.generation,
+            hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            self.llm.model,
+            self.llm.temperature,
+            self.llm.num_ctx,
+            self.llm.repeat_penalty
+        )
+
+    def query(self, question: str, include_folders: Optional[List[str]] = None,
+              exclude_folders: Optional[List[str]] = None,
+              session_id: Optional[str] = None) -> Tuple[str, List[SourceWithScore], int]:
+        """Perform RAG query using Lucene and Ollama, as a turn of a chat session if given.
+
+        Returns the answer, its sources and the estimated prompt size in tokens.
+        """
+        started = self._start_query()
+        try:
+            prompt, sources, prompt_tokens, turn = self.prepare(
+                question, include_folders, exclude_folders, session_id
+            )
+            if prompt is None:
+                return "I don't have enough information to answer that question.", [], 0
             
-            response = self.llm.invoke(prompt)
-            cleaned_response = self.clean_response(response)
+            cache_key = self._answer_cache_key(prompt)
+            cleaned_response = self.answer_cache.get(cache_key)
+            if cleaned_response is None:
+                cleaned_response = self.generate(prompt)
+                self.answer_cache.put(cache_key, cleaned_response)
+            self._finish_turn(session_id, turn, cleaned_response)
             
-            return cleaned_response, sources
+            return cleaned_response, sources, prompt_tokens
         except Exception as e:
-            print(f"Error querying documents: {str(e)}")
+            logger.error("Error querying documents: %s", e)
             raise
+        finally:
+            self._finish_query(question, started, "sync")
 
-    def get_stats(self) -> LuceneStats:
-        """Get Lucene index statistics."""
+    def query_stream(self, question: str, include_folders: Optional[List[str]] = None,
+                     exclude_folders: Optional[List[str]] = None,
+                     session_id: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """Perform a RAG query, yielding (event, data) pairs as the answer is generated.
+
+        Emits a "sources" event once retrieval is done, a "token" event per
+        chunk produced by Ollama and a final "done" event with the cleaned
+        answer. Closing the generator stops the generation upstream.
+        """
+        # May be driven from a worker thread that has not used the JVM yet
+        lucene.getVMEnv().attachCurrentThread()
+        started = self._start_query()
         try:
-            if not DirectoryReader.indexExists(self.store):
-                return LuceneStats(num_docs=0, index_size="0 KB")
-            
-            reader = DirectoryReader.open(self.store)
-            num_docs = reader.numDocs()
-            reader.close()
+            prompt, sources, prompt_tokens, turn = self.prepare(
+                question, include_folders, exclude_folders, session_id
+            )
+            if prompt is None:
+                yield "sources", {"sources": [], "prompt_tokens": 0, "session_id": session_id}
+                yield "done", {"answer": "I don't have enough information to answer that question."}
+                return
+
+            yield "sources", {"sources": [s.dict() for s in sources], "prompt_tokens": prompt_tokens,
+                              "session_id": session_id}
+            cache_key = self._answer_cache_key(prompt)
+            cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                self._finish_turn(session_id, turn, cached)
+                yield "token", {"text": cached}
+                yield "done", {"answer": cached}
+                return
+            for event, data in self.stream_answer(prompt):
+                if event == "done":
+                    self.answer_cache.put(cache_key, data["answer"])
+                    self._finish_turn(session_id, turn, data["answer"])
+                yield event, data
+        finally:
+            self._finish_query(question, started, "stream")
+
+    def stream_answer(self, prompt: str) -> Iterator[Tuple[str, dict]]:
+        """Generate an answer for a prompt, yielding "token" events and a final "done" event."""
+        started = time.perf_counter()
+        chunks = self.llm.stream(prompt)
+        parts = []
+        try:
+            for chunk in chunks:
+                if not parts:
+                    # Leading whitespace is dropped by clean_response anyway
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    self._stage_ms("llm_first_token", started)
+                parts.append(chunk)
+                yield "token", {"text": chunk}
+        finally:
+            # Closing the upstream stream drops the Ollama connection, which cancels the generation
+            chunks.close()
+            self._stage_ms("llm_total", started)
+
+        yield "done", {"answer": self.clean_response("".join(parts))}
+
+    async def aquery(self, question: str, include_folders: Optional[List[str]] = None,
+                     exclude_folders: Optional[List[str]] = None,
+                     session_id: Optional[str] = None) -> Tuple[str, List[SourceWithScore], int]:
+        """Non-blocking query: retrieval runs on the search pool and generation on the LLM pool."""
+        started = self._start_query()
+        try:
+            prompt, sources, prompt_tokens, turn = await self.search_pool.run(
+                self.prepare, question, include_folders, exclude_folders, session_id
+            )
+            if prompt is None:
+                return "I don't have enough information to answer that question.", [], 0
             
-            # Calculate index size
-            total_size = 0
-            for root, dirs, files in os.walk(self.index_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    total_size += os.path.getsize(file_path)
+            cache_key = self._answer_cache_key(prompt)
+            cleaned_response = self.answer_cache.get(cache_key)
+            if cleaned_response is None:
+                cleaned_response = await self.llm_pool.run(self.generate, prompt)
+                self.answer_cache.put(cache_key, cleaned_response)
+            self._finish_turn(session_id, turn, cleaned_response)
+            return cleaned_response, sources, prompt_tokens
+        finally:
+            self._finish_query(question, started, "sync")
+
+    async def aquery_stream(self, question: str, include_folders: Optional[List[str]] = None,
+                            exclude_folders: Optional[List[str]] = None,
+                            session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """Non-blocking query_stream; the generation holds one LLM pool slot while it streams."""
+        started = self._start_query()
+        try:
+            prompt, sources, prompt_tokens, turn = await self.search_pool.run(
+                self.prepare, question, include_folders, exclude_folders, session_id
+            )
+            if prompt is None:
+                yield "sources", {"sources": [], "prompt_tokens": 0, "session_id": session_id}
+                yield "done", {"answer": "I don't have enough information to answer that question."}
+                return
             
-            # Convert to human-readable format
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if total_size < 1024:
-                    break
-                total_size /= 1024
-            index_size = f"{total_size:.2f} {unit}"
+            yield "sources", {"sources": [s.dict() for s in sources], "prompt_tokens": prompt_tokens,
+                              "session_id": session_id}
+            cache_key = self._answer_cache_key(prompt)
+            cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                self._finish_turn(session_id, turn, cached)
+                yield "token", {"text": cached}
+                yield "done", {"answer": cached}
+                return
             
-            return LuceneStats(num_docs=num_docs, index_size=index_size)
+            events = self.llm_pool.iterate(self.stream_answer, prompt)
+            try:
+                async for event, data in events:
+                    if event == "done":
+                        self.answer_cache.put(cache_key, data["answer"])
+                        self._finish_turn(session_id, turn, data["answer"])
+                    yield event, data
+            finally:
+                # Stops the generation when the consumer goes away
+                await events.aclose()
+        finally:
+            self._finish_query(question, started, "stream")
+
+    def generate(self, prompt: str) -> str:
+        """Generate the complete, cleaned answer for a prompt."""
+        for event, data in self.stream_answer(prompt):
+            if event == "done":
+                return data["answer"]
+
+    def _start_query(self) -> float:
+        """Start a query trace unless the caller (e.g. an HTTP request) already did."""
+        if metrics.current_request_id() is None:
+            metrics.begin_request()
+        return time.perf_counter()
+
+    def _finish_query(self, question: str, started: float, mode: str):
+        """Count a finished query and log it with its stage timings when it was slow."""
+        elapsed = time.perf_counter() - started
+        metrics.observe("query_total", elapsed)
+        metrics.QUERIES.inc(1, mode)
+        if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+            metrics.SLOW_QUERIES.inc()
+            logger.warning(
+                "Slow query: %.0f ms request_id=%s stages=%s question=%r",
+                elapsed * 1000, metrics.current_request_id(), metrics.current_trace(), question[:200]
+            )
+
+    def metric_gauges(self) -> dict:
+        """Point-in-time gauges for /metrics: index generation, pool load and cache usage."""
+        pools = (self.search_pool, self.write_pool, self.llm_pool, self.vector_pool)
+        caches = {"retrieval": self.retrieval_cache, "answer": self.answer_cache, "filter": self.filter_cache,
+                  "sessions": self.sessions.cache}
+        return {
+            "rag_index_generation": ("Searcher refreshes since startup", [({}, self.generation)]),
+            "rag_pool_pending": ("Tasks running or queued per worker pool",
+                                 [({"pool": pool.name}, pool.pending) for pool in pools]),
+            "rag_cache_entries": ("Entries per cache", [({"cache": name}, cache.stats()["entries"])
+                                                         for name, cache in caches.items()]),
+            "rag_cache_bytes": ("Estimated bytes per cache", [({"cache": name}, cache.bytes)
+                                                               for name, cache in caches.items()]),
+            "rag_cache_hits": ("Cache hits since startup", [({"cache": name}, cache.hits)
+                                                            for name, cache in caches.items()]),
+            "rag_cache_misses": ("Cache misses since startup", [({"cache": name}, cache.misses)
+                                                                for name, cache in caches.items()])
+        }
+
+    def pool_stats(self) -> dict:
+        """Load of the search, write and LLM pools."""
+        return {pool.name: pool.stats() for pool in (self.search_pool, self.write_pool, self.llm_pool)}
+
+    @staticmethod
+    def _format_size(size: float) -> str:
+        """Convert a byte count to a human-readable size."""
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024:
+                break
+            size /= 1024
+        return f"{size:.2f} {unit}"
+
+    def get_stats(self) -> LuceneStats:
+        """Get Lucene index statistics, in total, per shard, per segment and per folder.
+
+        Index statistics are computed at most once per index generation (that
+        is, after a commit or refresh) and then served from memory; pending
+        documents, the last commit time and cache counters are always current.
+        """
+        try:
+            cached = self._index_stats
+            if cached is not None and cached[0] == self.generation:
+                stats = cached[1]
+            else:
+                generation = self.generation
+                stats = self._collect_stats()
+                self._index_stats = (generation, stats)
+            return stats.copy(update={
+                "pending_docs": 0 if self.read_only else sum(self.index.pending_docs),
+                "last_commit_at": self.last_commit_at,
+                "retrieval_cache": CacheStats(**self.retrieval_cache.stats()),
+                "answer_cache": CacheStats(**self.answer_cache.stats())
+            })
         except Exception as e:
-            print(f"Error getting stats: {str(e)}")
+            logger.error("Error getting stats: %s", e)
             raise
 
-    def reindex(self):
-        """Delete and recreate the index."""
+    def _collect_stats(self) -> LuceneStats:
+        """Index statistics from segment metadata, without listing the index directory."""
+        index = self.index
+        shard_stats = index.shard_stats()
+        shards = [
+            ShardStats(
+                shard=stats["shard"],
+                num_docs=stats["num_docs"],
+                deleted_docs=stats["deleted_docs"],
+                segments=len(stats["segments"]),
+                index_size=self._format_size(stats["size_bytes"])
+            )
+            for stats in shard_stats
+        ]
+        segments = [
+            SegmentStats(
+                shard=stats["shard"],
+                name=segment["name"],
+                num_docs=segment["num_docs"],
+                deleted_docs=segment["deleted_docs"],
+                size=self._format_size(segment["size_bytes"])
+            )
+            for stats in shard_stats for segment in stats["segments"]
+        ]
+        content_bytes = index.content.size_bytes()
+        max_doc = sum(stats["max_doc"] for stats in shard_stats)
+        deleted_docs = sum(stats["deleted_docs"] for stats in shard_stats)
+        return LuceneStats(
+            # Passages are child documents and are not counted
+            num_docs=sum(shard.num_docs for shard in shards),
+            index_size=self._format_size(sum(stats["size_bytes"] for stats in shard_stats) + content_bytes),
+            content_size=self._format_size(content_bytes),
+            segments=len(segments),
+            deleted_docs=deleted_docs,
+            deleted_ratio=round(deleted_docs / max_doc, 4) if max_doc else 0.0,
+            folders=self.folder_document_counts(),
+            segment_details=segments,
+            shards=shards if index.num_shards > 1 else []
+        )
+
+    def _iter_listed_documents(self, index: ShardedIndex, searcher) -> Iterator[DocumentInput]:
+        """Stream every live document and folder marker from a point-in-time searcher over `index`.
+
+        Every live entry except passages is copied, including documents written
+        before kinds and doc keys existed, which keep their body in the stored
+        `content` field.
+        """
+        for context in searcher.getIndexReader().leaves():
+            leaf = context.reader()
+            live_docs = leaf.getLiveDocs()
+            stored_fields = leaf.storedFields()
+            passages = leaf.postings(Term("kind", "passage"))
+            next_passage = passages.nextDoc() if passages is not None else DocIdSetIterator.NO_MORE_DOCS
+            for doc_num in range(leaf.maxDoc()):
+                if doc_num == next_passage:
+                    next_passage = passages.nextDoc()
+                    continue
+                if live_docs is None or live_docs.get(doc_num):
+                    doc = stored_fields.document(doc_num)
+                    yield DocumentInput(
+                        id=doc.get("id"),
+                        content=self._stored_content(index, doc),
+                        folder_path=doc.get("folder_path") or ""
+                    )
+
+    def _update_reindex_status(self, **fields):
+        with self._reindex_lock:
+            for name, value in fields.items():
+                setattr(self._reindex_status, name, value)
+
+    def get_reindex_status(self) -> ReindexStatus:
+        """Progress of the current or most recent reindex."""
+        with self._reindex_lock:
+            status = self._reindex_status.copy()
+        if status.started_at is not None:
+            status.elapsed_seconds = round((status.finished_at or time.time()) - status.started_at, 3)
+        return status
+
+    def start_reindex(self, merge_segments: Optional[int] = None) -> ReindexStatus:
+        """Start a reindex on the writer pool and return its initial status.
+
+        Raises ValueError when a reindex is already running.
+        """
+        with self._reindex_lock:
+            if self._reindex_status.state == "running":
+                raise ValueError("A reindex is already running")
+            self._reindex_status = ReindexStatus(state="running", phase="queued", started_at=time.time())
         try:
-            # Get all documents first
-            docs = self.get_all_documents()
-            
-            # Close writer
-            self.writer.close()
-            
-            # Delete index directory
-            shutil.rmtree(self.index_dir)
-            os.makedirs(self.index_dir)
-            
-            # Reinitialize components
-            self.store = FSDirectory.open(Paths.get(self.index_dir))
-            config = IndexWriterConfig(self.analyzer)
-            config.setSimilarity(BM25Similarity())
-            config.setCommitOnClose(True)
-            self.writer = IndexWriter(self.store, config)
-            
-            # Reindex all documents
-            for doc in docs:
-                if doc.id != ".folder":  # Skip folder markers, they'll be recreated
-                    self.index_document(doc.content, doc.id, doc.folder_path)
+            self.write_pool.submit(self.reindex, merge_segments, False)
+        except OverloadedError:
+            self._update_reindex_status(state="idle", phase=None, started_at=None)
+            raise
+        return self.get_reindex_status()
+
+    def reindex(self, merge_segments: Optional[int] = None, reset_status: bool = True) -> ReindexStatus:
+        """Rebuild the index in a new directory and switch to it without interrupting searches.
+
+        Documents and folder markers are streamed from a point-in-time searcher
+        into fresh writers for `num_shards` shards, which are built and
+        optionally force-merged down to `merge_segments` in parallel. Then the
+        active pointer, writers and searcher managers are swapped. Searches keep
+        using the old index until the swap; writes wait for it. Changing
+        `num_shards` and reindexing reshards an existing index. If fewer entries
+        are copied than the source holds, the new index is discarded and the
+        current one kept.
+        """
+        if reset_status:
+            with self._reindex_lock:
+                self._reindex_status = ReindexStatus(state="running", started_at=time.time())
+        new_path = os.path.join(self.index_dir, f"{INDEX_DIR_PREFIX}{int(time.time() * 1000)}")
+        index = None
+        try:
+            with self.write_lock:
+                os.makedirs(new_path)
+                index = ShardedIndex(new_path, self.num_shards, self._writer_config, executor=self.search_executor,
+                                     directory=self.directory)
+                
+                with self.acquire_index() as (source, searcher):
+                    # Everything live but passages, which are rebuilt from their documents
+                    total = searcher.getIndexReader().numDocs() - searcher.count(TermQuery(Term("kind", "passage")))
+                    self._update_reindex_status(phase="copying", total=total)
+                    _, indexed, unchanged, failed, _ = self._add_documents_sharded(
+                        index, self._iter_listed_documents(source, searcher),
+                        progress=lambda indexed, failed: self._update_reindex_status(processed=indexed, failed=failed),
+                        skip_unchanged=False
+                    )
+                if indexed + unchanged + failed != total:
+                    raise ValueError(f"Reindex copied {indexed + unchanged + failed} of {total} documents; "
+                                     f"keeping the current index")
+                
+                if merge_segments:
+                    self._update_reindex_status(phase="merging")
+                    with metrics.timer("force_merge"):
+                        index.force_merge(merge_segments)
+                    self.commit(index)
+                
+                self._update_reindex_status(phase="swapping")
+                index.open_searchers()
+                old_index, old_path = self.index, self.active_index_path
+                self._set_active_index(new_path)
+                self.index = index
+                self.active_index_path = new_path
+                self.generation += 1
+                self._publish_commit()
+                
+                # Searchers still borrowed from the old managers stay usable until released
+                old_index.close()
+                self._remove_index(old_path)
             
-            return True
+            self._update_reindex_status(state="completed", phase=None, finished_at=time.time())
+            return self.get_reindex_status()
         except Exception as e:
-            print(f"Error reindexing: {str(e)}")
+            logger.error("Error reindexing: %s", e)
+            if index is not None and self.index is not index:
+                index.rollback()
+                shutil.rmtree(new_path, ignore_errors=True)
+            self._update_reindex_status(state="failed", error=str(e), finished_at=time.time())
             raise
 
     def get_llm_config(self) -> LLMConfig:
@@ -391,11 +1919,66 @@ Answer:"""
         self.llm.temperature = config.temperature
         self.llm.num_ctx = config.num_ctx
         self.llm.repeat_penalty = config.repeat_penalty
+        self._publish_settings()
+
+    def get_search_config(self) -> SearchConfig:
+        return SearchConfig(num_results=self.num_results, mmr_lambda=self.mmr_lambda,
+                            candidate_pool=self.candidate_pool)
+
+    def update_search_config(self, config: SearchConfig):
+        """Update search configuration; omitted diversity settings keep their value."""
+        self.num_results = config.num_results
+        if config.mmr_lambda is not None:
+            self.mmr_lambda = config.mmr_lambda
+        if config.candidate_pool is not None:
+            self.candidate_pool = config.candidate_pool
+        self._publish_settings()
+
+    def _publish_settings(self):
+        """Write the current settings to SETTINGS, where read-only processes pick them up."""
+        if self.read_only:
+            return
+        settings = {"search": self.get_search_config().dict(), "llm": self.get_llm_config().dict()}
+        tmp_path = os.path.join(self.index_dir, f"{SETTINGS_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(settings, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, SETTINGS_FILE))
+
+    def _load_settings(self):
+        """Apply SETTINGS if it changed since it was last read."""
+        path = os.path.join(self.index_dir, SETTINGS_FILE)
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime == self._settings_mtime:
+                return
+            with open(path) as f:
+                settings = json.load(f)
+        except FileNotFoundError:
+            return
+        self._settings_mtime = mtime
+        search = SearchConfig(**settings["search"])
+        self.num_results = search.num_results
+        self.mmr_lambda = search.mmr_lambda if search.mmr_lambda is not None else self.mmr_lambda
+        self.candidate_pool = search.candidate_pool if search.candidate_pool is not None else self.candidate_pool
+        llm = LLMConfig(**settings["llm"])
+        self.llm.temperature = llm.temperature
+        self.llm.num_ctx = llm.num_ctx
+        self.llm.repeat_penalty = llm.repeat_penalty
+
+    def close(self):
+        """Stop background work and close the writer and searchers."""
+        self._refresh_stop.set()
+        for pool in (self.search_pool, self.write_pool, self.llm_pool, self.vector_pool):
+            pool.shutdown()
+        self.llm.close()
+        self._close_index()
+        if self.search_executor is not None:
+            self.search_executor.shutdown()
 
     def __del__(self):
         """Cleanup resources."""
         try:
-            if hasattr(self, 'writer'):
-                self.writer.close()
+            if hasattr(self, 'index'):
+                self.close()
         except:
             pass
@@ -1,10 +1,25 @@
+import logging
+import os
+import time
 import lucene
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
+import metrics
+from embeddings import create_embedder
+from ingest_queue import IngestQueue
+from llm_gateway import OllamaGateway
 from lucene_rag import LuceneRAG
 from routes import router
-from utils import wait_for_ollama
+from writer_proxy import WriterProxy
+
+# Log through the standard logging module, tagged with the request id
+logging.basicConfig(
+    level=os.environ.get("RAG_LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(metrics.RequestIdFilter())
 
 # Initialize Java VM for PyLucene
 lucene.initVM()
@@ -12,6 +27,21 @@ lucene.initVM()
 # FastAPI app
 app = FastAPI(title="Document RAG API")
 
+# "writer" owns the IndexWriter and serves every route. "reader" processes (any
+# number, e.g. uvicorn --workers N) search read-only and forward writes to RAG_WRITER_URL.
+role = os.environ.get("RAG_ROLE", "writer")
+if role not in ("writer", "reader"):
+    raise ValueError(f"RAG_ROLE must be 'writer' or 'reader', not {role!r}")
+proxy = WriterProxy(os.environ.get("RAG_WRITER_URL", "http://localhost:3334")) if role == "reader" else None
+
+@app.middleware("http")
+async def forward_writes(request: Request, call_next):
+    """In reader processes, relay index mutations to the writer process."""
+    if proxy is not None and proxy.forwards(request.method, request.url.path):
+        request.scope["forwarded"] = True
+        return await proxy.forward(request, metrics.current_request_id())
+    return await call_next(request)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -21,19 +51,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Ollama client; generations beyond RAG_MAX_GENERATIONS wait in the llm pool
+max_generations = int(os.environ.get("RAG_MAX_GENERATIONS", "2"))
+llm = OllamaGateway(
+    base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
+    model=os.environ.get("OLLAMA_MODEL", "llama3.2-vision"),
+    keep_alive=os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+    max_concurrent=max_generations,
+    read_timeout=float(os.environ.get("OLLAMA_READ_TIMEOUT", "120")),
+    total_timeout=float(os.environ.get("OLLAMA_TIMEOUT", "600"))
+)
+
 # Initialize RAG system
-rag = LuceneRAG()
+rag = LuceneRAG(
+    search_workers=int(os.environ.get("RAG_SEARCH_WORKERS", "8")),
+    max_generations=max_generations,
+    max_queued=int(os.environ.get("RAG_MAX_QUEUED", "32")),
+    embedder=create_embedder(os.environ.get("RAG_EMBEDDER", "none")),
+    slow_query_ms=float(os.environ.get("RAG_SLOW_QUERY_MS", "2000")),
+    llm=llm,
+    num_shards=int(os.environ.get("RAG_SHARDS", "1")),
+    directory=os.environ.get("RAG_DIRECTORY", "mmap"),
+    # e.g. 0.2: merge away deleted documents once they exceed 20% of a shard
+    expunge_deletes_ratio=float(os.environ.get("RAG_EXPUNGE_DELETES_RATIO", "0")) or None,
+    read_only=role == "reader",
+    # How often readers check for new commits
+    refresh_interval=float(os.environ.get("RAG_REFRESH_INTERVAL", "0.5")) if role == "reader" else None
+)
+
+# Uploads are logged durably and indexed in batches by a background worker
+ingest = None
+if role == "writer":
+    ingest = IngestQueue(
+        rag,
+        wal_dir=os.environ.get("RAG_WAL_DIR", os.path.join(rag.index_dir, "wal")),
+        batch_size=int(os.environ.get("RAG_INGEST_BATCH_SIZE", "256")),
+        commit_interval=float(os.environ.get("RAG_COMMIT_INTERVAL", "1.0"))
+    )
 
-# Set the rag instance in routes
+# Set the rag and ingest instances in routes
 import routes
 routes.rag = rag
+routes.ingest = ingest
 
 # Include routes
 app.include_router(router)
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Assign a request id (or reuse X-Request-ID) and record the request latency."""
+    request_id = metrics.begin_request(request.headers.get("x-request-id"))
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if request.scope.get("forwarded"):
+        route_label = "writer"
+    else:
+        route_label = route.path if route else "unmatched"
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - started, request.method, route_label, str(response.status_code)
+    )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
-    wait_for_ollama()
+    if ingest is not None:
+        ingest.start()
+    # Don't hold up startup; /ready reports 503 until Ollama answers
+    llm.start_readiness_probe()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Whatever is still queued stays in the write-ahead log and is replayed on restart
+    if ingest is not None:
+        ingest.stop(timeout=10)
+    if proxy is not None:
+        proxy.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,178 @@
+import bisect
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond Lucene stages to multi-second generations
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("trace", default=None)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus format."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket = _format_labels(self.labelnames, labels, f'le="{le}"')
+                yield f"{self.name}_bucket{bucket} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {counts[-1]:g}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, List[Tuple[dict, float]]]]] = None) -> str:
+        """Render all metrics, plus point-in-time gauges, in the Prometheus text format.
+
+        `gauges` maps a metric name to its help text and a list of
+        (labels, value) samples.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for name, (help, samples) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in each retrieval, generation and ingestion stage", ("stage",)
+))
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "rag_prompt_tokens", "Estimated size of prompts sent to the LLM", buckets=TOKEN_BUCKETS
+))
+QUERIES = REGISTRY.register(Counter("rag_queries_total", "RAG queries answered", ("mode",)))
+SLOW_QUERIES = REGISTRY.register(Counter("rag_slow_queries_total", "Queries slower than the slow-query threshold"))
+DOCUMENTS_INDEXED = REGISTRY.register(Counter("rag_documents_indexed_total", "Documents written to the index"))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency until the response starts",
+    ("method", "route", "status")
+))
+
+
+def begin_request(request_id: Optional[str] = None) -> str:
+    """Start tracing a request in the current context and return its id.
+
+    Worker pools copy the context, so stages run on other threads are
+    attributed to the same request.
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _trace.set({})
+    return request_id
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_trace() -> Dict[str, float]:
+    """Milliseconds spent per stage so far in the current request."""
+    return dict(_trace.get() or {})
+
+
+def observe(stage: str, seconds: float):
+    """Record the duration of a stage, both globally and in the current request trace."""
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = round(trace.get(stage, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request id to log records as `request_id`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
@@ -0,0 +1,76 @@
+import base64
+import heapq
+import re
+import struct
+import zlib
+from typing import List, Optional
+
+SKETCH_SIZE = 64
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, shingle_words: int = SHINGLE_WORDS) -> set:
+    """Overlapping word n-grams of the lowercased text (the words themselves for very short texts)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < shingle_words:
+        return set(words)
+    return {" ".join(words[i:i + shingle_words]) for i in range(len(words) - shingle_words + 1)}
+
+
+def sketch(text: str, size: int = SKETCH_SIZE, shingle_words: int = SHINGLE_WORDS) -> List[int]:
+    """Bottom-k MinHash sketch: the `size` smallest 32-bit shingle hashes, ascending.
+
+    One hash function and a heap keep this fast for long documents, unlike
+    k independent permutations.
+    """
+    hashes = {zlib.crc32(s.encode("utf-8")) for s in shingles(text, shingle_words)}
+    return heapq.nsmallest(size, hashes)
+
+
+def similarity(a: Optional[List[int]], b: Optional[List[int]]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two sketches (0.0 if either is missing)."""
+    if not a or not b:
+        return 0.0
+    size = min(len(a), len(b))
+    # The smallest hashes of the union are a uniform sample of it; count those in both sets
+    union = heapq.nsmallest(size, set(a) | set(b))
+    both = set(a) & set(b)
+    return sum(1 for h in union if h in both) / len(union)
+
+
+def select_diverse(candidates: List[dict], n: int, mmr_lambda: float) -> List[dict]:
+    """Pick n candidates by maximal marginal relevance.
+
+    Candidates are dicts with a "score" and a "sketch", in rank order. Each
+    step takes the candidate with the best
+    lambda * relevance - (1 - lambda) * (similarity to the closest pick),
+    where relevance is the score relative to the top score. Ties go to the
+    better-ranked candidate.
+    """
+    if mmr_lambda >= 1.0 or len(candidates) <= n:
+        return candidates[:n]
+    top_score = candidates[0]["score"] or 1.0
+    chosen = []
+    redundancy = [0.0] * len(candidates)  # similarity of each candidate to its closest pick
+    remaining = set(range(len(candidates)))
+    while remaining and len(chosen) < n:
+        best = max(
+            remaining,
+            key=lambda i: (mmr_lambda * candidates[i]["score"] / top_score - (1 - mmr_lambda) * redundancy[i], -i)
+        )
+        remaining.discard(best)
+        chosen.append(candidates[best])
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], similarity(candidates[i]["sketch"], candidates[best]["sketch"]))
+    return chosen
+
+
+def encode(values: List[int]) -> str:
+    return base64.b64encode(struct.pack(f"<{len(values)}I", *values)).decode("ascii")
+
+
+def decode(value: str) -> List[int]:
+    raw = base64.b64decode(value)
+    return list(struct.unpack(f"<{len(raw) // 4}I", raw))
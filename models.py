@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class DocumentInput(BaseModel):
@@ -6,13 +6,83 @@ class DocumentInput(BaseModel):
     id: str
     folder_path: str = ""
 
+class IngestTicket(BaseModel):
+    ticket: str
+    id: str
+    folder_path: str = ""
+    state: str  # queued, indexing, searchable or failed
+    error: Optional[str] = None
+    queued_at: float
+    completed_at: Optional[float] = None
+
+class IngestStatus(BaseModel):
+    pending: int  # Logged, waiting for the worker
+    in_flight: int  # In the batch being indexed
+    last_seq: int  # Last sequence number written to the log
+    checkpoint: int  # Last sequence number committed to the index
+    segments: int  # Log segment files on disk
+
+class BulkItemStatus(BaseModel):
+    index: int
+    id: Optional[str] = None
+    folder_path: str = ""
+    status: str
+    error: Optional[str] = None
+
+class BulkIndexOutput(BaseModel):
+    items: List[BulkItemStatus]
+    indexed: int
+    unchanged: int = 0  # Skipped because the same content was already indexed
+    failed: int
+    commits: int
+    elapsed_seconds: float
+    docs_per_sec: float
+
+class SyncEntry(BaseModel):
+    path: str  # Full document path, e.g. "folder/sub/doc.md"
+    hash: str  # SHA-256 hex digest of the UTF-8 content
+
+class SyncManifest(BaseModel):
+    documents: List[SyncEntry]
+    folder_path: str = ""  # Only documents in this subtree are considered for deletion
+
+class SyncPlan(BaseModel):
+    upload: List[str]  # New or changed paths
+    delete: List[str]  # Indexed paths missing from the manifest
+    unchanged: int
+
 class DocumentOutput(BaseModel):
     id: str
     content: str
     folder_path: str = ""
 
+class DocumentSummary(BaseModel):
+    id: str
+    folder_path: str = ""
+    content: Optional[str] = None
+
+class DocumentPage(BaseModel):
+    documents: List[DocumentSummary]
+    next_cursor: Optional[str] = None
+
+class FolderNode(BaseModel):
+    path: str
+    name: str
+    document_count: int = 0
+    total_count: int = 0
+    children: List["FolderNode"] = []
+
+FolderNode.update_forward_refs()
+
+class FolderMove(BaseModel):
+    source: str
+    destination: str
+
 class QueryInput(BaseModel):
     question: str
+    include_folders: List[str] = []  # Only search these folder subtrees
+    exclude_folders: List[str] = []  # Never search these folder subtrees
+    session_id: Optional[str] = None  # Chat session chosen by the client; None for a standalone question
 
 class SourceWithScore(BaseModel):
     path: str
@@ -21,16 +91,76 @@ class SourceWithScore(BaseModel):
 class QueryOutput(BaseModel):
     answer: str
     sources: List[SourceWithScore]
+    prompt_tokens: int = 0
+    session_id: Optional[str] = None
 
-class LuceneStats(BaseModel):
+class TermPlan(BaseModel):
+    term: str
+    doc_freq: int
+    expansion: str = "none"  # none, fuzzy or prefix
+
+class SearchExplanation(BaseModel):
+    question: str
+    terms: List[TermPlan]
+    lucene_query: str
+    timings: Dict[str, float]
+    results: List[SourceWithScore]
+
+class CacheStats(BaseModel):
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+class ShardStats(BaseModel):
+    shard: str
     num_docs: int
+    deleted_docs: int
+    segments: int
     index_size: str
 
+class SegmentStats(BaseModel):
+    shard: str
+    name: str
+    num_docs: int  # Lucene documents, passages included
+    deleted_docs: int
+    size: str
+
+class LuceneStats(BaseModel):
+    num_docs: int
+    index_size: str  # Lucene indexes plus the content store
+    content_size: str = ""  # Compressed document bodies, including replaced versions until a reindex
+    segments: int = 0
+    deleted_docs: int = 0  # Deleted Lucene documents (passages included) not yet merged away
+    deleted_ratio: float = 0.0  # Of all Lucene documents
+    pending_docs: int = 0  # Written but not yet committed; always 0 in read-only processes
+    last_commit_at: Optional[float] = None  # Unix time of the last published commit
+    folders: Dict[str, int] = {}  # Live documents directly inside each folder
+    segment_details: List[SegmentStats] = []
+    retrieval_cache: Optional[CacheStats] = None
+    answer_cache: Optional[CacheStats] = None
+    shards: List[ShardStats] = []  # Only for sharded indexes
+
+class ReindexStatus(BaseModel):
+    state: str = "idle"  # idle, running, completed or failed
+    phase: Optional[str] = None  # queued, copying, merging or swapping while running
+    total: int = 0  # Documents and folder markers to copy
+    processed: int = 0
+    failed: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    elapsed_seconds: float = 0.0
+    error: Optional[str] = None
+
 class ModelInfo(BaseModel):
     model: str
 
 class SearchConfig(BaseModel):
     num_results: int
+    # Diversity reranking; omitted fields keep their current value
+    mmr_lambda: Optional[float] = None  # 1.0 ranks by relevance only, lower values favour variety
+    candidate_pool: Optional[int] = None  # Minimum passages retrieved before reranking
 
 class LLMConfig(BaseModel):
     temperature: float
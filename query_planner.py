@@ -0,0 +1,98 @@
+import time
+from typing import List, NamedTuple
+
+from org.apache.lucene.analysis import CharArraySet
+from org.apache.lucene.analysis.en import EnglishAnalyzer
+from org.apache.lucene.analysis.standard import StandardAnalyzer
+from org.apache.lucene.analysis.tokenattributes import CharTermAttribute
+from org.apache.lucene.index import Term
+from org.apache.lucene.search import (
+    BooleanQuery, BooleanClause, BoostQuery, FuzzyQuery, MatchNoDocsQuery, MultiTermQuery,
+    PrefixQuery, TermQuery
+)
+
+# Question words that carry no meaning for retrieval, on top of Lucene's English stop words
+QUESTION_WORDS = ("tell", "me", "what", "how", "why", "when", "where", "which", "who", "does", "do", "can")
+
+
+class QueryPlan(NamedTuple):
+    query: object  # Lucene Query
+    terms: List[dict]  # One entry per query term: term, doc_freq, expansion
+    timings: dict  # Milliseconds spent analyzing and planning
+
+
+class QueryPlanner:
+    """Builds retrieval queries that only expand terms when they are rare.
+
+    Questions are analyzed with a stop-word-aware analyzer into exact BM25
+    term clauses. Terms with a document frequency at or below
+    `low_doc_freq` also get a fuzzy (or, for short terms, prefix) expansion
+    capped at `max_expansions` terms, so typos still match without paying
+    for fuzzy matching over the whole term dictionary on every query.
+    """
+
+    def __init__(self, field: str = "passage", low_doc_freq: int = 1, max_expansions: int = 16,
+                 expansion_boost: float = 0.5):
+        self.field = field
+        self.low_doc_freq = low_doc_freq
+        self.max_expansions = max_expansions
+        self.expansion_boost = expansion_boost
+
+        stop_words = CharArraySet(EnglishAnalyzer.ENGLISH_STOP_WORDS_SET, True)
+        for word in QUESTION_WORDS:
+            stop_words.add(word)
+        self.analyzer = StandardAnalyzer(stop_words)
+        # Used when a question consists of stop words only
+        self.fallback_analyzer = StandardAnalyzer()
+
+    def analyze(self, text: str, analyzer=None) -> List[str]:
+        """Tokenize text into unique index terms, in order of appearance."""
+        token_stream = (analyzer or self.analyzer).tokenStream(self.field, text)
+        term_attr = token_stream.addAttribute(CharTermAttribute.class_)
+        terms = []
+        try:
+            token_stream.reset()
+            while token_stream.incrementToken():
+                term = term_attr.toString()
+                if term not in terms:
+                    terms.append(term)
+            token_stream.end()
+        finally:
+            token_stream.close()
+        return terms
+
+    def _expansion(self, text: str):
+        """Capped fuzzy or prefix expansion for a rare term."""
+        rewrite = MultiTermQuery.TopTermsScoringBooleanQueryRewrite(self.max_expansions)
+        if len(text) > 3:
+            return "fuzzy", FuzzyQuery(Term(self.field, text), 1, 1, self.max_expansions, True)
+        return "prefix", PrefixQuery(Term(self.field, text), rewrite)
+
+    def plan(self, text: str, reader) -> QueryPlan:
+        """Plan the query for a question against the current index reader."""
+        started = time.perf_counter()
+        terms = self.analyze(text) or self.analyze(text, self.fallback_analyzer)
+        analyzed = time.perf_counter()
+
+        query = BooleanQuery.Builder()
+        planned = []
+        for term_text in terms:
+            term = Term(self.field, term_text)
+            doc_freq = reader.docFreq(term)
+            expansion = "none"
+            if doc_freq > 0:
+                query.add(TermQuery(term), BooleanClause.Occur.SHOULD)
+            if doc_freq <= self.low_doc_freq:
+                expansion, expanded = self._expansion(term_text)
+                query.add(BoostQuery(expanded, self.expansion_boost), BooleanClause.Occur.SHOULD)
+            planned.append({"term": term_text, "doc_freq": doc_freq, "expansion": expansion})
+        planned_at = time.perf_counter()
+
+        return QueryPlan(
+            query=query.build() if terms else MatchNoDocsQuery(),
+            terms=planned,
+            timings={
+                "analyze_ms": round((analyzed - started) * 1000, 3),
+                "plan_ms": round((planned_at - analyzed) * 1000, 3)
+            }
+        )
@@ -1,85 +1,366 @@
-from typing import List
-from fastapi import APIRouter, HTTPException
+import json
+import logging
+from typing import AsyncIterator, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+import metrics
+from concurrency import OverloadedError
+from llm_gateway import LLMRequestError, LLMUnavailableError
 from models import (
     DocumentInput, DocumentOutput, QueryInput, QueryOutput,
-    LuceneStats, ModelInfo, SearchConfig, LLMConfig
+    LuceneStats, ModelInfo, SearchConfig, LLMConfig, BulkIndexOutput, DocumentPage,
+    FolderNode, FolderMove, SearchExplanation, ReindexStatus, IngestTicket, IngestStatus,
+    SyncManifest, SyncPlan
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# This will be set in main.py
+# These will be set in main.py
 rag = None
+ingest = None
+
+async def flush_ingest():
+    """Wait until all queued uploads are indexed, so the write that follows applies after them.
 
-@router.post("/documents", response_model=DocumentOutput)
+    Waits on a threadpool thread, not on the single write pool worker, so other
+    writes are not held up while the queue drains.
+    """
+    if not await run_in_threadpool(ingest.flush, timeout=60):
+        raise OverloadedError("Ingest queue is still draining, try again later")
+
+@router.post("/documents", response_model=Union[IngestTicket, DocumentOutput])
 async def add_document(document: DocumentInput):
     try:
         if document.id == ".folder":
-            rag.create_folder(document.folder_path)
-        else:
-            rag.index_document(document.content, document.id, document.folder_path)
-        return document
+            # Folders are created synchronously so they show up in the tree right away
+            await rag.write_pool.run(rag.create_folder, document.folder_path)
+            return document
+        ticket = await run_in_threadpool(ingest.submit, document)
+        return JSONResponse(status_code=202, content=ticket.dict())
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in add_document endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingest/tickets/{ticket_id}", response_model=IngestTicket)
+async def get_ingest_ticket(ticket_id: str):
+    ticket = ingest.ticket(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail=f"Ticket {ticket_id} not found")
+    return ticket
+
+@router.get("/ingest/status", response_model=IngestStatus)
+async def get_ingest_status():
+    return ingest.status()
+
+def parse_bulk_body(body: bytes, content_type: str):
+    """Yield DocumentInput items from a JSON array or NDJSON body.
+
+    Items that fail to parse are yielded as exceptions so they can be
+    reported per item instead of failing the whole batch.
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        for line in body.splitlines():
+            if line.strip():
+                yield parse_ndjson_line(line)
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of documents")
+        for item in items:
+            try:
+                yield DocumentInput(**item)
+            except (TypeError, ValidationError) as e:
+                yield e
+
+async def parse_ndjson_stream(chunks: AsyncIterator[bytes]):
+    """Yield DocumentInput items (or parse errors) from an NDJSON body as it arrives."""
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield parse_ndjson_line(line)
+    if pending.strip():
+        yield parse_ndjson_line(pending)
+
+def parse_ndjson_line(line: bytes):
+    try:
+        return DocumentInput(**json.loads(line))
+    except (ValueError, TypeError, ValidationError) as e:
+        return e
+
+@router.post("/documents/bulk", response_model=BulkIndexOutput)
+async def add_documents_bulk(request: Request, commit_docs: Optional[int] = None,
+                             commit_bytes: Optional[int] = None):
+    try:
+        content_type = request.headers.get("content-type", "")
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            await flush_ingest()
+            # Documents are indexed while the body is still being received
+            return await rag.write_pool.feed(
+                parse_ndjson_stream(request.stream()), rag.index_documents,
+                commit_docs=commit_docs, commit_bytes=commit_bytes
+            )
+        body = await request.body()
+        try:
+            documents = list(parse_bulk_body(body, content_type))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid bulk body: {str(e)}")
+        await flush_ingest()
+        return await rag.write_pool.run(
+            rag.index_documents, documents, commit_docs=commit_docs, commit_bytes=commit_bytes
+        )
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in add_document endpoint: {str(e)}")
+        logger.error("Error in add_documents_bulk endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/documents", response_model=List[DocumentOutput])
-async def list_documents():
+@router.get("/documents", response_model=DocumentPage)
+async def list_documents(cursor: Optional[str] = None, limit: int = Query(500, ge=1, le=5000),
+                         folder_path: Optional[str] = None, include_content: bool = False):
     try:
-        return rag.get_all_documents()
+        return await rag.search_pool.run(rag.list_documents, cursor, limit, folder_path, include_content)
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in list_documents endpoint: {str(e)}")
+        logger.error("Error in list_documents endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def export_document_lines(folder_path: Optional[str], include_content: bool):
+    try:
+        async for document in rag.search_pool.iterate(rag.iter_documents, folder_path, include_content):
+            yield json.dumps(document.dict()) + "\n"
+    except Exception as e:
+        logger.error("Error in document export: %s", e)
+        yield json.dumps({"error": str(e)}) + "\n"
+
+@router.get("/documents/export")
+async def export_documents(folder_path: Optional[str] = None, include_content: bool = True):
+    if not rag.search_pool.has_capacity():
+        raise HTTPException(status_code=429, detail="Search pool is busy, try again later",
+                            headers={"Retry-After": "1"})
+    return StreamingResponse(
+        export_document_lines(folder_path, include_content),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/documents/{doc_id}", response_model=DocumentOutput)
+async def get_document(doc_id: str, folder_path: str = ""):
+    try:
+        document = await rag.search_pool.run(rag.get_document, doc_id, folder_path)
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in get_document endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    return document
+
 @router.delete("/documents/{doc_id}")
 async def delete_document(doc_id: str, folder_path: str = ""):
     try:
-        if rag.delete_document(doc_id, folder_path):
+        await flush_ingest()
+        if await rag.write_pool.run(rag.delete_document, doc_id, folder_path):
             return {"message": f"Document {doc_id} deleted successfully"}
         raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in delete_document endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/sync", response_model=SyncPlan)
+async def plan_sync(manifest: SyncManifest):
+    try:
+        return await rag.search_pool.run(rag.plan_sync, manifest.documents, manifest.folder_path)
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in delete_document endpoint: {str(e)}")
+        logger.error("Error in plan_sync endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/folders/tree", response_model=FolderNode)
+async def get_folder_tree():
+    try:
+        return await rag.search_pool.run(rag.get_folder_tree)
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in get_folder_tree endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/folders/move")
+async def move_folder(move: FolderMove):
+    try:
+        await flush_ingest()
+        moved = await rag.write_pool.run(rag.move_folder, move.source, move.destination)
+        return {"message": f"Folder {move.source} moved to {move.destination}", "moved": moved}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in move_folder endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/folders")
+async def delete_folder(folder_path: str):
+    try:
+        await flush_ingest()
+        await rag.write_pool.run(rag.delete_folder, folder_path)
+        return {"message": f"Folder {folder_path} deleted successfully"}
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in delete_folder endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def session_of(query: QueryInput) -> Optional[str]:
+    """The chat session a query continues; None where sessions are not kept (reader processes)."""
+    return query.session_id if rag.sessions_enabled else None
+
+async def stream_query_events(request: Request, query: QueryInput):
+    """Relay query_stream events as SSE, stopping the generation if the client goes away."""
+    events = rag.aquery_stream(query.question, query.include_folders, query.exclude_folders, session_of(query))
+    try:
+        async for event, data in events:
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling generation")
+                break
+            yield format_sse(event, data)
+    except Exception as e:
+        logger.error("Error in query stream: %s", e)
+        yield format_sse("error", {"detail": str(e)})
+    finally:
+        await events.aclose()
+
+@router.post("/query/stream")
+async def query_documents_stream(request: Request, query: QueryInput):
+    # Reject before the stream starts, once the status code can no longer change
+    if not (rag.search_pool.has_capacity() and rag.llm_pool.has_capacity()):
+        raise HTTPException(status_code=429, detail="Too many queries in progress, try again later",
+                            headers={"Retry-After": "1"})
+    if not rag.llm.available():
+        raise HTTPException(status_code=503, detail="Ollama is unavailable, try again later",
+                            headers={"Retry-After": str(int(rag.llm.breaker.retry_after()) + 1)})
+    return StreamingResponse(
+        stream_query_events(request, query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/query", response_model=QueryOutput)
-async def query_documents(query: QueryInput):
+async def query_documents(request: Request, query: QueryInput):
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await query_documents_stream(request, query)
     try:
-        answer, sources = rag.query(query.question)
-        return QueryOutput(answer=answer, sources=sources)
+        answer, sources, prompt_tokens = await rag.aquery(
+            query.question, query.include_folders, query.exclude_folders, session_of(query)
+        )
+        return QueryOutput(answer=answer, sources=sources, prompt_tokens=prompt_tokens, session_id=session_of(query))
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(int(rag.llm.breaker.retry_after()) + 1)})
+    except LLMRequestError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
-        print(f"Error in query_documents endpoint: {str(e)}")
+        logger.error("Error in query_documents endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a chat session, forgetting its history and pinned context."""
+    if not rag.sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"message": f"Session {session_id} deleted successfully"}
+
+@router.post("/search/explain", response_model=SearchExplanation)
+async def explain_search(query: QueryInput):
+    try:
+        return await rag.search_pool.run(
+            rag.explain_search, query.question, query.include_folders, query.exclude_folders
+        )
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error("Error in explain_search endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/stats", response_model=LuceneStats)
 async def get_stats():
     try:
-        return rag.get_stats()
+        return await rag.search_pool.run(rag.get_stats)
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in get_stats endpoint: {str(e)}")
+        logger.error("Error in get_stats endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/health")
+async def health():
+    return {"status": "ok", "pools": rag.pool_stats(), "llm": rag.llm.stats()}
+
+@router.get("/ready")
+async def ready():
+    # Liveness stays on /health; this reports whether questions can be answered yet
+    if not rag.llm.ready:
+        return JSONResponse(status_code=503, content={"status": "waiting", "llm": rag.llm.stats()})
+    return {"status": "ready", "llm": rag.llm.stats()}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(rag.metric_gauges()),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @router.get("/model", response_model=ModelInfo)
 async def get_model():
     try:
         return ModelInfo(model=rag.llm.model)
     except Exception as e:
-        print(f"Error in get_model endpoint: {str(e)}")
+        logger.error("Error in get_model endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/reindex")
-async def reindex():
+@router.post("/reindex", response_model=ReindexStatus, status_code=202)
+async def reindex(merge_segments: Optional[int] = Query(None, ge=1)):
     try:
-        rag.reindex()
-        return {"message": "Index rebuilt successfully"}
+        return rag.start_reindex(merge_segments)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in reindex endpoint: {str(e)}")
+        logger.error("Error in reindex endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/reindex/status", response_model=ReindexStatus)
+async def get_reindex_status():
+    return rag.get_reindex_status()
+
 @router.get("/search-config")
 async def get_search_config():
     try:
-        return SearchConfig(num_results=rag.num_results)
+        return rag.get_search_config()
     except Exception as e:
-        print(f"Error in get_search_config endpoint: {str(e)}")
+        logger.error("Error in get_search_config endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/search-config")
@@ -87,10 +368,16 @@ async def update_search_config(config: SearchConfig):
     try:
         if config.num_results < 1:
             raise HTTPException(status_code=400, detail="Number of results must be at least 1")
-        rag.num_results = config.num_results
+        if config.mmr_lambda is not None and not 0.0 <= config.mmr_lambda <= 1.0:
+            raise HTTPException(status_code=400, detail="mmr_lambda must be between 0 and 1")
+        if config.candidate_pool is not None and config.candidate_pool < 1:
+            raise HTTPException(status_code=400, detail="Candidate pool must be at least 1")
+        rag.update_search_config(config)
         return {"message": "Search configuration updated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in update_search_config endpoint: {str(e)}")
+        logger.error("Error in update_search_config endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/llm-config")
@@ -98,7 +385,7 @@ async def get_llm_config():
     try:
         return rag.get_llm_config()
     except Exception as e:
-        print(f"Error in get_llm_config endpoint: {str(e)}")
+        logger.error("Error in get_llm_config endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/llm-config")
@@ -107,5 +394,5 @@ async def update_llm_config(config: LLMConfig):
         rag.update_llm_config(config)
         return {"message": "LLM configuration updated successfully"}
     except Exception as e:
-        print(f"Error in update_llm_config endpoint: {str(e)}")
+        logger.error("Error in update_llm_config endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,172 @@
+import re
+import threading
+import uuid
+from typing import List, Optional
+
+from cache import LRUCache
+from context_packer import estimate_tokens
+
+# Words that refer back to earlier turns ("the second one", "what about") rather than
+# naming a topic; they are ignored when judging whether a question stands on its own
+FILLER_WORDS = frozenset((
+    "about", "more", "else", "other", "others", "same", "previous", "above", "them", "those", "its",
+    "one", "ones", "first", "second", "third", "last", "former", "latter"
+))
+# Openings that mark a question as continuing the conversation
+CONTINUATIONS = ("and ", "also ", "or ", "but ", "so ", "then ", "what about ", "how about ")
+# Questions with at most this many topic terms borrow terms from earlier turns
+FOLLOW_UP_MAX_TERMS = 1
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class ChatTurn:
+    """One question of a session, the terms it was retrieved with, and its answer once generated."""
+
+    def __init__(self, question: str, terms: List[str]):
+        self.question = question
+        self.terms = terms
+        self.answer: Optional[str] = None
+
+
+class Retrieval:
+    """Search results of a turn, reusable while the index generation and folder scope are unchanged.
+
+    `query` is the planned Lucene query the results were retrieved with.
+    """
+
+    def __init__(self, terms: set, generation: int, scope: tuple, results: List[dict], query=None):
+        self.terms = terms
+        self.generation = generation
+        self.scope = scope
+        self.results = results
+        self.query = query
+
+
+class ChatSession:
+    """A conversation: bounded turn history, pinned prompt context and the last retrieval.
+
+    The pinned context only grows between turns (new documents are appended
+    after the ones already pinned), so consecutive prompts share a prefix.
+    """
+
+    def __init__(self, session_id: str, max_turns: int):
+        self.id = session_id
+        self.max_turns = max_turns
+        self.turns: List[ChatTurn] = []
+        self.retrieval: Optional[Retrieval] = None
+        self.context_sections: List[str] = []
+        self.context_tokens = 0
+        self.pinned: List[str] = []  # Paths of the documents in the pinned context
+        self.generation: Optional[int] = None  # Index generation the pinned context was read from
+        self.lock = threading.Lock()
+
+    def carried_terms(self, question: str, terms: List[str], turns: int, max_terms: int) -> List[str]:
+        """Terms of recent turns to add to the retrieval query of a follow-up question.
+
+        A question is a follow-up when it names almost no topic of its own
+        ("and the second one?") or opens like a continuation ("what about ...").
+        """
+        if not self.turns:
+            return []
+        topic = [t for t in terms if t not in FILLER_WORDS]
+        opening = " ".join(_WORD_RE.findall(question.lower())) + " "
+        if len(topic) > FOLLOW_UP_MAX_TERMS and not opening.startswith(CONTINUATIONS):
+            return []
+        carried = []
+        for turn in reversed(self.turns[-turns:]):
+            for term in turn.terms:
+                if term not in terms and term not in carried:
+                    carried.append(term)
+        return carried[:max_terms]
+
+    def reusable_results(self, terms: set, generation: int, scope: tuple) -> Optional[List[dict]]:
+        """The last retrieval's results when this turn looks for nothing it did not already search."""
+        retrieval = self.retrieval
+        if retrieval is None or retrieval.generation != generation or retrieval.scope != scope:
+            return None
+        if not {t for t in terms if t not in FILLER_WORDS} <= retrieval.terms:
+            return None
+        return retrieval.results
+
+    def begin_turn(self, question: str, terms: List[str]) -> ChatTurn:
+        turn = ChatTurn(question, terms)
+        self.turns.append(turn)
+        del self.turns[:-self.max_turns]
+        return turn
+
+    def format_history(self, max_tokens: int) -> str:
+        """The most recent answered turns that fit in max_tokens, oldest first."""
+        parts = []
+        used = 0
+        for turn in reversed(self.turns):
+            if turn.answer is None:
+                continue
+            text = f"Question: {turn.question}\nAnswer: {turn.answer}\n\n"
+            tokens = estimate_tokens(text)
+            if used + tokens > max_tokens:
+                break
+            parts.append(text)
+            used += tokens
+        return "".join(reversed(parts))
+
+    def pin(self, context: str, tokens: int, paths: List[str]):
+        """Append a packed context section for documents not pinned before."""
+        self.context_sections.append(context)
+        self.context_tokens += tokens
+        self.pinned.extend(paths)
+
+    def reset_context(self, generation: int):
+        """Drop the pinned context, starting a new prompt prefix."""
+        self.context_sections = []
+        self.context_tokens = 0
+        self.pinned = []
+        self.generation = generation
+
+    @property
+    def context(self) -> str:
+        return "\n\n---\n\n".join(self.context_sections)
+
+
+class SessionStore:
+    """Chat sessions by id, evicted least recently used, after `ttl` seconds idle or beyond `max_bytes`.
+
+    Sessions live in process memory, so only the single writer process keeps
+    them; read-only worker processes answer every question on its own.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_bytes: int = 32 * 1024 * 1024, ttl: float = 1800,
+                 max_turns: int = 8, carry_turns: int = 2, carry_terms: int = 8):
+        self.cache = LRUCache(max_entries=max_sessions, max_bytes=max_bytes, ttl=ttl)
+        self.max_turns = max_turns
+        # Follow-ups borrow up to carry_terms terms from the last carry_turns turns
+        self.carry_turns = carry_turns
+        self.carry_terms = carry_terms
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str] = None) -> ChatSession:
+        """The session with this id, created if it is new or has expired (with a new id if None)."""
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            session = self.cache.get(session_id)
+            if session is None:
+                session = ChatSession(session_id, self.max_turns)
+                self.cache.put(session_id, session)
+        return session
+
+    def carried_terms(self, session: ChatSession, question: str, terms: List[str]) -> List[str]:
+        return session.carried_terms(question, terms, self.carry_turns, self.carry_terms)
+
+    def save(self, session: ChatSession):
+        """Store a session again after a turn, re-measuring its size and restarting its TTL."""
+        self.cache.put(session.id, session)
+
+    def finish_turn(self, session_id: str, turn: ChatTurn, answer: str):
+        """Record the answer of a turn started with ChatSession.begin_turn."""
+        turn.answer = answer
+        session = self.cache.get(session_id)
+        if session is not None:
+            self.save(session)
+
+    def delete(self, session_id: str) -> bool:
+        return self.cache.delete(session_id)
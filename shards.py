@@ -0,0 +1,330 @@
+import logging
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import lucene
+from java.nio.file import Paths
+from org.apache.lucene.index import (
+    DirectoryReader, DocValues, IndexReader, IndexWriter, MultiReader, SegmentInfos, SegmentReader, Term
+)
+from org.apache.lucene.search import DocIdSetIterator, IndexSearcher, SearcherManager, SearcherFactory, TermQuery
+from org.apache.lucene.store import FSDirectory, MMapDirectory, NIOFSDirectory
+
+from concurrency import attach_jvm
+from content_store import ContentStore
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR_PREFIX = "shard-"
+# Lucene Directory implementations; "auto" lets FSDirectory.open pick for the platform
+DIRECTORY_TYPES = ("mmap", "nio", "auto")
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    """Shard that owns a document key; stable across processes, unlike hash()."""
+    if num_shards == 1:
+        return 0
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+
+def open_directory(path: str, directory: str = "mmap"):
+    """Open a Lucene Directory of the given type (see DIRECTORY_TYPES)."""
+    if directory == "mmap":
+        # Index files are paged in by the OS instead of copied through Java heap buffers
+        return MMapDirectory(Paths.get(path))
+    if directory == "nio":
+        return NIOFSDirectory(Paths.get(path))
+    if directory == "auto":
+        return FSDirectory.open(Paths.get(path))
+    raise ValueError(f"Directory type must be one of {', '.join(DIRECTORY_TYPES)}, not {directory!r}")
+
+
+def shard_paths(path: str, num_shards: int) -> List[str]:
+    """Directories of the shards of an index; a single shard lives in `path` itself."""
+    if num_shards == 1:
+        return [path]
+    return [os.path.join(path, f"{SHARD_DIR_PREFIX}{i}") for i in range(num_shards)]
+
+
+def detect_num_shards(path: str) -> Optional[int]:
+    """Number of shards of an existing index at `path`, or None if there is no index yet."""
+    if not os.path.isdir(path):
+        return None
+    names = os.listdir(path)
+    shards = [n for n in names if n.startswith(SHARD_DIR_PREFIX) and os.path.isdir(os.path.join(path, n))]
+    if shards:
+        return len(shards)
+    if any(n.startswith("segments_") for n in names):
+        return 1
+    return None
+
+
+class IndexShard:
+    """One Lucene index of a ShardedIndex: its directory, writer and searcher manager."""
+
+    def __init__(self, path: str, store, writer=None, searcher_manager=None):
+        self.path = path
+        self.store = store
+        self.writer = writer
+        self.searcher_manager = searcher_manager
+
+
+class ShardedIndex:
+    """Documents spread by key hash over `num_shards` Lucene indexes under one directory.
+
+    Each shard has its own IndexWriter, so shards are written, committed and
+    merged in parallel. Searches combine the current searcher of every shard
+    in a MultiReader, so BM25 statistics (document frequencies, average field
+    lengths) are computed over the whole collection and scores are comparable
+    across shards. Given a Java `executor`, the IndexSearcher searches the
+    segments of all shards concurrently.
+
+    Document bodies are kept out of Lucene in a ContentStore shared by the
+    shards; Lucene documents only hold references into it.
+    """
+
+    def __init__(self, path: str, num_shards: int, writer_config: Optional[Callable] = None,
+                 read_only: bool = False, executor=None, directory: str = "mmap"):
+        self.path = path
+        self.read_only = read_only
+        self.shards: List[IndexShard] = []
+        for shard_path in shard_paths(path, num_shards):
+            os.makedirs(shard_path, exist_ok=True)
+            self.shards.append(IndexShard(shard_path, open_directory(shard_path, directory)))
+        # Created before the first commit, so readers always find it
+        self.content = ContentStore(path, read_only=read_only)
+        # Documents and folder markers written since each shard's last commit
+        self.pending_docs = [0] * num_shards
+        self._pending_lock = threading.Lock()
+        # Statistics of each segment seen by a searcher, by (shard, segment, deleted docs)
+        self._segment_stats = {}
+        self._segment_stats_lock = threading.Lock()
+        if not read_only:
+            for shard in self.shards:
+                shard.writer = IndexWriter(shard.store, writer_config())
+                if not DirectoryReader.indexExists(shard.store):
+                    # Give read-only processes a first commit to open
+                    shard.writer.commit()
+        # Owned by the caller, so searches still running on a swapped-out index can finish
+        self.executor = executor
+        # Python threads for per-shard commits, merges and refreshes
+        self._workers = ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix="lucene-shard",
+                                           initializer=attach_jvm) if num_shards > 1 else None
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.shards)
+
+    def exists(self) -> bool:
+        """Whether every shard has a commit that can be opened."""
+        return all(DirectoryReader.indexExists(shard.store) for shard in self.shards)
+
+    def open_searchers(self):
+        """Open one searcher manager per shard, from its writer or (read-only) its last commit."""
+        for shard in self.shards:
+            # IndexSearcher defaults to BM25Similarity, which matches the writer
+            source = shard.store if self.read_only else shard.writer
+            shard.searcher_manager = SearcherManager(source, SearcherFactory())
+
+    def writer_for(self, key: str):
+        return self.shards[shard_of(key, self.num_shards)].writer
+
+    def mark_pending(self, key: str):
+        """Count a document written to its shard but not yet committed."""
+        with self._pending_lock:
+            self.pending_docs[shard_of(key, self.num_shards)] += 1
+
+    def map_shards(self, fn: Callable, shards: Optional[List[int]] = None) -> list:
+        """Apply fn to each (or the given) shard, concurrently when there are several."""
+        selected = [self.shards[i] for i in shards] if shards is not None else self.shards
+        if self._workers is None or len(selected) == 1:
+            return [fn(shard) for shard in selected]
+        return list(self._workers.map(fn, selected))
+
+    def delete(self, query):
+        """Delete matching documents from every shard."""
+        for shard in self.shards:
+            shard.writer.deleteDocuments(query)
+
+    def commit(self, shard: Optional[int] = None):
+        # Lucene must never commit references to content that is not yet durable
+        self.content.sync()
+        selected = list(range(self.num_shards)) if shard is None else [shard]
+        with self._pending_lock:
+            committed = [self.pending_docs[i] for i in selected]
+        self.map_shards(lambda s: s.writer.commit(), selected)
+        # Documents marked while the commit ran may not be in it; they stay pending
+        with self._pending_lock:
+            for i, count in zip(selected, committed):
+                self.pending_docs[i] = max(0, self.pending_docs[i] - count)
+
+    def expunge_deletes(self, max_deleted_ratio: float) -> List[str]:
+        """Start background merges that drop deleted documents from shards above the given ratio.
+
+        Only segments above the merge policy's forceMergeDeletesPctAllowed
+        are rewritten. The merged segments become visible on the next refresh
+        and durable on the next commit. Returns the paths of the shards merged.
+        """
+        merged = []
+        for shard in self.shards:
+            stats = shard.writer.getDocStats()
+            if not stats.maxDoc or shard.writer.hasPendingMerges():
+                continue
+            if 1 - stats.numDocs / stats.maxDoc > max_deleted_ratio:
+                shard.writer.forceMergeDeletes(False)
+                merged.append(shard.path)
+        return merged
+
+    def refresh(self, blocking: bool = True):
+        if blocking:
+            self.map_shards(lambda s: s.searcher_manager.maybeRefreshBlocking())
+        else:
+            for shard in self.shards:
+                shard.searcher_manager.maybeRefresh()
+
+    def force_merge(self, max_segments: int):
+        self.map_shards(lambda s: s.writer.forceMerge(max_segments))
+
+    def commit_generations(self) -> List[int]:
+        return [SegmentInfos.getLastCommitGeneration(shard.store) for shard in self.shards]
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a searcher over the current searchers of all shards."""
+        acquired = []
+        try:
+            for shard in self.shards:
+                acquired.append((shard.searcher_manager, shard.searcher_manager.acquire()))
+        except lucene.JavaError:
+            for manager, searcher in acquired:
+                manager.release(searcher)
+            raise
+        try:
+            if len(acquired) == 1 and self.executor is None:
+                yield acquired[0][1]
+                return
+            # closeSubReaders=False: the shard readers stay owned by their managers
+            readers = [searcher.getIndexReader() for _, searcher in acquired]
+            reader = MultiReader(lucene.JArray('object')(readers, IndexReader), False)
+            try:
+                yield IndexSearcher(reader, self.executor)
+            finally:
+                reader.close()
+        finally:
+            for manager, searcher in acquired:
+                manager.release(searcher)
+
+    def _leaf_stats(self, shard: IndexShard, leaf) -> dict:
+        """Statistics of one segment as a reader sees it, computed once per segment and deletion count.
+
+        Segments are immutable and their deletions only grow, so a segment's
+        statistics change only when its deleted document count does; unchanged
+        segments are never scanned again.
+        """
+        reader = leaf.reader()
+        info = SegmentReader.cast_(reader).getSegmentInfo()
+        key = (shard.path, info.info.name, reader.numDeletedDocs())
+        stats = self._segment_stats.get(key)
+        if stats is not None:
+            return stats
+        live_docs = reader.getLiveDocs()
+        values = DocValues.getSorted(reader, "document_folder")
+        ord_counts = {}
+        doc = values.nextDoc()
+        while doc != DocIdSetIterator.NO_MORE_DOCS:
+            if live_docs is None or live_docs.get(doc):
+                ordinal = values.ordValue()
+                ord_counts[ordinal] = ord_counts.get(ordinal, 0) + 1
+            doc = values.nextDoc()
+        passages = IndexSearcher(reader).count(TermQuery(Term("kind", "passage")))
+        stats = {
+            "name": info.info.name,
+            "num_docs": info.info.maxDoc(),  # Passages included
+            "deleted_docs": reader.numDeletedDocs(),
+            "size_bytes": info.sizeInBytes(),
+            "live_docs": reader.numDocs() - passages,  # Passages excluded
+            # Live documents directly inside each folder
+            "folders": {values.lookupOrd(ordinal).utf8ToString(): count for ordinal, count in ord_counts.items()}
+        }
+        with self._segment_stats_lock:
+            self._segment_stats[key] = stats
+        return stats
+
+    def _collect_segment_stats(self) -> List[List[dict]]:
+        """Statistics of the current segments of each shard; only new or changed segments are read.
+
+        Entries of segments that no longer exist (merged away, or superseded
+        by more deletions) are dropped.
+        """
+        def segments(shard: IndexShard) -> List[dict]:
+            searcher = shard.searcher_manager.acquire()
+            try:
+                return [self._leaf_stats(shard, leaf) for leaf in searcher.getIndexReader().leaves()]
+            finally:
+                shard.searcher_manager.release(searcher)
+        per_shard = [segments(shard) for shard in self.shards]
+        current = {(shard.path, segment["name"], segment["deleted_docs"])
+                   for shard, shard_segments in zip(self.shards, per_shard) for segment in shard_segments}
+        with self._segment_stats_lock:
+            for key in [key for key in self._segment_stats if key not in current]:
+                del self._segment_stats[key]
+        return per_shard
+
+    def shard_stats(self) -> List[dict]:
+        """Document (excluding passages) and deletion counts plus per-segment details of each shard.
+
+        Sizes come from the segments' metadata, which Lucene caches, rather
+        than from listing the index directory; counts are kept per segment.
+        """
+        shard_stats = []
+        for shard, segments in zip(self.shards, self._collect_segment_stats()):
+            shard_stats.append({
+                "shard": os.path.basename(shard.path) if self.num_shards > 1 else "",
+                "num_docs": sum(segment["live_docs"] for segment in segments),
+                "max_doc": sum(segment["num_docs"] for segment in segments),
+                "deleted_docs": sum(segment["deleted_docs"] for segment in segments),
+                "segments": segments,
+                "size_bytes": sum(segment["size_bytes"] for segment in segments)
+            })
+        return shard_stats
+
+    def folder_counts(self) -> dict:
+        """Live documents directly inside each folder, summed from the per-segment counts."""
+        counts = {}
+        for segments in self._collect_segment_stats():
+            for segment in segments:
+                for path, count in segment["folders"].items():
+                    counts[path] = counts.get(path, 0) + count
+        return counts
+
+    def close_searchers(self):
+        for shard in self.shards:
+            if shard.searcher_manager is not None:
+                shard.searcher_manager.close()
+
+    def close(self):
+        """Close searchers, writers (committing pending changes) and directories."""
+        self.close_searchers()
+        # Writers commit on close
+        self.content.sync()
+        self.map_shards(lambda s: s.writer.close() if s.writer is not None else None)
+        self._shutdown()
+
+    def rollback(self):
+        """Discard uncommitted changes and close everything (a failed rebuild)."""
+        self.close_searchers()
+        for shard in self.shards:
+            if shard.writer is not None:
+                shard.writer.rollback()
+        self._shutdown()
+
+    def _shutdown(self):
+        for shard in self.shards:
+            shard.store.close()
+        self.content.close()
+        if self._workers is not None:
+            self._workers.shutdown()
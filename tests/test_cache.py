@@ -0,0 +1,67 @@
+from cache import LRUCache, estimate_size
+
+
+def test_evicts_least_recently_used_entry():
+    cache = LRUCache(max_entries=2, ttl=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_to_stay_within_max_bytes():
+    cache = LRUCache(max_entries=100, max_bytes=250, ttl=None)
+    for key in "abc":
+        cache.put(key, key, size=100)
+    assert cache.get("a") is None
+    assert cache.bytes == 200
+    # Values larger than the whole cache are not stored at all
+    cache.put("huge", "x", size=1000)
+    assert cache.get("huge") is None
+    assert cache.get("b") == "b"
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = LRUCache(max_bytes=1000, ttl=None)
+    cache.put("a", 1, size=300)
+    cache.put("a", 2, size=100)
+    assert cache.get("a") == 2
+    assert cache.bytes == 100
+    assert cache.stats()["entries"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.put("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 6
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+def test_delete_clear_and_stats():
+    cache = LRUCache(ttl=None)
+    cache.put("a", 1)
+    assert cache.delete("a")
+    assert not cache.delete("a")
+    cache.put("b", 2)
+    cache.get("b")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.bytes == 0
+
+
+def test_estimate_size_counts_nested_values():
+    flat = estimate_size("x" * 1000)
+    assert estimate_size({"text": "x" * 1000}) > flat
+    assert estimate_size([{"text": "x" * 1000}, {"text": "y" * 1000}]) > 2 * flat
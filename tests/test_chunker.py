@@ -0,0 +1,89 @@
+from chunker import chunk_markdown, iter_blocks, merge_passages
+
+DOCUMENT = """# Setup
+
+Install the dependencies first.
+
+- python 3.11
+- java 17
+- pylucene 10
+
+## Configuration
+
+""" + "\n".join(f"Setting number {i} controls how the index behaves under load." for i in range(60)) + """
+
+## Usage
+
+Run the server and open the web interface.
+"""
+
+
+def as_dicts(passages):
+    return [p._asdict() for p in passages]
+
+
+def test_passage_offsets_point_into_the_content():
+    passages = chunk_markdown(DOCUMENT, max_chars=500, overlap_chars=100)
+    assert [p.ordinal for p in passages] == list(range(len(passages)))
+    for p in passages:
+        assert p.text == DOCUMENT[p.start:p.end]
+        assert len(p.text) <= 500
+        assert p.text.strip()
+
+
+def test_headings_start_new_passages():
+    passages = chunk_markdown(DOCUMENT, max_chars=500, overlap_chars=100)
+    assert passages[0].heading == "Setup"
+    assert passages[0].text.startswith("# Setup")
+    assert "pylucene 10" in passages[0].text
+    for heading in ("Configuration", "Usage"):
+        first = next(p for p in passages if p.heading == heading)
+        assert first.text.startswith("## " + heading)
+    assert passages[-1].heading == "Usage"
+
+
+def test_every_block_is_covered():
+    passages = chunk_markdown(DOCUMENT, max_chars=300, overlap_chars=50)
+    for start, end, _ in iter_blocks(DOCUMENT):
+        for offset in range(start, end):
+            assert any(p.start <= offset < p.end for p in passages)
+
+
+def test_passages_of_a_section_overlap_on_line_boundaries():
+    passages = [p for p in chunk_markdown(DOCUMENT, max_chars=300, overlap_chars=120) if p.heading == "Configuration"]
+    assert len(passages) > 2
+    for previous, current in zip(passages, passages[1:]):
+        assert previous.start < current.start < previous.end
+        assert previous.end - current.start <= 120
+        assert DOCUMENT[current.start - 1] == "\n"
+
+
+def test_oversized_lines_are_split():
+    content = "word " * 1000
+    passages = chunk_markdown(content, max_chars=200, overlap_chars=0)
+    assert all(len(p.text) <= 200 for p in passages)
+    assert "".join(p.text for p in passages) == content.rstrip("\n")
+
+
+def test_merge_joins_overlapping_passages_once():
+    passages = as_dicts(chunk_markdown(DOCUMENT, max_chars=300, overlap_chars=120))
+    section = [p for p in passages if p["heading"] == "Configuration"]
+    merged = merge_passages(section[1:3])
+    assert merged == [DOCUMENT[section[1]["start"]:section[2]["end"]]]
+
+
+def test_merge_keeps_distant_passages_apart():
+    passages = as_dicts(chunk_markdown(DOCUMENT, max_chars=300, overlap_chars=120))
+    first, last = passages[0], passages[-1]
+    # Unordered input is sorted by ordinal
+    assert merge_passages([last, first]) == [first["text"], last["text"]]
+
+
+def test_merge_joins_adjacent_passages_with_a_newline():
+    content = "first paragraph\n\nsecond paragraph\n"
+    passages = [
+        {"ordinal": 0, "start": 0, "end": 15, "text": content[0:15]},
+        {"ordinal": 1, "start": 17, "end": 33, "text": content[17:33]},
+    ]
+    assert merge_passages(passages) == ["first paragraph\nsecond paragraph"]
+    assert merge_passages([]) == []
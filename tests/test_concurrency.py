@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from concurrency import BoundedExecutor, OverloadedError
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+@pytest.fixture
+def pool():
+    pool = BoundedExecutor("test", max_workers=1, max_queued=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_submit_rejects_beyond_the_cap(pool):
+    release = threading.Event()
+    futures = [pool.submit(release.wait, 5) for _ in range(2)]
+    assert not pool.has_capacity()
+    with pytest.raises(OverloadedError):
+        pool.submit(release.wait, 5)
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    deadline = time.monotonic() + 5
+    while pool.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.pending == 0
+
+
+def test_run_returns_the_result(pool):
+    assert asyncio.run(pool.run(lambda a, b=0: a + b, 2, b=3)) == 5
+
+
+def test_iterate_yields_the_generator_items(pool):
+    def numbers(n):
+        yield from range(n)
+
+    async def collect():
+        return [item async for item in pool.iterate(numbers, 5)]
+
+    assert asyncio.run(collect()) == [0, 1, 2, 3, 4]
+
+
+def test_iterate_raises_the_generator_error(pool):
+    def failing():
+        yield 1
+        raise ValueError("broken")
+
+    async def collect():
+        items = []
+        with pytest.raises(ValueError, match="broken"):
+            async for item in pool.iterate(failing):
+                items.append(item)
+        return items
+
+    assert asyncio.run(collect()) == [1]
+
+
+def test_iterate_closes_the_generator_when_the_consumer_stops(pool):
+    closed = threading.Event()
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    async def take_two():
+        items = []
+        events = pool.iterate(endless)
+        async for item in events:
+            items.append(item)
+            if len(items) == 2:
+                break
+        await events.aclose()
+        return items
+
+    assert asyncio.run(take_two()) == [0, 1]
+    assert closed.wait(5)
+
+
+def test_feed_passes_the_items_first_and_the_arguments_after(pool):
+    def consume(items, prefix, suffix=""):
+        return [f"{prefix}{item}{suffix}" for item in items]
+
+    result = asyncio.run(pool.feed(aiter(range(3)), consume, "#", suffix="!"))
+    assert result == ["#0!", "#1!", "#2!"]
+
+
+def test_feed_bounds_the_buffered_items(pool):
+    produced = []
+    buffered = []
+
+    async def produce():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    def consume(items):
+        for item in items:
+            buffered.append(len(produced) - item)
+            time.sleep(0.001)
+        return len(buffered)
+
+    assert asyncio.run(pool.feed(produce(), consume, max_buffered=4)) == 50
+    # The producer never runs more than the buffer (plus the item in hand) ahead
+    assert max(buffered) <= 6
+
+
+def test_feed_stops_reading_when_the_consumer_fails(pool):
+    produced = []
+
+    async def produce():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    def consume(items):
+        next(iter(items))
+        raise RuntimeError("index unavailable")
+
+    with pytest.raises(RuntimeError, match="index unavailable"):
+        asyncio.run(pool.feed(produce(), consume, max_buffered=2))
+    assert len(produced) < 1000
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from content_store import CONTENT_FILE, ContentStore
+
+TEXT = "".join(f"line {i:04d} of the document\n" for i in range(400))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore(str(tmp_path), block_chars=64)
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    first = store.put("notes/a.md", TEXT)
+    second = store.put("notes/b.md", "short")
+    empty = store.put("notes/c.md", "")
+    assert store.get(first) == TEXT
+    assert store.get(second) == "short"
+    assert store.get(empty) == ""
+
+
+@pytest.mark.parametrize("start,end", [(0, 10), (60, 70), (64, 128), (100, 1000), (len(TEXT) - 5, len(TEXT) + 50)])
+def test_slice_matches_the_text(store, start, end):
+    ref = store.put("notes/a.md", TEXT)
+    assert store.slice(ref, start, end) == TEXT[start:end]
+
+
+def test_slices_of_one_record(store):
+    ref = store.put("notes/a.md", TEXT)
+    spans = [(5, 20), (200, 330), (330, 330), (-5, 3), (len(TEXT) - 1, None)]
+    assert store.slices(ref, spans) == [TEXT[5:20], TEXT[200:330], "", TEXT[0:3], TEXT[-1:]]
+
+
+def test_non_ascii_content(store):
+    text = "Überblick: naïve café, 日本語のテキスト. " * 20
+    ref = store.put("notes/ü.md", text)
+    assert store.get(ref) == text
+    assert store.slice(ref, 70, 140) == text[70:140]
+
+
+def test_long_keys(store):
+    ref = store.put("k" * 70000, TEXT)
+    assert store.get(ref) == TEXT
+
+
+def test_remaps_after_the_file_grows(store):
+    first = store.put("notes/a.md", TEXT)
+    assert store.get(first) == TEXT
+    mapped = len(store._map)
+    refs = [store.put(f"notes/{i}.md", TEXT[i:]) for i in range(50)]
+    assert store.get(refs[-1]) == TEXT[49:]
+    assert len(store._map) > mapped
+    assert store.get(first) == TEXT
+
+
+def test_reads_survive_close_and_delete(tmp_path):
+    store = ContentStore(str(tmp_path), block_chars=64)
+    ref = store.put("notes/a.md", TEXT)
+    store.slice(ref, 0, 1)
+    store.close()
+    os.remove(os.path.join(str(tmp_path), CONTENT_FILE))
+    assert store.get(ref) == TEXT
+
+
+def test_read_only_store_reads_records_of_the_writer(tmp_path):
+    writer = ContentStore(str(tmp_path))
+    ref = writer.put("notes/a.md", TEXT)
+    writer.sync()
+    reader = ContentStore(str(tmp_path), read_only=True)
+    assert reader.slice(ref, 10, 40) == TEXT[10:40]
+    # Records appended later are found by remapping
+    later = writer.put("notes/b.md", "later")
+    assert reader.get(later) == "later"
+    writer.close()
+
+
+def test_reference_beyond_the_file(store):
+    store.put("notes/a.md", TEXT)
+    with pytest.raises(ValueError):
+        store.get(store.size_bytes() + 100)
@@ -0,0 +1,138 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import ingest_queue
+from ingest_queue import CHECKPOINT_FILE, IngestQueue
+from models import DocumentInput
+
+
+class FakeRag:
+    """Records indexed batches; fails the next `failures` calls, or every call when negative."""
+
+    def __init__(self, failures: int = 0, failed_ids=()):
+        self.failures = failures
+        self.failed_ids = set(failed_ids)
+        self.batches = []
+
+    def index_documents(self, documents):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("index unavailable")
+        self.batches.append([d.id for d in documents])
+        return SimpleNamespace(items=[
+            SimpleNamespace(status="failed" if d.id in self.failed_ids else "indexed",
+                            error="bad document" if d.id in self.failed_ids else None)
+            for d in documents
+        ])
+
+
+@pytest.fixture(autouse=True)
+def no_jvm(monkeypatch):
+    # The worker only needs the JVM for the real index
+    monkeypatch.setattr(ingest_queue, "attach_jvm", lambda: None)
+
+
+def document(i: int) -> DocumentInput:
+    return DocumentInput(id=f"doc{i}.md", content=f"Document {i}", folder_path="notes")
+
+
+def open_queue(wal_dir, rag=None, **kwargs) -> IngestQueue:
+    kwargs.setdefault("commit_interval", 0.01)
+    return IngestQueue(rag or FakeRag(), str(wal_dir), **kwargs)
+
+
+def test_replays_entries_after_the_checkpoint(tmp_path):
+    queue = open_queue(tmp_path)
+    tickets = [queue.submit(document(i)) for i in range(3)]
+    queue.stop()
+
+    reopened = open_queue(tmp_path)
+    assert reopened.last_seq == 3
+    assert reopened.status().pending == 3
+    assert [reopened.ticket(t.ticket).state for t in tickets] == ["queued"] * 3
+    reopened.stop()
+
+
+def test_checkpoint_skips_indexed_entries_on_restart(tmp_path):
+    rag = FakeRag()
+    queue = open_queue(tmp_path, rag).start()
+    tickets = [queue.submit(document(i)) for i in range(4)]
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert sorted(id for batch in rag.batches for id in batch) == sorted(d.id for d in map(document, range(4)))
+    assert all(queue.ticket(t.ticket).state == "searchable" for t in tickets)
+    with open(tmp_path / CHECKPOINT_FILE) as f:
+        assert int(f.read()) == 4
+
+    reopened = open_queue(tmp_path)
+    assert reopened.status().pending == 0
+    assert reopened.last_seq == 4
+    reopened.stop()
+
+
+def test_checkpointed_segments_are_removed(tmp_path):
+    queue = open_queue(tmp_path, segment_bytes=1).start()
+    for i in range(5):
+        queue.submit(document(i))
+    assert queue.flush(timeout=5)
+    queue.stop()
+    # Only the segment still open for appends is kept
+    assert queue.status().segments == 1
+
+
+def test_torn_first_entry_of_a_segment_is_truncated(tmp_path):
+    queue = open_queue(tmp_path, segment_bytes=1)
+    queue.submit(document(0))
+    queue.stop()
+    # A crash while writing the first entry of the next segment
+    torn_path = os.path.join(tmp_path, "wal-2.log")
+    with open(torn_path, "w") as f:
+        f.write('{"seq": 2, "ticket": "abc", "queu')
+
+    reopened = open_queue(tmp_path)
+    assert reopened.last_seq == 1
+    assert os.path.getsize(torn_path) == 0
+    ticket = reopened.submit(document(1))
+    reopened.stop()
+
+    # The entry appended after the torn one is acknowledged, so it must survive
+    replayed = open_queue(tmp_path)
+    assert replayed.last_seq == 2
+    assert replayed.status().pending == 2
+    assert replayed.ticket(ticket.ticket).state == "queued"
+    replayed.stop()
+
+
+def test_failed_items_fail_their_tickets(tmp_path):
+    queue = open_queue(tmp_path, FakeRag(failed_ids={"doc1.md"})).start()
+    good, bad = queue.submit(document(0)), queue.submit(document(1))
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert queue.ticket(good.ticket).state == "searchable"
+    assert queue.ticket(bad.ticket).state == "failed"
+    assert queue.ticket(bad.ticket).error == "bad document"
+
+
+def test_transient_errors_are_retried(tmp_path):
+    rag = FakeRag(failures=2)
+    queue = open_queue(tmp_path, rag, max_attempts=5).start()
+    ticket = queue.submit(document(0))
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert rag.batches == [["doc0.md"]]
+    assert queue.ticket(ticket.ticket).state == "searchable"
+
+
+def test_batches_that_keep_failing_are_given_up(tmp_path):
+    rag = FakeRag(failures=-1)
+    queue = open_queue(tmp_path, rag, max_attempts=3).start()
+    tickets = [queue.submit(document(i)) for i in range(2)]
+    # The queue drains instead of blocking writes that flush it
+    assert queue.flush(timeout=5)
+    queue.stop()
+    for ticket in tickets:
+        assert queue.ticket(ticket.ticket).state == "failed"
+        assert queue.ticket(ticket.ticket).error == "index unavailable"
+    assert queue.checkpoint == 2
@@ -0,0 +1,93 @@
+import socket
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllama
+from llm_gateway import CircuitBreaker, LLMRequestError, LLMUnavailableError, OllamaGateway
+
+
+@pytest.fixture
+def ollama():
+    server = FakeOllama(latency=0.0, tokens_per_sec=0, num_tokens=5).start()
+    yield server
+    server.stop()
+
+
+def gateway(base_url: str, **kwargs) -> OllamaGateway:
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    return OllamaGateway(base_url=base_url, model="fake", backoff=0.0, read_timeout=5.0, **kwargs)
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_streams_answer_chunks(ollama):
+    llm = gateway(ollama.base_url)
+    chunks = list(llm.stream("question"))
+    assert len(chunks) == 5
+    assert len(llm.invoke("question").split()) == 5
+    assert llm.ready
+    assert llm.breaker.state == "closed"
+
+
+def test_client_error_is_not_retried_or_counted(ollama):
+    ollama.status = 404
+    llm = gateway(ollama.base_url)
+    for _ in range(3):
+        with pytest.raises(LLMRequestError, match="fake error 404"):
+            llm.invoke("question")
+    assert ollama.requests == 3
+    assert llm.breaker.failures == 0
+    assert llm.available()
+
+
+def test_server_errors_open_the_breaker(ollama):
+    ollama.status = 500
+    llm = gateway(ollama.base_url)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            llm.invoke("question")
+    assert llm.breaker.state == "open"
+    assert not llm.available()
+
+    # Fails fast without contacting Ollama
+    with pytest.raises(LLMUnavailableError, match="retry in"):
+        llm.invoke("question")
+    assert ollama.requests == 2
+
+
+def test_connection_errors_are_retried_with_backoff():
+    breaker = CircuitBreaker(failure_threshold=10)
+    llm = gateway(f"http://127.0.0.1:{unused_port()}", max_retries=2, breaker=breaker)
+    with pytest.raises(LLMUnavailableError, match="request failed"):
+        llm.invoke("question")
+    assert breaker.failures == 3
+    assert not llm.ready
+
+
+def test_half_open_trial_closes_the_circuit(ollama):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    llm = gateway(ollama.base_url, breaker=breaker)
+    ollama.status = 503
+    with pytest.raises(LLMUnavailableError):
+        llm.invoke("question")
+    assert breaker.state == "half_open"
+
+    ollama.status = 200
+    assert llm.invoke("question")
+    assert breaker.state == "closed"
+
+
+def test_breaker_lets_one_trial_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.retry_after() == 0.0
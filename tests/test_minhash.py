@@ -0,0 +1,60 @@
+import pytest
+
+import minhash
+
+BASE = " ".join(f"term{i}" for i in range(200))
+
+
+def candidate(name: str, score: float, text: str = None) -> dict:
+    return {"name": name, "score": score, "sketch": minhash.sketch(text) if text is not None else None}
+
+
+def names(candidates) -> list:
+    return [c["name"] for c in candidates]
+
+
+def test_sketch_is_bounded_and_sorted():
+    sketch = minhash.sketch(BASE)
+    assert len(sketch) == minhash.SKETCH_SIZE
+    assert sketch == sorted(sketch)
+    assert minhash.sketch("two words") == sorted(minhash.sketch("words two"))
+
+
+def test_similarity_estimates_jaccard():
+    assert minhash.similarity(minhash.sketch(BASE), minhash.sketch(BASE)) == 1.0
+    unrelated = " ".join(f"other{i}" for i in range(200))
+    assert minhash.similarity(minhash.sketch(BASE), minhash.sketch(unrelated)) == 0.0
+    half = " ".join(f"term{i}" for i in range(100)) + " " + " ".join(f"other{i}" for i in range(100))
+    assert 0.2 < minhash.similarity(minhash.sketch(BASE), minhash.sketch(half)) < 0.5
+    assert minhash.similarity(None, minhash.sketch(BASE)) == 0.0
+
+
+def test_encode_round_trip():
+    sketch = minhash.sketch(BASE)
+    assert minhash.decode(minhash.encode(sketch)) == sketch
+
+
+def test_mmr_skips_near_duplicates():
+    candidates = [
+        candidate("original", 10.0, BASE),
+        candidate("copy", 9.9, BASE + " term0"),
+        candidate("different", 8.0, " ".join(f"other{i}" for i in range(200))),
+    ]
+    assert names(minhash.select_diverse(candidates, 2, mmr_lambda=0.5)) == ["original", "different"]
+
+
+def test_lambda_one_ranks_by_relevance():
+    candidates = [candidate("original", 10.0, BASE), candidate("copy", 9.9, BASE), candidate("other", 1.0, "x y z")]
+    assert names(minhash.select_diverse(candidates, 2, mmr_lambda=1.0)) == ["original", "copy"]
+
+
+@pytest.mark.parametrize("mmr_lambda", [0.0, 0.7])
+def test_missing_sketches_count_as_dissimilar(mmr_lambda):
+    candidates = [candidate("a", 3.0), candidate("b", 2.0), candidate("c", 1.0)]
+    assert names(minhash.select_diverse(candidates, 2, mmr_lambda)) == ["a", "b"]
+
+
+def test_fewer_candidates_than_requested():
+    candidates = [candidate("a", 3.0, BASE)]
+    assert minhash.select_diverse(candidates, 5, 0.5) == candidates
+    assert minhash.select_diverse([], 3, 0.5) == []
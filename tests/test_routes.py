@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import routes
+from concurrency import BoundedExecutor
+from models import BulkIndexOutput, BulkItemStatus
+
+
+class FakeRag:
+    """Indexes nothing, but reports every document the way LuceneRAG.index_documents does."""
+
+    def __init__(self):
+        self.write_pool = BoundedExecutor("lucene-write", 1, 4)
+        self.calls = []
+
+    def index_documents(self, documents, commit_docs=None, commit_bytes=None):
+        items = []
+        for position, document in enumerate(documents):
+            if isinstance(document, Exception):
+                items.append(BulkItemStatus(index=position, status="failed", error=str(document)))
+            else:
+                items.append(BulkItemStatus(index=position, id=document.id, folder_path=document.folder_path,
+                                            status="indexed"))
+        self.calls.append((len(items), commit_docs, commit_bytes))
+        indexed = sum(1 for item in items if item.status == "indexed")
+        return BulkIndexOutput(items=items, indexed=indexed, unchanged=0, failed=len(items) - indexed,
+                               commits=1, elapsed_seconds=0.0, docs_per_sec=0.0)
+
+
+class Client:
+    """Sends requests straight to the ASGI app; the event loop runs per request."""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        async def send():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await http.post(url, **kwargs)
+
+        return asyncio.run(send())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    rag = FakeRag()
+    monkeypatch.setattr(routes, "rag", rag)
+    monkeypatch.setattr(routes, "ingest", SimpleNamespace(flush=lambda timeout=None: True))
+    app = FastAPI()
+    app.include_router(routes.router)
+    yield Client(app), rag
+    rag.write_pool.shutdown()
+
+
+def test_bulk_ndjson_body_is_indexed(client):
+    http, rag = client
+    body = "\n".join([
+        '{"id": "a.md", "content": "first", "folder_path": "notes"}',
+        "",
+        "not json",
+        '{"id": "b.md", "content": "second"}',
+    ])
+    response = http.post("/documents/bulk?commit_docs=10", content=body,
+                         headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["indexed"], result["failed"]) == (2, 1)
+    assert [item["id"] for item in result["items"]] == ["a.md", None, "b.md"]
+    assert rag.calls == [(3, 10, None)]
+
+
+def test_bulk_json_array_is_indexed(client):
+    http, rag = client
+    response = http.post("/documents/bulk", json=[{"id": "a.md", "content": "first"}])
+    assert response.status_code == 200, response.text
+    assert response.json()["indexed"] == 1
+
+
+def test_bulk_rejects_a_json_object(client):
+    http, _ = client
+    response = http.post("/documents/bulk", json={"id": "a.md", "content": "first"})
+    assert response.status_code == 400
+
+
+def test_bulk_waits_for_the_ingest_queue_outside_the_write_pool(client, monkeypatch):
+    http, rag = client
+    flushed_on = []
+
+    def flush(timeout=None):
+        flushed_on.append(threading.current_thread().name)
+        return True
+
+    monkeypatch.setattr(routes, "ingest", SimpleNamespace(flush=flush))
+    response = http.post("/documents/bulk", content='{"id": "a.md", "content": "first"}\n',
+                         headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    assert len(flushed_on) == 1
+    assert not flushed_on[0].startswith(rag.write_pool.name)
+
+
+def test_bulk_is_rejected_while_the_ingest_queue_drains(client, monkeypatch):
+    http, rag = client
+    monkeypatch.setattr(routes, "ingest", SimpleNamespace(flush=lambda timeout=None: False))
+    response = http.post("/documents/bulk", json=[{"id": "a.md", "content": "first"}])
+    assert response.status_code == 429
+    assert rag.calls == []
@@ -0,0 +1,67 @@
+import logging
+from typing import Optional
+
+import requests
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# POST routes that only read the index and are served locally. Settings changes go to
+# the writer, which publishes them to every reader (see LuceneRAG._publish_settings).
+LOCAL_POSTS = {"/query", "/query/stream", "/search/explain"}
+# DELETE routes for per-process state, served locally
+LOCAL_DELETES = ("/sessions/",)
+# GET routes whose state lives in the writer process
+WRITER_GETS = ("/ingest/", "/reindex/status")
+# Response headers passed back to the client unchanged
+FORWARDED_HEADERS = ("content-type", "retry-after", "location")
+
+
+class WriterProxy:
+    """Forwards index mutations from a read-only worker to the writer process.
+
+    The worker answers searches and queries itself; uploads, deletes, moves,
+    syncs and reindexing, plus ingest and reindex status, are relayed to
+    `writer_url` with their body and query string.
+    """
+
+    def __init__(self, writer_url: str, timeout: float = 120.0, pool_size: int = 16):
+        self.writer_url = writer_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+
+    @staticmethod
+    def forwards(method: str, path: str) -> bool:
+        if method == "GET":
+            return path.startswith(WRITER_GETS)
+        if method == "DELETE" and path.startswith(LOCAL_DELETES):
+            return False
+        return method in ("POST", "PUT", "DELETE") and path not in LOCAL_POSTS
+
+    async def forward(self, request: Request, request_id: Optional[str] = None) -> Response:
+        body = await request.body()
+        headers = {"content-type": request.headers.get("content-type", "application/json")}
+        if request_id:
+            headers["x-request-id"] = request_id
+        url = f"{self.writer_url}{request.url.path}"
+        try:
+            upstream = await run_in_threadpool(
+                self.session.request, request.method, url, params=list(request.query_params.multi_items()),
+                data=body, headers=headers, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.error("Error forwarding %s %s to the writer: %s", request.method, request.url.path, e)
+            return Response(status_code=503, content=b'{"detail": "Writer process is unavailable"}',
+                            media_type="application/json", headers={"Retry-After": "1"})
+        return Response(
+            status_code=upstream.status_code,
+            content=upstream.content,
+            headers={name: upstream.headers[name] for name in FORWARDED_HEADERS if name in upstream.headers}
+        )
+
+    def close(self):
+        self.session.close()